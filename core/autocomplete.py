@@ -0,0 +1,95 @@
+# core/autocomplete.py
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import Collate, Lower
+from taggit.models import Tag
+
+from tentron.caches import fragment_cache
+
+TAG_AUTOCOMPLETE_LIMIT = 10
+# most used tags of a site kept in the cache, sites with fewer tags than this
+# are answered from the cache alone
+TAG_AUTOCOMPLETE_CACHED_TAGS = getattr(settings, "TAG_AUTOCOMPLETE_CACHED_TAGS", 200)
+TAG_AUTOCOMPLETE_CACHE_TIMEOUT = getattr(settings, "TAG_AUTOCOMPLETE_CACHE_TIMEOUT", 60)
+
+
+def get_site_tags(tag_model, site):
+    """
+    Return the tags of tag_model visible on a site, with the name of the
+    relation counting their uses. site None means every site.
+    """
+    if tag_model is Tag:
+        # product tags are shared taggit tags, scoped by the tagged products
+        tags = Tag.objects.all()
+        if site is not None:
+            tags = tags.filter(core_producttag_items__content_object__site=site)
+        return tags, "core_producttag_items"
+
+    tags = tag_model.objects.all()
+    field_names = {field.name for field in tag_model._meta.get_fields()}
+    if site is not None:
+        if "site" not in field_names:
+            return tag_model.objects.none(), None
+        tags = tags.filter(site=site)
+    return tags, "tagged_blogs" if "tagged_blogs" in field_names else None
+
+
+def get_tag_autocomplete_cache_key(tag_model, site):
+    return "tagautocomplete:{}:{}".format(
+        tag_model._meta.label_lower, site.id if site else "all"
+    )
+
+
+def get_popular_tag_names(tag_model, site):
+    """
+    Return (names, complete): the most used tag names of a site, and whether
+    they are all of its tags.
+    """
+    cache_key = get_tag_autocomplete_cache_key(tag_model, site)
+    cached = fragment_cache.get(cache_key)
+    if cached is None:
+        tags, usage_relation = get_site_tags(tag_model, site)
+        if usage_relation:
+            tags = tags.annotate(num_times=Count(usage_relation)).order_by(
+                "-num_times", "name"
+            )
+        else:
+            tags = tags.order_by("name")
+        names = list(
+            tags.values_list("name", flat=True)[: TAG_AUTOCOMPLETE_CACHED_TAGS + 1]
+        )
+        cached = (
+            names[:TAG_AUTOCOMPLETE_CACHED_TAGS],
+            len(names) <= TAG_AUTOCOMPLETE_CACHED_TAGS,
+        )
+        fragment_cache.set(cache_key, cached, TAG_AUTOCOMPLETE_CACHE_TIMEOUT)
+    return cached
+
+
+def get_tag_completions(tag_model, site, term, limit=TAG_AUTOCOMPLETE_LIMIT):
+    """
+    Return up to limit tag names of a site starting with term, ignoring case.
+    Popular tags come from the cache, the rest from the (site, lower(name))
+    index.
+    """
+    prefix = term.strip().lower()
+    if not prefix:
+        return []
+
+    names, complete = get_popular_tag_names(tag_model, site)
+    matches = sorted(
+        {name for name in names if name.lower().startswith(prefix)}, key=str.lower
+    )
+    if complete or len(matches) >= limit:
+        return matches[:limit]
+
+    tags, _ = get_site_tags(tag_model, site)
+    tags = (
+        tags.annotate(lower_name=Collate(Lower("name"), "C"))
+        .filter(lower_name__startswith=prefix)
+        .order_by("lower_name")
+        .values_list("name", flat=True)
+        # the product tags join through the tagged items
+        .distinct()
+    )
+    return list(tags[:limit])
@@ -14,11 +14,10 @@ from wagtail.contrib.table_block.blocks import TableBlock
 from wagtail.contrib.typed_table_block.blocks import TypedTableBlock
 from wagtail.documents.blocks import DocumentChooserBlock
 from wagtail.images.blocks import ImageChooserBlock
-from wagtail.models import Site
 from wagtail.snippets.blocks import SnippetChooserBlock
 from wagtailmodelchooser.blocks import ModelChooserBlock
 
-from organization.models import SiteSettings
+from organization.tenant import get_tenant
 
 
 class LinkStructValue(StructValue):
@@ -34,9 +33,7 @@ class LinkStructValue(StructValue):
 class BlockTempateMixin:
     def get_template(self, context=None):
         if context is not None and "request" in context:
-            current_site = Site.find_for_request(context["request"])
-            site_settings = SiteSettings.for_site(current_site)
-            template_folder = site_settings.site_settings_theme.first().template_folder
+            template_folder = get_tenant(context["request"]).template_folder
             template_name = f"{template_folder}/{getattr(self.meta, 'template', None)}"
         else:
             # Use the default template if context is None or doesn't contain 'request'
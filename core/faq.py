@@ -0,0 +1,66 @@
+# core/faq.py
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+
+from tentron.caches import fragment_cache
+
+logger = logging.getLogger("tentron")
+
+FAQ_CACHE_TIMEOUT = getattr(settings, "FAQ_CACHE_TIMEOUT", 60 * 60)
+
+
+def get_faq_cache_key(site_id):
+    return "faq:{}".format(site_id)
+
+
+def invalidate_faq(site_id):
+    if site_id is not None:
+        fragment_cache.delete(get_faq_cache_key(site_id))
+
+
+def build_faq(site):
+    from .models import FaqCategory, FaqCategoryFaqItem, FaqItem
+
+    faq_categories = list(FaqCategory.objects.filter(site=site))
+    faq_items = list(FaqItem.objects.filter(published=True, site=site).order_by("pk"))
+
+    # group in python from the link rows, instead of one query per category
+    items_by_id = {faq_item.id: faq_item for faq_item in faq_items}
+    faq_items_dict = defaultdict(list)
+    links = FaqCategoryFaqItem.objects.filter(faq_item_id__in=items_by_id).order_by(
+        "faq_item_id"
+    )
+    for faq_category_id, faq_item_id in links.values_list(
+        "faq_category_id", "faq_item_id"
+    ):
+        faq_items_dict[faq_category_id].append(items_by_id[faq_item_id])
+
+    half_items = len(faq_items) // 2
+    return {
+        "faq_categories": faq_categories,
+        "faq_items": faq_items,
+        "faq_items_first_half": faq_items[:half_items],
+        "faq_items_second_half": faq_items[half_items:],
+        "half_items": half_items,
+        "faq_items_dict": {
+            category.id: faq_items_dict.get(category.id, [])
+            for category in faq_categories
+        },
+    }
+
+
+def get_faq(site):
+    """
+    Return the FAQ categories and published items of a site grouped by
+    category, loaded in three queries whatever the number of categories and
+    shared until a category, item or link changes.
+    """
+    cache_key = get_faq_cache_key(site.id)
+    faq = fragment_cache.get(cache_key)
+    if faq is None:
+        logger.debug("FAQ cache miss for site %s", site.id)
+        faq = build_faq(site)
+        fragment_cache.set(cache_key, faq, FAQ_CACHE_TIMEOUT)
+    return faq
@@ -0,0 +1,18 @@
+# core/listing.py
+from collections import defaultdict
+
+
+def prefetch_for_listing(pages):
+    """
+    Run the listing prefetches of each page type once for a whole page of
+    results, instead of letting the template query per item. Returns a list,
+    suitable to replace the object_list of a paginator page.
+    """
+    pages = list(pages)
+    pages_by_class = defaultdict(list)
+    for page in pages:
+        pages_by_class[type(page)].append(page)
+    for page_class, class_pages in pages_by_class.items():
+        if hasattr(page_class, "prefetch_for_listing"):
+            page_class.prefetch_for_listing(class_pages)
+    return pages
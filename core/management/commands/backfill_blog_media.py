@@ -0,0 +1,44 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from core.models import BlogDetailPage
+
+logger = logging.getLogger("tentron")
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the cover image, audio document and video url columns of blog "
+        "posts from their content, for all sites"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--site", type=int, help="Only backfill the posts of this site id"
+        )
+
+    def handle(self, *args, **options):
+        queryset = BlogDetailPage.objects.order_by("pk")
+        if options["site"]:
+            queryset = queryset.filter(site_id=options["site"])
+
+        updated_count = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[: options["batch_size"]])
+            if not batch:
+                break
+            BlogDetailPage.denormalize_media(batch)
+            BlogDetailPage.objects.bulk_update(batch, BlogDetailPage.media_fields)
+            updated_count += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write("{} blog posts updated".format(updated_count))
+
+        logger.info("Blog media backfill done, {} posts updated".format(updated_count))
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Blog media backfill done. {} posts updated.".format(updated_count)
+            )
+        )
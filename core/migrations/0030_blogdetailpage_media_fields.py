@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wagtailimages", "0025_alter_image_file_alter_rendition_file"),
+        ("core", "0029_alter_productpage_content"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blogdetailpage",
+            name="audio_url",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=500
+            ),
+        ),
+        migrations.AddField(
+            model_name="blogdetailpage",
+            name="content_cover_image",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="wagtailimages.image",
+            ),
+        ),
+        migrations.AddField(
+            model_name="blogdetailpage",
+            name="video_url",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=500
+            ),
+        ),
+    ]
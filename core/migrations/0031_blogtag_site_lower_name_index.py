@@ -0,0 +1,31 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:33
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0030_blogdetailpage_media_fields"),
+        ("taggit", "0005_auto_20220424_2025"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="blogtag",
+            index=models.Index(
+                models.F("site"),
+                django.db.models.functions.comparison.Collate(
+                    django.db.models.functions.text.Lower("name"), "C"
+                ),
+                name="core_blogtag_site_lname_idx",
+            ),
+        ),
+        # product tags are taggit tags, shared by every site
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS core_taggit_tag_lname_idx "
+            'ON taggit_tag ((LOWER(name) COLLATE "C"))',
+            "DROP INDEX IF EXISTS core_taggit_tag_lname_idx",
+        ),
+    ]
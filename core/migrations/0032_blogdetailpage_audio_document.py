@@ -0,0 +1,30 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wagtaildocs", "0012_uploadeddocument"),
+        ("core", "0031_blogtag_site_lower_name_index"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="blogdetailpage",
+            name="audio_url",
+        ),
+        migrations.AddField(
+            model_name="blogdetailpage",
+            name="audio_document",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="wagtaildocs.document",
+            ),
+        ),
+    ]
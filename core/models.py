@@ -9,7 +9,8 @@ from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.mail import EmailMultiAlternatives, send_mail
 from django.core.paginator import Paginator
 from django.db import models
-from django.db.models import Max
+from django.db.models import Max, prefetch_related_objects
+from django.db.models.functions import Collate, Lower
 from django.http import Http404, HttpResponseNotFound
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
@@ -29,8 +30,10 @@ from wagtail.contrib.forms.models import (
     AbstractEmailForm,
     AbstractFormField,
 )
+from wagtail.documents import get_document_model
 from wagtail.embeds.blocks import EmbedBlock
 from wagtail.fields import RichTextField, StreamField
+from wagtail.images import get_image_model
 from wagtail.images.blocks import ImageChooserBlock
 from wagtail.models import Orderable, Page, Site
 from wagtail.search import index
@@ -48,6 +51,9 @@ from organization.models import (
 )
 
 from . import blocks as tentron_blocks
+from .faq import get_faq
+from .listing import prefetch_for_listing
+from .sidebar import get_adjacent_posts, get_blog_sidebar
 
 logger = logging.getLogger("tentron")
 # About
@@ -71,6 +77,10 @@ class AboutPage(BasePage):
         use_json_field=True,
     )
 
+    search_fields = BasePage.search_fields + [
+        index.SearchField("content"),
+    ]
+
     content_panels = BasePage.content_panels + [
         FieldPanel("content"),
     ]
@@ -172,6 +182,15 @@ class BlogTag(TagBase):
 
     class Meta:
         unique_together = ("name", "slug", "site")
+        indexes = [
+            # prefix lookups of the tag autocomplete, see core/autocomplete.py,
+            # LIKE 'prefix%' can only use a btree index in the C collation
+            models.Index(
+                models.F("site"),
+                Collate(Lower("name"), "C"),
+                name="core_blogtag_site_lname_idx",
+            ),
+        ]
         verbose_name = _("Blog Tag")
         verbose_name_plural = _("Blog Tags")
 
@@ -234,6 +253,27 @@ class BlogDetailPage(BasePage):
         use_json_field=True,
     )
     excerpt = models.CharField(max_length=200, blank=True, editable=False)
+    # denormalized from content on save, listings never decode the stream
+    content_cover_image = models.ForeignKey(
+        "wagtailimages.Image",
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    # the url is built when rendering, it holds the file name of the document
+    audio_document = models.ForeignKey(
+        "wagtaildocs.Document",
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    video_url = models.CharField(
+        max_length=500, blank=True, editable=False, db_index=True
+    )
 
     cover_image = models.ForeignKey(
         "wagtailimages.Image",
@@ -249,6 +289,20 @@ class BlogDetailPage(BasePage):
         blank=True,
     )
 
+    listing_prefetch_related = [
+        "cover_image__renditions",
+        "content_cover_image__renditions",
+        "audio_document",
+    ]
+    media_fields = ["content_cover_image", "audio_document", "video_url"]
+
+    search_fields = BasePage.search_fields + [
+        index.SearchField("excerpt"),
+        index.SearchField("content"),
+        index.RelatedFields("tags", [index.SearchField("name")]),
+        index.FilterField("blog_type"),
+    ]
+
     content_panels = BasePage.content_panels + [
         FieldPanel("blog_type"),
         FieldPanel("cover_image"),
@@ -260,40 +314,8 @@ class BlogDetailPage(BasePage):
     def get_context(self, request, *args, **kwargs):
         context = super().get_context(request, *args, **kwargs)
         site = context["tentron_current_site"]
-        pre_post = (
-            BlogDetailPage.objects.live()
-            .filter(site=site)
-            .filter(live=True)
-            .filter(first_published_at__lt=self.first_published_at)
-            .order_by("-first_published_at")
-            .first()
-        )
-        next_post = (
-            BlogDetailPage.objects.live()
-            .filter(site=site)
-            .filter(live=True)
-            .filter(first_published_at__gt=self.first_published_at)
-            .order_by("first_published_at")
-            .first()
-        )
-        context["pre_post"] = pre_post
-        context["next_post"] = next_post
-        context["blog_list_page"] = (
-            BlogListPage.objects.live().filter(site=site).first()
-        )
-        context["categories"] = BlogCategory.objects.filter(site=site).all()
-        context["recent_posts"] = (
-            BlogDetailPage.objects.live()
-            .filter(site=site)
-            .filter(live=True)
-            .order_by("-first_published_at")[:3]
-        )
-        # Top 10 tags
-        context["top_tags"] = (
-            BlogTag.objects.filter(site=site)
-            .annotate(num_times=models.Count("tagged_blogs"))
-            .order_by("-num_times")[:10]
-        )
+        context["pre_post"], context["next_post"] = get_adjacent_posts(self, site)
+        context.update(get_blog_sidebar(site))
 
         return context
 
@@ -316,32 +338,59 @@ class BlogDetailPage(BasePage):
         # Return the first `length` characters of the text
         return text[:length]
 
-    def get_cover(self):
-        if self.cover_image:
-            return self.cover_image
-        for block in self.content:
-            if block.block_type == "image_content_block":
-                return block.value["image"]
-            elif block.block_type == "image_block":
-                return block.value["image"]
+    def get_first_raw_block_value(self, *block_types):
+        # read the raw json, decoding the stream would fetch every chosen object
+        for block in self.content.raw_data:
+            if block["type"] in block_types:
+                return block["value"]
         return None
 
+    def get_content_image_id(self):
+        value = self.get_first_raw_block_value("image_content_block", "image_block")
+        return value.get("image") if value else None
+
+    def get_audio_document_id(self):
+        value = self.get_first_raw_block_value("audio")
+        return value.get("file") if value else None
+
+    def get_cover(self):
+        return self.cover_image or self.content_cover_image
+
     def get_audio_url(self):
-        if self.blog_type == "audio":
-            for block in self.content:
-                if block.block_type == "audio":
-                    return block.value["file"].url
+        if self.blog_type == "audio" and self.audio_document:
+            return self.audio_document.url
         return None
 
     def get_video_url(self):
         if self.blog_type == "video":
-            for block in self.content:
-                if block.block_type == "video":
-                    return block.value.url
+            return self.video_url or None
         return None
 
+    @classmethod
+    def denormalize_media(cls, pages):
+        """
+        Set the media_fields of pages from their content, with one query for
+        the images and one for the documents of all of them.
+        """
+        image_ids = [page.get_content_image_id() for page in pages]
+        images = get_image_model().objects.in_bulk([pk for pk in image_ids if pk])
+        document_ids = [page.get_audio_document_id() for page in pages]
+        documents = get_document_model().objects.in_bulk(
+            [pk for pk in document_ids if pk]
+        )
+
+        for page, image_id, document_id in zip(pages, image_ids, document_ids):
+            page.content_cover_image = images.get(image_id)
+            page.audio_document = documents.get(document_id)
+            page.video_url = page.get_first_raw_block_value("video") or ""
+
+    @classmethod
+    def prefetch_for_listing(cls, pages):
+        prefetch_related_objects(pages, *cls.listing_prefetch_related)
+
     def save(self, *args, **kwargs):
         self.excerpt = self.get_content_excerpt()
+        self.denormalize_media([self])
         super().save(*args, **kwargs)
         # update the site field for each tag.
         # update the site field for each tag.
@@ -358,6 +407,7 @@ class BlogDetailPage(BasePage):
 class BlogListPage(BasePage):
     max_count_per_site = 1
     template = "blog.html"
+    per_page = 2
     subpage_types = ["core.BlogDetailPage"]
     content = StreamField(
         [
@@ -395,27 +445,13 @@ class BlogListPage(BasePage):
         # Filter blog posts by tag if the tag parameter is provided
         if tag:
             blog_posts = blog_posts.filter(tags__slug=tag)
-        paginator = Paginator(blog_posts, 2)
+        paginator = Paginator(blog_posts, self.per_page)
 
         page_number = request.GET.get("page")
         page_obj = paginator.get_page(page_number)
+        page_obj.object_list = prefetch_for_listing(page_obj.object_list)
         context["page_obj"] = page_obj
-        context["categories"] = BlogCategory.objects.filter(site=site).all()
-        context["recent_posts"] = (
-            BlogDetailPage.objects.live()
-            .filter(site=site)
-            .filter(live=True)
-            .order_by("-first_published_at")[:3]
-        )
-        # Top 10 tags
-        context["top_tags"] = (
-            BlogTag.objects.filter(site=site)
-            .annotate(num_times=models.Count("tagged_blogs"))
-            .order_by("-num_times")[:10]
-        )
-        context["blog_list_page"] = (
-            BlogListPage.objects.live().filter(site=site).first()
-        )
+        context.update(get_blog_sidebar(site))
 
         return context
 
@@ -451,6 +487,12 @@ class ContactPage(BasePage, AbstractEmailForm):
         use_json_field=True,
     )
 
+    search_fields = BasePage.search_fields + [
+        index.SearchField("sub_title"),
+        index.SearchField("intro"),
+        index.SearchField("content"),
+    ]
+
     content_panels = AbstractEmailForm.content_panels + [
         FieldPanel("breadcrumb_background"),
         FieldPanel("sub_title"),
@@ -552,11 +594,20 @@ class FaqCategoryFaqItem(BaseModel):
     #     unique_together = ("faq_item", "faq_category")
 
 
-class FaqItem(ClusterableModel, BaseModel):
+class FaqItem(index.Indexed, ClusterableModel, BaseModel):
     question = models.CharField(max_length=255)
     answer = RichTextField()
     published = models.BooleanField(default=True)
 
+    search_fields = [
+        index.SearchField("question", boost=2),
+        index.AutocompleteField("question"),
+        index.SearchField("answer"),
+        index.FilterField("site"),
+        index.FilterField("published"),
+        index.FilterField("deleted_at"),
+    ]
+
     panels = [
         FieldPanel("question"),
         FieldPanel("answer"),
@@ -623,27 +674,7 @@ class FaqPage(BasePage):
 
     def get_context(self, request, *args, **kwargs):
         context = super().get_context(request, *args, **kwargs)
-        site = context["tentron_current_site"]
-        # filter empty categories
-
-        faq_categories = FaqCategory.objects.filter(site=site)
-        context["faq_categories"] = faq_categories
-        faq_items = FaqItem.objects.filter(published=True, site=site)
-        print(faq_items)
-        context["faq_items"] = faq_items
-        total_items = faq_items.count()
-        half_items = total_items // 2
-        context["faq_items_first_half"] = faq_items[:half_items]
-        context["faq_items_second_half"] = faq_items[half_items:]
-        context["half_items"] = half_items
-
-        faq_items_dict = {}
-        for category in faq_categories:
-            c_faq_items = FaqItem.objects.filter(
-                published=True, site=site, faq_categories__faq_category=category
-            )
-            faq_items_dict[category.id] = c_faq_items
-        context["faq_items_dict"] = faq_items_dict
+        context.update(get_faq(context["tentron_current_site"]))
 
         return context
 
@@ -667,6 +698,10 @@ class ProjectDetailPage(BasePage):
         use_json_field=True,
     )
 
+    search_fields = BasePage.search_fields + [
+        index.SearchField("content"),
+    ]
+
     content_panels = BasePage.content_panels + [
         FieldPanel("content", classname="full"),
     ]
@@ -727,6 +762,10 @@ class ServiceDetailPage(BasePage):
         use_json_field=True,
     )
 
+    search_fields = BasePage.search_fields + [
+        index.SearchField("content"),
+    ]
+
     content_panels = BasePage.content_panels + [
         FieldPanel("content", classname="full"),
     ]
@@ -843,6 +882,12 @@ class TeamDetailPage(BasePage):
         use_json_field=True,
     )
 
+    search_fields = BasePage.search_fields + [
+        index.SearchField("name"),
+        index.SearchField("designation"),
+        index.SearchField("content"),
+    ]
+
     content_panels = BasePage.content_panels + [
         FieldPanel("name"),
         FieldPanel("designation"),
@@ -1065,11 +1110,12 @@ class AttributeValue(BaseModel, index.Indexed):
     )
     value = models.CharField(max_length=255)
 
-    # search_fields = [
-    #     index.SearchField("value"),
-    #     index.FilterField("deleted_at"),
-    #     index.FilterField("site_id"),
-    # ]
+    search_fields = [
+        index.SearchField("value"),
+        index.AutocompleteField("value"),
+        index.FilterField("deleted_at"),
+        index.FilterField("site"),
+    ]
 
     def __str__(self):
         return self.value
@@ -1240,9 +1286,21 @@ class ProductPage(BasePage):
         use_json_field=True,
     )
 
+    listing_prefetch_related = ["product_types__type", "tagged_items__tag"]
+
+    search_fields = BasePage.search_fields + [
+        index.SearchField("short_description"),
+        index.SearchField("content"),
+        index.RelatedFields("tags", [index.SearchField("name")]),
+    ]
+
     def get_categories(self):
         return self.product_types.all()
 
+    @classmethod
+    def prefetch_for_listing(cls, pages):
+        prefetch_related_objects(pages, *cls.listing_prefetch_related)
+
     def get_context(self, request, *args, **kwargs):
         context = super().get_context(request, *args, **kwargs)
         site = context["tentron_current_site"]
@@ -1285,9 +1343,13 @@ class SingleProductPage(ProductPage):
         FieldPanel("content"),
     ]
 
+    listing_prefetch_related = ProductPage.listing_prefetch_related + [
+        "single_product_gallery_images__image__renditions"
+    ]
+
     def main_image(self):
-        gallery_item = self.single_product_gallery_images.first()
-        if gallery_item:
+        # iterate instead of first(), so prefetched gallery images are used
+        for gallery_item in self.single_product_gallery_images.all():
             return gallery_item.image
         return None
 
@@ -1310,19 +1372,30 @@ class VariantProductPage(ProductPage):
         FieldPanel("content"),
     ]
 
+    listing_prefetch_related = ProductPage.listing_prefetch_related + [
+        "variants__product_variant_gallery_images__image__renditions"
+    ]
+
+    def first_variant(self):
+        # same as variants.first(), but served from prefetched variants
+        return min(self.variants.all(), key=lambda variant: variant.pk, default=None)
+
     def main_image(self):
-        gallery_item = self.variants.first().product_variant_gallery_images.first()
-        if gallery_item:
+        variant = self.first_variant()
+        if variant is None:
+            return None
+        for gallery_item in variant.product_variant_gallery_images.all():
             return gallery_item.image
         return None
 
     def gallery_images(self):
-        return self.variants.first().product_variant_gallery_images.all()
+        return self.first_variant().product_variant_gallery_images.all()
 
 
 class ProductListPage(BasePage):
     max_count_per_site = 1
     template = "product.html"
+    per_page = 2
     subpage_types = ["core.SingleProductPage", "core.VariantProductPage"]
     content = StreamField(
         [
@@ -1348,10 +1421,11 @@ class ProductListPage(BasePage):
         product_items = ProductPage.objects.filter(
             site=context["tentron_current_site"]
         ).specific()
-        paginator = Paginator(product_items, 2)
+        paginator = Paginator(product_items, self.per_page)
 
         page_number = request.GET.get("page")
         page_obj = paginator.get_page(page_number)
+        page_obj.object_list = prefetch_for_listing(page_obj.object_list)
         context["page_obj"] = page_obj
 
         return context
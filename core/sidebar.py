@@ -0,0 +1,94 @@
+# core/sidebar.py
+import logging
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q, Subquery
+
+from tentron.caches import fragment_cache
+
+logger = logging.getLogger("tentron")
+
+BLOG_SIDEBAR_CACHE_TIMEOUT = getattr(settings, "BLOG_SIDEBAR_CACHE_TIMEOUT", 60 * 60)
+BLOG_SIDEBAR_RECENT_POSTS = 3
+BLOG_SIDEBAR_TOP_TAGS = 10
+
+
+def get_blog_sidebar_cache_key(site_id):
+    return "blogsidebar:{}".format(site_id)
+
+
+def invalidate_blog_sidebar(site_id):
+    if site_id is not None:
+        fragment_cache.delete(get_blog_sidebar_cache_key(site_id))
+
+
+def build_blog_sidebar(site):
+    from .models import BlogCategory, BlogDetailPage, BlogListPage, BlogTag
+
+    # stream fields are not rendered in the sidebar, and their blocks can not
+    # be pickled into the cache
+    return {
+        "blog_list_page": (
+            BlogListPage.objects.live().filter(site=site).defer_streamfields().first()
+        ),
+        "categories": list(BlogCategory.objects.filter(site=site)),
+        "recent_posts": list(
+            BlogDetailPage.objects.live()
+            .filter(site=site)
+            .defer_streamfields()
+            .order_by("-first_published_at")[:BLOG_SIDEBAR_RECENT_POSTS]
+        ),
+        "top_tags": list(
+            BlogTag.objects.filter(site=site)
+            .annotate(num_times=models.Count("tagged_blogs"))
+            .order_by("-num_times")[:BLOG_SIDEBAR_TOP_TAGS]
+        ),
+    }
+
+
+def get_blog_sidebar(site):
+    """
+    Return the blog list page, categories, recent posts and top tags of a
+    site, computed once and shared by every blog page until a post is
+    published or a category or tag changes.
+    """
+    cache_key = get_blog_sidebar_cache_key(site.id)
+    sidebar = fragment_cache.get(cache_key)
+    if sidebar is None:
+        logger.debug("Blog sidebar cache miss for site %s", site.id)
+        sidebar = build_blog_sidebar(site)
+        fragment_cache.set(cache_key, sidebar, BLOG_SIDEBAR_CACHE_TIMEOUT)
+    return sidebar
+
+
+def get_adjacent_posts(page, site):
+    """
+    Return the (previous, next) live posts of the site around a blog post,
+    fetched in a single query.
+    """
+    from .models import BlogDetailPage
+
+    if page.first_published_at is None:
+        return None, None
+
+    posts = BlogDetailPage.objects.live().filter(site=site)
+    pre_post_id = (
+        posts.filter(first_published_at__lt=page.first_published_at)
+        .order_by("-first_published_at")
+        .values("pk")[:1]
+    )
+    next_post_id = (
+        posts.filter(first_published_at__gt=page.first_published_at)
+        .order_by("first_published_at")
+        .values("pk")[:1]
+    )
+    pre_post = next_post = None
+    for post in posts.filter(
+        Q(pk=Subquery(pre_post_id)) | Q(pk=Subquery(next_post_id))
+    ).defer_streamfields():
+        if post.first_published_at < page.first_published_at:
+            pre_post = post
+        else:
+            next_post = post
+    return pre_post, next_post
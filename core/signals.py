@@ -0,0 +1,61 @@
+# core/signals.py
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.signals import page_published, page_unpublished
+
+from .faq import invalidate_faq
+from .models import (
+    BlogCategory,
+    BlogDetailPage,
+    BlogListPage,
+    BlogTag,
+    FaqCategory,
+    FaqCategoryFaqItem,
+    FaqItem,
+    TaggedBlog,
+)
+from .sidebar import invalidate_blog_sidebar
+
+
+@receiver(page_published, sender=BlogDetailPage)
+@receiver(page_unpublished, sender=BlogDetailPage)
+@receiver(post_delete, sender=BlogDetailPage)
+@receiver(page_published, sender=BlogListPage)
+@receiver(page_unpublished, sender=BlogListPage)
+@receiver(post_delete, sender=BlogListPage)
+@receiver(post_save, sender=BlogCategory)
+@receiver(post_delete, sender=BlogCategory)
+@receiver(post_save, sender=BlogTag)
+@receiver(post_delete, sender=BlogTag)
+def invalidate_blog_sidebar_on_change(sender, instance, **kwargs):
+    invalidate_blog_sidebar(instance.site_id)
+
+
+@receiver(post_save, sender=TaggedBlog)
+@receiver(post_delete, sender=TaggedBlog)
+def invalidate_blog_sidebar_on_tagging_change(sender, instance, **kwargs):
+    try:
+        invalidate_blog_sidebar(instance.tag.site_id)
+    except ObjectDoesNotExist:
+        # the tag is being deleted too, its own signal covers the site
+        pass
+
+
+@receiver(post_save, sender=FaqItem)
+@receiver(post_delete, sender=FaqItem)
+@receiver(post_save, sender=FaqCategory)
+@receiver(post_delete, sender=FaqCategory)
+def invalidate_faq_on_change(sender, instance, **kwargs):
+    invalidate_faq(instance.site_id)
+
+
+@receiver(post_save, sender=FaqCategoryFaqItem)
+@receiver(post_delete, sender=FaqCategoryFaqItem)
+def invalidate_faq_on_link_change(sender, instance, **kwargs):
+    # links added from the item inline panel do not get a site
+    try:
+        invalidate_faq(instance.faq_item.site_id)
+    except ObjectDoesNotExist:
+        # the item is being deleted too, its own signal covers the site
+        pass
@@ -1,3 +1,380 @@
-from django.test import TestCase
+import datetime
+import json
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from wagtail.documents import get_document_model
+from wagtail.embeds.blocks import EmbedValue
+from wagtail.images import get_image_model
+from wagtail.models import Page, Site
+from taggit.models import Tag
+from wagtail.rich_text import RichText
+
+from . import autocomplete
+from .autocomplete import get_tag_completions
+from .models import (
+    BlogCategory,
+    BlogDetailPage,
+    BlogListPage,
+    BlogTag,
+    FaqCategory,
+    FaqCategoryFaqItem,
+    FaqItem,
+    ProductListPage,
+    ProductPageProductType,
+    ProductType,
+    ProductVariant,
+    SingleProductGalleryImage,
+    SingleProductPage,
+    VariantProductGalleryImage,
+    VariantProductPage,
+)
+from .faq import get_faq
+from .sidebar import get_adjacent_posts, get_blog_sidebar
+from .views import autocomplete as autocomplete_view
+
+
+class BlogTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        root = Page.objects.get(depth=1)
+        self.site = Site.objects.create(
+            hostname="blog.localhost", port=80, root_page=root
+        )
+        self.blog_list_page = root.add_child(
+            instance=BlogListPage(title="Blog", slug="blog", site=self.site)
+        )
+        self.posts = []
+        published_at = timezone.now() - datetime.timedelta(days=10)
+        for number in range(4):
+            post = self.blog_list_page.add_child(
+                instance=BlogDetailPage(
+                    title="Post {}".format(number), slug="post-{}".format(number)
+                )
+            )
+            post.first_published_at = published_at + datetime.timedelta(days=number)
+            post.save()
+            self.posts.append(post)
+
+
+class BlogSidebarTestCase(BlogTestCase):
+    def test_sidebar_is_cached_per_site(self):
+        BlogCategory.objects.create(name="News", site=self.site)
+
+        sidebar = get_blog_sidebar(self.site)
+        self.assertEqual(sidebar["blog_list_page"], self.blog_list_page)
+        self.assertEqual(
+            [post.title for post in sidebar["recent_posts"]],
+            ["Post 3", "Post 2", "Post 1"],
+        )
+        self.assertEqual(
+            [category.name for category in sidebar["categories"]], ["News"]
+        )
+
+        with self.assertNumQueries(0):
+            get_blog_sidebar(self.site)
+
+    def test_sidebar_is_invalidated_on_change(self):
+        get_blog_sidebar(self.site)
+        BlogCategory.objects.create(name="News", site=self.site)
+        self.assertEqual(len(get_blog_sidebar(self.site)["categories"]), 1)
+
+        self.posts[3].unpublish()
+        self.assertEqual(
+            [post.title for post in get_blog_sidebar(self.site)["recent_posts"]],
+            ["Post 2", "Post 1", "Post 0"],
+        )
+
+    def test_adjacent_posts_in_one_query(self):
+        with self.assertNumQueries(1):
+            pre_post, next_post = get_adjacent_posts(self.posts[1], self.site)
+        self.assertEqual(pre_post, self.posts[0])
+        self.assertEqual(next_post, self.posts[2])
+
+        self.assertEqual(get_adjacent_posts(self.posts[0], self.site)[0], None)
+        self.assertEqual(get_adjacent_posts(self.posts[3], self.site)[1], None)
+
+
+class BlogMediaFieldsTestCase(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = get_image_model().objects.create(
+            title="Cover", file="original_images/cover.png", width=10, height=10
+        )
+        self.post = self.blog_list_page.add_child(
+            instance=BlogDetailPage(
+                title="Video",
+                slug="video",
+                blog_type="video",
+                content=[
+                    ("rich_text", RichText("<p>Hello</p>")),
+                    ("image_block", {"image": self.image}),
+                    ("video", EmbedValue("https://www.youtube.com/watch?v=abc")),
+                ],
+            )
+        )
+
+    def test_media_fields_are_set_on_save(self):
+        post = BlogDetailPage.objects.get(pk=self.post.pk)
+        self.assertEqual(post.content_cover_image, self.image)
+        self.assertEqual(post.get_video_url(), "https://www.youtube.com/watch?v=abc")
+        self.assertIsNone(post.get_audio_url())
+
+    def test_audio_url_follows_the_document(self):
+        document = get_document_model().objects.create(
+            title="Episode", file="documents/episode.mp3"
+        )
+        post = self.blog_list_page.add_child(
+            instance=BlogDetailPage(
+                title="Audio",
+                slug="audio",
+                blog_type="audio",
+                content=[("audio", {"file": document})],
+            )
+        )
+        self.assertEqual(
+            BlogDetailPage.objects.get(pk=post.pk).get_audio_url(), document.url
+        )
+
+        # the url holds the file name, a replaced file is served at a new one
+        document.file = "documents/episode_2.mp3"
+        document.save()
+        self.assertTrue(
+            BlogDetailPage.objects.get(pk=post.pk)
+            .get_audio_url()
+            .endswith("/episode_2.mp3")
+        )
+
+        document.delete()
+        self.assertIsNone(BlogDetailPage.objects.get(pk=post.pk).get_audio_url())
+
+    def test_backfill_command(self):
+        BlogDetailPage.objects.update(content_cover_image=None, video_url="")
+
+        call_command("backfill_blog_media", batch_size=2, stdout=StringIO())
+
+        post = BlogDetailPage.objects.get(pk=self.post.pk)
+        self.assertEqual(post.get_cover(), self.image)
+        self.assertEqual(post.video_url, "https://www.youtube.com/watch?v=abc")
+
+
+class FaqTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        self.site = Site.objects.create(
+            hostname="faq.localhost", port=80, root_page=Page.objects.get(depth=1)
+        )
+
+    def add_category(self, name, item_count):
+        category = FaqCategory.objects.create(name=name, site=self.site)
+        for number in range(item_count):
+            faq_item = FaqItem.objects.create(
+                question="{} {}?".format(name, number), answer="Yes", site=self.site
+            )
+            FaqCategoryFaqItem.objects.create(faq_item=faq_item, faq_category=category)
+        return category
+
+    def test_items_are_grouped_by_category(self):
+        shipping = self.add_category("Shipping", 2)
+        returns = self.add_category("Returns", 1)
+        FaqItem.objects.create(question="Hidden?", answer="No", published=False)
+
+        faq = get_faq(self.site)
+        self.assertEqual(len(faq["faq_items"]), 3)
+        self.assertEqual(faq["half_items"], 1)
+        self.assertEqual(
+            [item.question for item in faq["faq_items_dict"][shipping.id]],
+            ["Shipping 0?", "Shipping 1?"],
+        )
+        self.assertEqual(
+            [item.question for item in faq["faq_items_dict"][returns.id]],
+            ["Returns 0?"],
+        )
+
+    def test_query_count_does_not_depend_on_categories(self):
+        for number in range(5):
+            self.add_category("Category {}".format(number), 2)
+
+        with self.assertNumQueries(3):
+            get_faq(self.site)
+        with self.assertNumQueries(0):
+            get_faq(self.site)
+
+    def test_faq_is_invalidated_on_change(self):
+        category = self.add_category("Shipping", 1)
+        get_faq(self.site)
+
+        faq_item = FaqItem.objects.create(question="New?", answer="Yes", site=self.site)
+        FaqCategoryFaqItem.objects.create(faq_item=faq_item, faq_category=category)
+
+        self.assertEqual(len(get_faq(self.site)["faq_items_dict"][category.id]), 2)
+
+
+class ListingQueryCountTestCase(TestCase):
+    """
+    The number of queries to build and render a page of a listing must not
+    depend on the number of items on it.
+    """
+
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        self.root = Page.objects.get(depth=1)
+        self.site = Site.objects.create(
+            hostname="shop.localhost", port=80, root_page=self.root
+        )
+        self.image = get_image_model().objects.create(
+            title="Cover", file="original_images/cover.png", width=10, height=10
+        )
+
+    def count_listing_queries(self, page, render_item):
+        with mock.patch.object(type(page), "per_page", 100):
+            # warm up the tenant and sidebar caches, they do not depend on items
+            page.get_context(RequestFactory().get("/", HTTP_HOST="shop.localhost"))
+            request = RequestFactory().get("/", HTTP_HOST="shop.localhost")
+            with CaptureQueriesContext(connection) as queries:
+                for item in page.get_context(request)["page_obj"]:
+                    render_item(item)
+        return len(queries)
+
+    def add_posts(self, blog_list_page, count):
+        for _ in range(count):
+            number = BlogDetailPage.objects.count()
+            blog_list_page.add_child(
+                instance=BlogDetailPage(
+                    title="Post {}".format(number),
+                    slug="post-{}".format(number),
+                    content=[
+                        ("image_block", {"image": self.image}),
+                        ("rich_text", RichText("<p>Hello</p>")),
+                    ],
+                )
+            )
+
+    def add_products(self, product_list_page, product_type, count):
+        for _ in range(count):
+            number = product_list_page.get_children().count()
+            single = product_list_page.add_child(
+                instance=SingleProductPage(
+                    title="Single {}".format(number), slug="single-{}".format(number)
+                )
+            )
+            SingleProductGalleryImage.objects.create(page=single, image=self.image)
+            ProductPageProductType.objects.create(page=single, type=product_type)
+
+            variant_page = product_list_page.add_child(
+                instance=VariantProductPage(
+                    title="Variant {}".format(number), slug="variant-{}".format(number)
+                )
+            )
+            variant = ProductVariant.objects.create(product=variant_page)
+            VariantProductGalleryImage.objects.create(page=variant, image=self.image)
+            ProductPageProductType.objects.create(page=variant_page, type=product_type)
+
+    def test_blog_list_page(self):
+        blog_list_page = self.root.add_child(
+            instance=BlogListPage(title="Blog", slug="blog", site=self.site)
+        )
+
+        def render_post(post):
+            post.get_cover()
+            post.get_audio_url()
+            post.get_video_url()
+
+        self.add_posts(blog_list_page, 2)
+        few = self.count_listing_queries(blog_list_page, render_post)
+        self.add_posts(blog_list_page, 5)
+        self.assertEqual(self.count_listing_queries(blog_list_page, render_post), few)
+
+    def test_product_list_page(self):
+        product_list_page = self.root.add_child(
+            instance=ProductListPage(title="Products", slug="products", site=self.site)
+        )
+        product_type = ProductType.objects.create(name="Chairs", site=self.site)
+
+        def render_product(product):
+            product.main_image()
+            [category.name() for category in product.get_categories()]
+
+        self.add_products(product_list_page, product_type, 1)
+        few = self.count_listing_queries(product_list_page, render_product)
+        self.add_products(product_list_page, product_type, 4)
+        self.assertEqual(
+            self.count_listing_queries(product_list_page, render_product), few
+        )
+
+
+class TagAutocompleteTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        root = Page.objects.get(depth=1)
+        self.site = Site.objects.create(hostname="acme.localhost", root_page=root)
+        self.other_site = Site.objects.create(
+            hostname="other.localhost", root_page=root
+        )
+        for name in ["Rockets", "rocketry", "Robots", "Cars"]:
+            BlogTag.objects.create(name=name, slug=name.lower(), site=self.site)
+        BlogTag.objects.create(name="Rovers", slug="rovers", site=self.other_site)
+
+    def test_completions_are_scoped_to_the_site(self):
+        self.assertEqual(
+            get_tag_completions(BlogTag, self.site, "RO"),
+            ["Robots", "rocketry", "Rockets"],
+        )
+        self.assertEqual(
+            get_tag_completions(BlogTag, self.site, "ro", limit=1), ["Robots"]
+        )
+        self.assertEqual(get_tag_completions(BlogTag, None, "rov"), ["Rovers"])
+
+    def test_popular_tags_are_cached(self):
+        get_tag_completions(BlogTag, self.site, "ro")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_tag_completions(BlogTag, self.site, "car"), ["Cars"])
+
+    def test_large_sites_use_the_index(self):
+        with mock.patch.object(autocomplete, "TAG_AUTOCOMPLETE_CACHED_TAGS", 1):
+            self.assertEqual(
+                get_tag_completions(BlogTag, self.site, "rock"),
+                ["rocketry", "Rockets"],
+            )
+
+        tags, _ = autocomplete.get_site_tags(Tag, None)
+        queryset = tags.annotate(
+            lower_name=autocomplete.Collate(autocomplete.Lower("name"), "C")
+        ).filter(lower_name__startswith="rock")
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn("core_taggit_tag_lname_idx", queryset.explain())
+
+    def test_product_tags_are_scoped_by_products(self):
+        product_list_page = Page.objects.get(depth=1).add_child(
+            instance=ProductListPage(title="Products", slug="products", site=self.site)
+        )
+        product = product_list_page.add_child(
+            instance=SingleProductPage(title="Chair", slug="chair")
+        )
+        product.tags.add("Chairs")
+        product.save()
+        Tag.objects.create(name="Chess", slug="chess")
+
+        self.assertEqual(get_tag_completions(Tag, self.site, "ch"), ["Chairs"])
+        self.assertEqual(get_tag_completions(Tag, None, "ch"), ["Chairs", "Chess"])
+
+    def test_view(self):
+        request = RequestFactory().get(
+            "/tadmin/tag-autocomplete/core/blogtag/",
+            {"term": "rob"},
+            HTTP_HOST="acme.localhost",
+        )
+        request.user = mock.Mock(is_superuser=False)
+        response = autocomplete_view(request, "core", "blogtag")
+        self.assertEqual(json.loads(response.content), ["Robots"])
@@ -13,8 +13,9 @@ from wagtail.contrib.forms.views import FormPagesListView
 from wagtail.contrib.modeladmin.views import IndexView, WMABaseView
 from wagtail.models import Locale, Page, Site
 
-from organization.models import SiteSettings
+from organization.tenant import get_tenant
 
+from .autocomplete import get_tag_completions
 from .models import FaqPage, ProductPage, ProductType
 
 # def homepage(request):
@@ -73,13 +74,13 @@ def add_subpage(request, parent_page_id):
 
 
 def product_type(request, slug):
-    site = Site.find_for_request(request)
+    tenant = get_tenant(request)
+    site = tenant.site
     category = get_object_or_404(ProductType, slug=slug)
     products = ProductPage.objects.filter(
         product_types__type__in=[category], site=site
     ).specific()
-    site_settings = SiteSettings.for_site(site)
-    template_folder = site_settings.site_settings_theme.first().template_folder
+    template_folder = tenant.template_folder
     paginator = Paginator(products, 2)
 
     page_number = request.GET.get("page")
@@ -103,9 +104,6 @@ def kindly_404(request):
 
 
 def autocomplete(request, app_name=None, model_name=None):
-    print("autocomplete")
-    site = Site.find_for_request(request)
-    print("site", site)
     if app_name and model_name:
         try:
             content_type = ContentType.objects.get_by_natural_key(app_name, model_name)
@@ -119,18 +117,14 @@ def autocomplete(request, app_name=None, model_name=None):
     else:
         tag_model = Tag
 
-    term = request.GET.get("term", None)
-    if term:
-        tags = tag_model.objects.filter(name__istartswith=term, site=site).order_by(
-            "name"
-        )
-        if request.user.is_superuser:
-            tags = tag_model.objects.filter(name__istartswith=term).order_by("name")
-
-    else:
-        tags = tag_model.objects.none()
-
-    return JsonResponse([tag.name for tag in tags], safe=False)
+    # superusers manage the tags of every site
+    site = None
+    if not request.user.is_superuser:
+        site = Site.find_for_request(request)
+        if site is None:
+            return JsonResponse([], safe=False)
+    term = request.GET.get("term", "")
+    return JsonResponse(get_tag_completions(tag_model, site, term), safe=False)
 
 
 class FaqPageIndexView(IndexView):
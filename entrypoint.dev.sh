@@ -47,7 +47,7 @@ fi
 gosu tentron python manage.py migrate
 gosu tentron python manage.py collectstatic --no-input --clear
 echo "Collecting static files...finished"
-gosu tentron python manage.py update_index
+gosu tentron python manage.py update_index --since
 echo "Updating search index...finished"
 
 # Start Celery worker as celery user
@@ -45,7 +45,7 @@ gosu tentron python manage.py migrate
 echo "Migrating...finished"
 gosu tentron python manage.py collectstatic --no-input --clear
 echo "Collecting static files...finished"
-gosu tentron python manage.py update_index
+gosu tentron python manage.py update_index --since
 echo "Updating search index...finished"
 # Start Celery worker as celery user
 gosu celery celery -A tentron worker --loglevel=info &
@@ -0,0 +1,444 @@
+# organization/blueprints.py
+import copy
+import json
+import logging
+import uuid
+from collections import defaultdict
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models
+from django.utils import timezone
+from modelcluster.models import (
+    ClusterableModel,
+    get_all_child_relations,
+    get_serializable_data_for_fields,
+    model_from_serializable_data,
+)
+from wagtail import blocks
+from wagtail.fields import StreamField
+from wagtail.models import Page
+
+from search.queue import enqueue
+
+logger = logging.getLogger("tentron")
+
+# 2: the page chooser values of the streams hold the index of the page in the
+# blueprint instead of its id in the reference tenant
+BLUEPRINT_VERSION = 2
+
+# page columns describing the tree, the publishing state or the tenant, they
+# are set by the loader instead of copied from the reference tenant
+PAGE_STATE_FIELDS = {
+    "id",
+    "path",
+    "depth",
+    "numchild",
+    "translation_key",
+    "locale",
+    "latest_revision",
+    "live",
+    "has_unpublished_changes",
+    "first_published_at",
+    "last_published_at",
+    "live_revision",
+    "go_live_at",
+    "expire_at",
+    "expired",
+    "locked",
+    "locked_at",
+    "locked_by",
+    "draft_title",
+    "content_type",
+    "url_path",
+    "owner",
+    "latest_revision_created_at",
+    "alias_of",
+    "site",
+    "wagtail_admin_comments",
+}
+
+# settings of the reference tenant copied with the pages, the footer menu is
+# left out as its columns are flat menus of the reference tenant
+BLUEPRINT_SETTINGS_MODELS = ("organization.SiteSettings",)
+
+MENU_ITEM_FIELDS = (
+    "link_url",
+    "url_append",
+    "link_text",
+    "handle",
+    "allow_subnav",
+    "sort_order",
+    "image_id",
+    "hover_description",
+)
+
+
+def is_site_scoped(model):
+    # pages and the models with a site, like blog tags or testimonials
+    return issubclass(model, Page) or any(
+        field.name == "site" for field in model._meta.concrete_fields
+    )
+
+
+def is_site_independent(relation):
+    """
+    Whether the children of a relation can be copied to another tenant: apart
+    from the parental key, none of their foreign keys points at a page or at
+    a model scoped by a site.
+    """
+    for field in relation.related_model._meta.concrete_fields:
+        if not field.many_to_one or field == relation.field:
+            continue
+        if is_site_scoped(field.related_model):
+            return False
+    return True
+
+
+def remap_block_value(block, value, map_page):
+    """
+    Rewrite the chooser values of the raw data of a block, like
+    OrganizationImporter.remap_block_value does for an archive: pages go
+    through map_page, objects of the other site scoped models are cleared.
+    """
+    if value is None:
+        return None
+    if isinstance(block, blocks.StreamBlock):
+        for child in value:
+            child_block = block.child_blocks.get(child.get("type"))
+            if child_block is not None:
+                child["value"] = remap_block_value(
+                    child_block, child["value"], map_page
+                )
+    elif isinstance(block, blocks.ListBlock):
+        for position, item in enumerate(value):
+            if isinstance(item, dict) and item.get("type") == "item":
+                item["value"] = remap_block_value(
+                    block.child_block, item["value"], map_page
+                )
+            else:
+                value[position] = remap_block_value(block.child_block, item, map_page)
+    elif isinstance(block, blocks.StructBlock):
+        for name, child_block in block.child_blocks.items():
+            if name in value:
+                value[name] = remap_block_value(child_block, value[name], map_page)
+    elif isinstance(block, blocks.ChooserBlock):
+        if issubclass(block.model_class, Page):
+            return map_page(value)
+        if is_site_scoped(block.model_class):
+            return None
+    return value
+
+
+def remap_streams(model, data, map_page):
+    """
+    Copy of the serialized data of model with the chooser values of its
+    streams rewritten by remap_block_value.
+    """
+    data = dict(data)
+    for field in model._meta.concrete_fields:
+        value = data.get(field.name)
+        if not isinstance(field, StreamField) or not value:
+            continue
+        if isinstance(value, str):
+            value = remap_block_value(field.stream_block, json.loads(value), map_page)
+            data[field.name] = json.dumps(value, cls=DjangoJSONEncoder)
+        else:
+            data[field.name] = remap_block_value(
+                field.stream_block, copy.deepcopy(value), map_page
+            )
+    return data
+
+
+def get_copied_child_relations(model):
+    return [
+        relation
+        for relation in get_all_child_relations(model)
+        if relation.get_accessor_name() not in PAGE_STATE_FIELDS
+        and is_site_independent(relation)
+    ]
+
+
+def serialize_page(page, index_by_id):
+    # a link to a page outside of the tree cannot be copied
+    data = remap_streams(type(page), page.serializable_data(), index_by_id.get)
+    copied = set()
+    for relation in get_copied_child_relations(type(page)):
+        accessor = relation.get_accessor_name()
+        copied.add(accessor)
+        # the children point at the new page once it is inserted
+        for child in data.get(accessor, []):
+            child["pk"] = None
+            child[relation.field.name] = None
+    skipped = {
+        relation.get_accessor_name() for relation in get_all_child_relations(type(page))
+    } - copied
+    # the links between the tables of a multi-table page model
+    skipped.update(
+        field.name
+        for field in type(page)._meta.concrete_fields
+        if field.remote_field and field.remote_field.parent_link
+    )
+    data = {
+        key: value
+        for key, value in data.items()
+        if key not in PAGE_STATE_FIELDS and key not in skipped
+    }
+    data["pk"] = None
+    return data
+
+
+def capture_blueprint(site):
+    """
+    Serialize the page tree, main menu and settings of a reference site. The
+    home page is the first entry, every page lists the index of its parent and
+    links to pages of the tree hold their index. Images and other shared
+    objects are referenced by id, links to other objects of the reference
+    tenant (tags, testimonials, pages outside of the tree) are not kept.
+    """
+    home_page = site.root_page
+    pages = list(
+        Page.objects.descendant_of(home_page, inclusive=True)
+        .order_by("path")
+        .specific()
+    )
+    index_by_path = {page.path: position for position, page in enumerate(pages)}
+    index_by_id = {page.pk: position for position, page in enumerate(pages)}
+    page_entries = [
+        {
+            "model": page._meta.label_lower,
+            "parent": index_by_path.get(page.path[: -Page.steplen]),
+            "data": serialize_page(page, index_by_id),
+        }
+        for page in pages
+    ]
+
+    main_menu = None
+    MainMenu = apps.get_model("organization_menu", "OrganizationMainMenu")
+    menu = MainMenu.objects.filter(site=site).first()
+    if menu is not None:
+        main_menu = {
+            "max_levels": menu.max_levels,
+            "items": [
+                dict(
+                    {field: getattr(item, field) for field in MENU_ITEM_FIELDS},
+                    link_page=index_by_id.get(item.link_page_id),
+                )
+                for item in menu.get_menu_items_manager().all()
+                if item.link_page_id is None or item.link_page_id in index_by_id
+            ],
+        }
+
+    settings = {}
+    for label in BLUEPRINT_SETTINGS_MODELS:
+        instance = apps.get_model(label).objects.filter(site=site).first()
+        if instance is not None:
+            if isinstance(instance, ClusterableModel):
+                data = instance.serializable_data()
+            else:
+                data = get_serializable_data_for_fields(instance)
+            data.pop("id", None)
+            data.pop("site", None)
+            data["pk"] = None
+            settings[label.lower()] = remap_streams(
+                type(instance), data, index_by_id.get
+            )
+
+    return {
+        "version": BLUEPRINT_VERSION,
+        "pages": page_entries,
+        "main_menu": main_menu,
+        "settings": settings,
+    }
+
+
+def get_concrete_models(model):
+    # the tables of a page model, from wagtailcore_page to the most specific
+    return [
+        parent
+        for parent in reversed(model._meta.get_parent_list())
+        if not parent._meta.abstract
+    ] + [model]
+
+
+def bulk_insert(model, objs, returning=False):
+    """
+    Insert the rows of one table of objs. bulk_create refuses multi-table
+    models, so the loader inserts each table of the inheritance chain like
+    bulk_create does for a single one.
+    """
+    fields = [
+        field
+        for field in model._meta.local_concrete_fields
+        if not (returning and field.primary_key)
+    ]
+    return model._base_manager._insert(
+        objs,
+        fields=fields,
+        returning_fields=model._meta.db_returning_fields if returning else None,
+        using=connection.alias,
+    )
+
+
+def build_page(entry, parent, path, owner, site, now):
+    model = apps.get_model(entry["model"])
+    page = model.from_serializable_data(entry["data"], check_fks=True)
+    page.pk = None
+    page.path = path
+    page.depth = parent.depth + 1
+    page.numchild = 0
+    page.translation_key = uuid.uuid4()
+    page.locale_id = parent.locale_id
+    page.live = True
+    page.has_unpublished_changes = False
+    page.first_published_at = now
+    page.last_published_at = now
+    page.draft_title = page.title
+    page.url_path = parent.url_path + page.slug + "/"
+    page.owner = owner
+    page.site = site
+    return page
+
+
+def set_page_links(page, data, map_page):
+    data = remap_streams(type(page), data, map_page)
+    for field in type(page)._meta.concrete_fields:
+        if isinstance(field, StreamField) and field.name in data:
+            setattr(page, field.name, field.to_python(data[field.name]))
+
+
+def create_child_rows(pages, entries):
+    # form fields and other site independent children of the new pages
+    rows = defaultdict(list)
+    for page, entry in zip(pages, entries):
+        for relation in get_copied_child_relations(type(page)):
+            if relation.get_accessor_name() not in entry["data"]:
+                continue
+            for child in getattr(page, relation.get_accessor_name()).all():
+                child.pk = None
+                setattr(child, relation.field.attname, page.pk)
+                rows[relation.related_model].append(child)
+    for model, objs in rows.items():
+        model.objects.bulk_create(objs)
+
+
+def materialize_blueprint(blueprint, site, owner=None):
+    """
+    Create the pages, main menu and settings of a blueprint under the home
+    page of site. The tree paths are allocated up front and every table is
+    written with one insert, whatever the number of pages.
+    """
+    version = blueprint.get("version")
+    if version not in (1, BLUEPRINT_VERSION):
+        raise ValueError("Unsupported blueprint version %r" % version)
+
+    now = timezone.now()
+    home_page = site.root_page.specific
+    entries = blueprint["pages"]
+
+    # the next path step of every parent, after the existing children of the
+    # home page
+    last_child = home_page.get_last_child()
+    last_steps = defaultdict(int)
+    if last_child is not None:
+        last_steps[0] = Page._str2int(last_child.path[-Page.steplen :])
+    pages = [home_page]
+    child_counts = defaultdict(int)
+    for entry in entries[1:]:
+        parent = pages[entry["parent"]]
+        child_counts[entry["parent"]] += 1
+        last_steps[entry["parent"]] += 1
+        path = Page._get_path(
+            parent.path, parent.depth + 1, last_steps[entry["parent"]]
+        )
+        pages.append(build_page(entry, parent, path, owner, site, now))
+    new_pages = pages[1:]
+
+    def map_page(index):
+        # the links of the first blueprints hold ids of the reference tenant
+        if version == 1 or not isinstance(index, int) or index >= len(pages):
+            return None
+        return pages[index].pk
+
+    for position, page in enumerate(new_pages, start=1):
+        page.numchild = child_counts[position]
+        page.content_type = ContentType.objects.get_for_model(type(page))
+
+    if new_pages:
+        ids = bulk_insert(Page, new_pages, returning=True)
+        for page, (page_id,) in zip(new_pages, ids):
+            page.id = page_id
+        # the page links of the streams are set once the ids are known, before
+        # the tables holding the streams are written
+        for page, entry in zip(new_pages, entries[1:]):
+            set_page_links(page, entry["data"], map_page)
+        by_model = defaultdict(list)
+        for page in new_pages:
+            for model in get_concrete_models(type(page))[1:]:
+                setattr(page, model._meta.pk.attname, page.id)
+                by_model[model].append(page)
+        for model, objs in by_model.items():
+            bulk_insert(model, objs)
+        Page.objects.filter(pk=home_page.pk).update(
+            numchild=models.F("numchild") + child_counts[0]
+        )
+
+    # the home page exists already, it takes the content of the first entry
+    home_model = type(home_page)
+    home_data = home_model.from_serializable_data(entries[0]["data"], check_fks=True)
+    home_data.pk = home_page.pk
+    set_page_links(home_data, entries[0]["data"], map_page)
+    home_model.objects.filter(pk=home_page.pk).update(
+        **{
+            field.attname: getattr(home_data, field.attname)
+            for field in home_model._meta.concrete_fields
+            # the slug keeps the url_path of the home page valid
+            if field.name not in PAGE_STATE_FIELDS | {"slug"}
+            and not field.primary_key
+            and not isinstance(field, models.OneToOneField)
+        }
+    )
+    create_child_rows([home_data] + new_pages, entries)
+
+    if blueprint.get("main_menu"):
+        MainMenu = apps.get_model("organization_menu", "OrganizationMainMenu")
+        MenuItem = apps.get_model("organization_menu", "OrganizationMainMenuItem")
+        main_menu = MainMenu.objects.filter(site=site).first()
+        if main_menu is None:
+            # bulk_create skips the save of the (empty) cluster of menu items
+            (main_menu,) = MainMenu.objects.bulk_create(
+                [MainMenu(site=site, max_levels=blueprint["main_menu"]["max_levels"])]
+            )
+        MenuItem.objects.bulk_create(
+            [
+                MenuItem(
+                    menu=main_menu,
+                    link_page_id=(
+                        pages[item["link_page"]].pk
+                        if item["link_page"] is not None
+                        else None
+                    ),
+                    **{field: item[field] for field in MENU_ITEM_FIELDS},
+                )
+                for item in blueprint["main_menu"]["items"]
+            ]
+        )
+
+    for label, data in blueprint.get("settings", {}).items():
+        model = apps.get_model(label)
+        instance = model_from_serializable_data(
+            model, remap_streams(model, data, map_page), check_fks=True
+        )
+        for relation in get_all_child_relations(model):
+            for child in getattr(instance, relation.get_accessor_name()).all():
+                child.pk = None
+        instance.pk = (
+            model.objects.filter(site=site).values_list("pk", flat=True).first()
+        )
+        instance.site = site
+        instance.save()
+
+    enqueue(pages)
+    logger.info("Created %s pages from a blueprint for %s", len(new_pages), site)
+    return pages
@@ -0,0 +1,462 @@
+# organizations/certificates.py
+import base64
+import logging
+import os
+import re
+import shlex
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .containers import exec_in_container
+from .nginx import (
+    LETSENCRYPT_LIVE,
+    get_served_organizations,
+    reload_nginx,
+    request_nginx_reconcile,
+)
+
+logger = logging.getLogger("tentron")
+
+CERTBOT_CONTAINER = getattr(settings, "CERTBOT_CONTAINER", "CertBot")
+CERTBOT_WEBROOT = getattr(settings, "CERTBOT_WEBROOT", "/var/www/certbot")
+
+# a certificate is renewed this long before its notAfter, Let's Encrypt
+# issues them for 90 days. Ahead of the 30 days of the certbot renew loop of
+# the CertBot container, left for the certificate of the platform and as a
+# fallback.
+CERTIFICATE_RENEW_BEFORE = timedelta(
+    days=getattr(settings, "CERTIFICATE_RENEW_BEFORE_DAYS", 35)
+)
+# certificates issued or renewed per window, Let's Encrypt allows 300 new
+# orders per account every 3 hours
+CERTIFICATE_ISSUANCE_LIMIT = getattr(settings, "CERTIFICATE_ISSUANCE_LIMIT", 100)
+CERTIFICATE_ISSUANCE_WINDOW = getattr(
+    settings, "CERTIFICATE_ISSUANCE_WINDOW", 60 * 60 * 3
+)
+# certbot calls of a run, the next batch follows CERTIFICATE_BATCH_DELAY later
+CERTIFICATE_BATCH_SIZE = getattr(settings, "CERTIFICATE_BATCH_SIZE", 10)
+CERTIFICATE_BATCH_DELAY = getattr(settings, "CERTIFICATE_BATCH_DELAY", 60)
+# a domain whose validation failed waits this long, Let's Encrypt allows 5
+# failed validations per hostname an hour
+CERTIFICATE_RETRY_DELAY = timedelta(
+    seconds=getattr(settings, "CERTIFICATE_RETRY_DELAY", 60 * 60 * 2)
+)
+
+# seconds the worker waits before running, the saves made meanwhile are
+# handled by a single run
+CERTIFICATE_RUN_DELAY = getattr(settings, "CERTIFICATE_RUN_DELAY", 30)
+CERTIFICATE_RUN_SCHEDULED_KEY = "certificates:run:scheduled"
+CERTIFICATE_RUN_LOCK_KEY = "certificates:run:lock"
+CERTIFICATE_RUN_LOCK_TIMEOUT = 60 * 60
+CERTIFICATE_ISSUED_KEY = "certificates:issued:{}"
+
+CERTIFICATE_FIELDS = (
+    "domain",
+    "ssl_enabled",
+    "domain_status",
+    "certificate_status",
+    "certificate_expires_at",
+    "certificate_requested_at",
+    "certificate_error",
+)
+
+# the lines of the certbot script output announcing the result of a domain
+RESULT_PREFIX = "@@certificate"
+
+PEM_CERTIFICATE_RE = re.compile(
+    r"-----BEGIN CERTIFICATE-----(.+?)-----END CERTIFICATE-----", re.DOTALL
+)
+
+
+class CertificatePlan(namedtuple("CertificatePlan", ["issue", "renew", "remove"])):
+    """
+    Organizations whose certificate a run requests, renews or deletes.
+    """
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return any(self)
+
+
+def read_der(data, offset=0):
+    """
+    Read the DER element at offset, return (tag, content, end offset).
+    """
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[offset : offset + size], "big")
+        offset += size
+    return tag, data[offset : offset + length], offset + length
+
+
+def parse_der_time(tag, value):
+    value = value.decode("ascii")
+    # UTCTime has a two digits year, GeneralizedTime four
+    if tag == 0x17:
+        year = int(value[:2])
+        value = ("19" if year >= 50 else "20") + value
+    return datetime.strptime(value, "%Y%m%d%H%M%SZ").replace(tzinfo=dt_timezone.utc)
+
+
+def get_certificate_not_after(der):
+    """
+    notAfter of an X.509 certificate: Certificate > tbsCertificate >
+    validity, after the optional version, serial, signature and issuer.
+    """
+    _, certificate, _ = read_der(der)
+    _, tbs, _ = read_der(certificate)
+    offset = 0
+    tag, _, offset = read_der(tbs, offset)
+    if tag == 0xA0:
+        # explicit version, the serial follows
+        tag, _, offset = read_der(tbs, offset)
+    for _ in ("signature", "issuer"):
+        tag, _, offset = read_der(tbs, offset)
+    _, validity, _ = read_der(tbs, offset)
+    _, _, end = read_der(validity)
+    tag, value, _ = read_der(validity, end)
+    return parse_der_time(tag, value)
+
+
+def read_certificate_expiry(domain):
+    """
+    notAfter of the certificate certbot keeps for domain, None without one.
+    fullchain.pem starts with the certificate of the domain.
+    """
+    try:
+        with open(os.path.join(LETSENCRYPT_LIVE, domain, "fullchain.pem")) as f:
+            match = PEM_CERTIFICATE_RE.search(f.read())
+    except FileNotFoundError:
+        return None
+    if match is None:
+        return None
+    try:
+        return get_certificate_not_after(base64.b64decode(match.group(1)))
+    except (IndexError, ValueError):
+        logger.warning("Could not read the certificate of %s", domain)
+        return None
+
+
+def get_certificate_status(organization, expires_at, now):
+    Organization = apps.get_model("organization", "Organization")
+    if expires_at is None:
+        if not organization.ssl_enabled:
+            return Organization.CERTIFICATE_NONE
+        # a failed request stays failed until the next attempt
+        if organization.certificate_status == Organization.CERTIFICATE_FAILED:
+            return Organization.CERTIFICATE_FAILED
+        return Organization.CERTIFICATE_PENDING
+    if expires_at <= now:
+        return Organization.CERTIFICATE_EXPIRED
+    if expires_at <= now + CERTIFICATE_RENEW_BEFORE:
+        return Organization.CERTIFICATE_EXPIRING
+    return Organization.CERTIFICATE_VALID
+
+
+def get_certificate_organizations():
+    return get_served_organizations().only(*CERTIFICATE_FIELDS)
+
+
+def scan_certificates(organizations=None):
+    """
+    Read the notAfter of the certificates of the served organizations and
+    record their status in one update. Return the organizations.
+    """
+    Organization = apps.get_model("organization", "Organization")
+    if organizations is None:
+        organizations = get_certificate_organizations()
+    organizations = list(organizations)
+    now = timezone.now()
+    changed = []
+    for organization in organizations:
+        expires_at = read_certificate_expiry(organization.domain)
+        status = get_certificate_status(organization, expires_at, now)
+        if (
+            organization.certificate_expires_at != expires_at
+            or organization.certificate_status != status
+        ):
+            organization.certificate_expires_at = expires_at
+            organization.certificate_status = status
+            changed.append(organization)
+    # update the columns only, save() would queue another run
+    Organization.all_objects.bulk_update(
+        changed, ["certificate_expires_at", "certificate_status"], batch_size=500
+    )
+    return organizations
+
+
+def get_issuance_key(now=None):
+    window = int((now or time.time()) // CERTIFICATE_ISSUANCE_WINDOW)
+    return CERTIFICATE_ISSUED_KEY.format(window)
+
+
+def get_issuance_budget():
+    return max(0, CERTIFICATE_ISSUANCE_LIMIT - cache.get(get_issuance_key(), 0))
+
+
+def record_issuance(count):
+    if not count:
+        return
+    key = get_issuance_key()
+    # no expiry, redis only evicts the keys that have one; the key of the
+    # previous window is deleted instead
+    if cache.add(key, count, None):
+        cache.delete(get_issuance_key(time.time() - CERTIFICATE_ISSUANCE_WINDOW))
+    else:
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            pass
+
+
+def get_certificate_plan(organizations, budget, batch_size=CERTIFICATE_BATCH_SIZE):
+    """
+    Split the organizations into a CertificatePlan for a run and the number
+    of certificates left for later. Renewals go first, by expiry, since they
+    keep live sites on https, then the new certificates. Both count against
+    the issuance budget. Deletions are free but bounded by the batch too.
+    """
+    Organization = apps.get_model("organization", "Organization")
+    now = timezone.now()
+    issue, renew, remove = [], [], []
+    for organization in organizations:
+        if not organization.ssl_enabled:
+            if organization.certificate_expires_at is not None:
+                remove.append(organization)
+            continue
+        if organization.domain_status != Organization.DOMAIN_VERIFIED:
+            continue
+        if (
+            organization.certificate_status == Organization.CERTIFICATE_FAILED
+            and organization.certificate_requested_at is not None
+            and organization.certificate_requested_at > now - CERTIFICATE_RETRY_DELAY
+        ):
+            continue
+        if organization.certificate_expires_at is None:
+            issue.append(organization)
+        elif organization.certificate_expires_at <= now + CERTIFICATE_RENEW_BEFORE:
+            renew.append(organization)
+    renew.sort(key=lambda organization: organization.certificate_expires_at)
+    issue.sort(
+        key=lambda organization: (
+            organization.certificate_requested_at is not None,
+            organization.certificate_requested_at or now,
+            organization.pk,
+        )
+    )
+
+    slots = min(budget, batch_size)
+    planned_renew = renew[:slots]
+    planned_issue = issue[: slots - len(planned_renew)]
+    plan = CertificatePlan(planned_issue, planned_renew, remove[:batch_size])
+    left = len(issue) + len(renew) + len(remove) - sum(len(part) for part in plan)
+    return plan, left
+
+
+def get_certbot_script(plan):
+    """
+    Shell script run in the certbot container, one certbot call per domain.
+    Each call prints its RESULT_PREFIX line with the exit code, followed by
+    the end of the certbot output when it failed.
+    """
+    certonly = [
+        "certbot",
+        "certonly",
+        "--webroot",
+        "-w",
+        CERTBOT_WEBROOT,
+        "--non-interactive",
+        "--agree-tos",
+        "--register-unsafely-without-email",
+        "--rsa-key-size",
+        "4096",
+    ]
+    if settings.DEBUG:
+        # the staging server of Let's Encrypt, its limits are much higher
+        certonly.append("--test-cert")
+
+    def call(action, domain, args):
+        return (
+            "out=$({} 2>&1); code=$?\n"
+            'echo "{} {} {} $code"\n'
+            '[ "$code" = 0 ] || echo "$out" | tail -n 5'.format(
+                " ".join(shlex.quote(arg) for arg in args),
+                RESULT_PREFIX,
+                action,
+                shlex.quote(domain),
+            )
+        )
+
+    lines = []
+    for organization in plan.issue:
+        domain = organization.domain
+        lines.append(
+            call("issue", domain, certonly + ["--cert-name", domain, "-d", domain])
+        )
+    for organization in plan.renew:
+        domain = organization.domain
+        lines.append(
+            call(
+                "renew",
+                domain,
+                certonly + ["--cert-name", domain, "-d", domain, "--force-renewal"],
+            )
+        )
+    for organization in plan.remove:
+        domain = organization.domain
+        lines.append(
+            call(
+                "remove",
+                domain,
+                ["certbot", "delete", "--cert-name", domain, "--non-interactive"],
+            )
+        )
+    return "\n".join(lines)
+
+
+def parse_certbot_output(output):
+    """
+    Return {domain: (exit code, output of the failure)} of the script output.
+    """
+    results = {}
+    domain = None
+    for line in output.splitlines():
+        if line.startswith(RESULT_PREFIX + " "):
+            _, _, domain, code = line.split()
+            results[domain] = (int(code), [])
+        elif domain is not None and results[domain][0] != 0:
+            results[domain][1].append(line)
+    return {
+        domain: (code, "\n".join(lines)) for domain, (code, lines) in results.items()
+    }
+
+
+def run_certbot(plan):
+    result = exec_in_container(
+        CERTBOT_CONTAINER, ["sh", "-c", get_certbot_script(plan)], output_limit=None
+    )
+    results = parse_certbot_output(result.output)
+    if not results and not result.ok:
+        raise RuntimeError("certbot did not run: {}".format(result.output[-2000:]))
+    return results
+
+
+def apply_certificate_plan(plan):
+    """
+    Run the plan and record the outcome of each organization. nginx switches
+    the new certificates to https, and reloads once for the renewed ones.
+    Return {"issued": n, "renewed": n, "removed": n, "failed": n}.
+    """
+    Organization = apps.get_model("organization", "Organization")
+    results = run_certbot(plan)
+    now = timezone.now()
+    summary = {"issued": 0, "renewed": 0, "removed": 0, "failed": 0}
+    changed = []
+    for action, counter, organizations in (
+        ("issue", "issued", plan.issue),
+        ("renew", "renewed", plan.renew),
+        ("remove", "removed", plan.remove),
+    ):
+        for organization in organizations:
+            code, output = results.get(
+                organization.domain, (None, "certbot did not run")
+            )
+            if action != "remove":
+                organization.certificate_requested_at = now
+            if code == 0:
+                summary[counter] += 1
+                organization.certificate_error = ""
+                expires_at = read_certificate_expiry(organization.domain)
+                organization.certificate_expires_at = expires_at
+                organization.certificate_status = get_certificate_status(
+                    organization, expires_at, now
+                )
+            else:
+                summary["failed"] += 1
+                organization.certificate_error = output
+                if action != "remove":
+                    organization.certificate_status = Organization.CERTIFICATE_FAILED
+                logger.warning(
+                    "certbot could not %s the certificate of %s: %s",
+                    action,
+                    organization.domain,
+                    output,
+                )
+            changed.append(organization)
+    Organization.all_objects.bulk_update(
+        changed,
+        [
+            "certificate_status",
+            "certificate_expires_at",
+            "certificate_requested_at",
+            "certificate_error",
+        ],
+    )
+    # a failed order counts against the Let's Encrypt limits too
+    record_issuance(len(plan.issue) + len(plan.renew))
+    if summary["issued"] or summary["removed"]:
+        request_nginx_reconcile()
+    if summary["renewed"]:
+        reload_nginx()
+    return summary
+
+
+def run_certificate_manager(dry_run=False):
+    """
+    Scan the certificates, then request, renew and delete one batch of them
+    within the issuance budget. Return (plan, summary, left), summary is
+    None for a dry run or an empty plan.
+    """
+    organizations = scan_certificates()
+    plan, left = get_certificate_plan(organizations, get_issuance_budget())
+    summary = None
+    if plan and not dry_run:
+        summary = apply_certificate_plan(plan)
+        logger.info(
+            "Certificates: %(issued)s issued, %(renewed)s renewed, "
+            "%(removed)s removed, %(failed)s failed",
+            summary,
+        )
+    return plan, summary, left
+
+
+def get_next_run_countdown():
+    # the next batch, or the start of the next window once the budget is used
+    if get_issuance_budget():
+        return CERTIFICATE_BATCH_DELAY
+    return int(
+        CERTIFICATE_ISSUANCE_WINDOW - time.time() % CERTIFICATE_ISSUANCE_WINDOW + 1
+    )
+
+
+def schedule_certificate_run(countdown=CERTIFICATE_RUN_DELAY):
+    from .tasks import manage_certificates
+
+    # a single delayed task handles every organization saved until it runs
+    if not cache.add(CERTIFICATE_RUN_SCHEDULED_KEY, 1, countdown):
+        return
+    try:
+        manage_certificates.apply_async(countdown=countdown)
+    except Exception:
+        cache.delete(CERTIFICATE_RUN_SCHEDULED_KEY)
+        # the next save or the certificates command runs it
+        logger.exception("Could not schedule the certificate manager")
+
+
+def request_certificate_run():
+    """
+    Run the certificate manager once the current transaction commits.
+    """
+    transaction.on_commit(schedule_certificate_run)
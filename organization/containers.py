@@ -0,0 +1,138 @@
+# organizations/containers.py
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import docker
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("celery")
+
+# characters of output kept in a result, the end of the output where the
+# errors are
+DOCKER_OUTPUT_LIMIT = getattr(settings, "DOCKER_OUTPUT_LIMIT", 2000)
+DOCKER_STATS_KEY = "docker:exec:{}:{}:{}"
+
+_client = None
+_containers = {}
+_lock = threading.Lock()
+
+
+class CommandResult(namedtuple("CommandResult", ["exit_code", "output"])):
+    """
+    Result of a command run in a container. Serialized as [exit_code, output]
+    by the json serializer of celery, output is text and truncated.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+
+def reset_docker_client():
+    global _client
+    with _lock:
+        _client = None
+        _containers.clear()
+
+
+# a forked celery worker opens its own connection to the docker socket
+os.register_at_fork(after_in_child=reset_docker_client)
+
+
+def get_docker_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = docker.from_env()
+    return _client
+
+
+def get_container(name):
+    container = _containers.get(name)
+    if container is None:
+        container = get_docker_client().containers.get(name)
+        _containers[name] = container
+    return container
+
+
+def truncate_output(output, limit=DOCKER_OUTPUT_LIMIT):
+    output = output.decode(errors="replace") if output else ""
+    if limit is not None and len(output) > limit:
+        return "..." + output[-limit:]
+    return output
+
+
+def get_program(command):
+    args = command.split() if isinstance(command, str) else command
+    return os.path.basename(args[0]) if args else ""
+
+
+def record_command(container_name, program, duration, exit_code):
+    logger.info(
+        "%s in %s exited with %s after %.3fs",
+        program,
+        container_name,
+        exit_code,
+        duration,
+        extra={
+            "container": container_name,
+            "program": program,
+            "exit_code": exit_code,
+            "duration": duration,
+        },
+    )
+    counters = {"count": 1, "milliseconds": int(duration * 1000)}
+    if exit_code != 0:
+        counters["failures"] = 1
+    for field, delta in counters.items():
+        key = DOCKER_STATS_KEY.format(container_name, program, field)
+        if not cache.add(key, delta, None):
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                pass
+
+
+def get_command_stats(container_name, program):
+    keys = {
+        field: DOCKER_STATS_KEY.format(container_name, program, field)
+        for field in ("count", "failures", "milliseconds")
+    }
+    values = cache.get_many(keys.values())
+    stats = {field: values.get(key, 0) for field, key in keys.items()}
+    stats["average_seconds"] = (
+        stats["milliseconds"] / stats["count"] / 1000 if stats["count"] else 0.0
+    )
+    return stats
+
+
+def exec_in_container(container_name, command, output_limit=DOCKER_OUTPUT_LIMIT):
+    """
+    Run command in a container through the docker client of the process and
+    return a CommandResult.
+    """
+    start = time.perf_counter()
+    try:
+        result = get_container(container_name).exec_run(
+            cmd=command, stdout=True, stderr=True
+        )
+    except docker.errors.NotFound:
+        # the container was recreated, the cached handle points at the old one
+        _containers.pop(container_name, None)
+        result = get_container(container_name).exec_run(
+            cmd=command, stdout=True, stderr=True
+        )
+    record_command(
+        container_name,
+        get_program(command),
+        time.perf_counter() - start,
+        result.exit_code,
+    )
+    return CommandResult(result.exit_code, truncate_output(result.output, output_limit))
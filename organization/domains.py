@@ -0,0 +1,78 @@
+# organizations/domains.py
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+from tentron.caches import tenant_cache
+
+logger = logging.getLogger("tentron")
+
+# resolver threads shared by the celery worker, a lookup past the timeout is
+# abandoned by the caller and finishes in its thread
+DNS_RESOLVER_POOL_SIZE = getattr(settings, "DNS_RESOLVER_POOL_SIZE", 4)
+DNS_RESOLVER_TIMEOUT = getattr(settings, "DNS_RESOLVER_TIMEOUT", 5)
+DNS_CACHE_TIMEOUT = getattr(settings, "DNS_CACHE_TIMEOUT", 60 * 5)
+# a domain that does not resolve yet is looked up again soon, the record may
+# be propagating
+DNS_NEGATIVE_CACHE_TIMEOUT = getattr(settings, "DNS_NEGATIVE_CACHE_TIMEOUT", 30)
+
+_resolver_pool = None
+_resolver_pool_lock = threading.Lock()
+
+
+def get_resolver_pool():
+    global _resolver_pool
+    if _resolver_pool is None:
+        with _resolver_pool_lock:
+            if _resolver_pool is None:
+                _resolver_pool = ThreadPoolExecutor(
+                    max_workers=DNS_RESOLVER_POOL_SIZE,
+                    thread_name_prefix="dns-resolver",
+                )
+    return _resolver_pool
+
+
+def get_dns_cache_key(domain):
+    return "dns:{}".format(domain.lower())
+
+
+def _lookup(domain):
+    infos = socket.getaddrinfo(domain, None, proto=socket.IPPROTO_TCP)
+    return sorted({info[4][0] for info in infos})
+
+
+def resolve(domain, timeout=DNS_RESOLVER_TIMEOUT):
+    """
+    Return the sorted IP addresses of domain, an empty list when it does not
+    resolve or the lookup takes longer than timeout seconds.
+    """
+    key = get_dns_cache_key(domain)
+    addresses = tenant_cache.get(key)
+    if addresses is not None:
+        return addresses
+
+    future = get_resolver_pool().submit(_lookup, domain)
+    try:
+        addresses = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        logger.warning("DNS lookup of %s timed out after %ss", domain, timeout)
+        addresses = []
+    except (OSError, UnicodeError) as e:
+        logger.info("DNS lookup of %s failed: %s", domain, e)
+        addresses = []
+    tenant_cache.set(
+        key, addresses, DNS_CACHE_TIMEOUT if addresses else DNS_NEGATIVE_CACHE_TIMEOUT
+    )
+    return addresses
+
+
+def invalidate_dns_cache(domain):
+    tenant_cache.delete(get_dns_cache_key(domain))
+
+
+def points_to_server(domain):
+    return settings.SERVER_IP in resolve(domain)
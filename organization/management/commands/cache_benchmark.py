@@ -0,0 +1,116 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+# rough size of a value stored in each alias, in bytes
+PAYLOAD_SIZES = {
+    "default": 512,
+    "tenant": 256,
+    "settings": 2048,
+    "fragments": 32 * 1024,
+    "renditions": 256,
+}
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the configured cache aliases under a synthetic multi-tenant load"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenants", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument(
+            "--keys-per-tenant",
+            type=int,
+            default=20,
+            help="Distinct keys each tenant reads from every alias",
+        )
+        parser.add_argument(
+            "--alias",
+            action="append",
+            dest="aliases",
+            help="Alias to benchmark, can be repeated. Defaults to all of CACHES",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def benchmark_alias(self, alias, options):
+        cache = caches[alias]
+        rng = random.Random(options["seed"])
+        payload = "x" * PAYLOAD_SIZES.get(alias, 512)
+        prefix = "benchmark:{}".format(alias)
+        get_times, set_times = [], []
+        hits = misses = 0
+        used_keys = set()
+
+        for _ in range(options["requests"]):
+            # a few tenants get most of the traffic, like in production
+            tenant = min(int(rng.paretovariate(1.2)) - 1, options["tenants"] - 1)
+            key = "{}:{}:{}".format(
+                prefix, tenant, rng.randrange(options["keys_per_tenant"])
+            )
+            used_keys.add(key)
+
+            start = time.perf_counter()
+            value = cache.get(key)
+            get_times.append(time.perf_counter() - start)
+            if value is not None:
+                hits += 1
+                continue
+
+            misses += 1
+            start = time.perf_counter()
+            cache.set(key, payload, 300)
+            set_times.append(time.perf_counter() - start)
+
+        cache.delete_many(list(used_keys))
+        total = hits + misses
+        return {
+            "hit_rate": hits / total if total else 0.0,
+            "get_p50": percentile(get_times, 50) * 1000,
+            "get_p99": percentile(get_times, 99) * 1000,
+            "set_p50": percentile(set_times, 50) * 1000,
+            "set_p99": percentile(set_times, 99) * 1000,
+        }
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or list(settings.CACHES)
+        unknown = set(aliases) - set(settings.CACHES)
+        if unknown:
+            raise CommandError("Unknown cache alias: {}".format(", ".join(unknown)))
+        if options["tenants"] < 1 or options["keys_per_tenant"] < 1:
+            raise CommandError("--tenants and --keys-per-tenant must be positive")
+
+        self.stdout.write(
+            "{:<12} {:<14} {:>8} {:>9} {:>9} {:>9} {:>9}".format(
+                "alias",
+                "backend",
+                "hit rate",
+                "get p50",
+                "get p99",
+                "set p50",
+                "set p99",
+            )
+        )
+        for alias in aliases:
+            result = self.benchmark_alias(alias, options)
+            self.stdout.write(
+                "{:<12} {:<14} {:>7.1%} {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms".format(
+                    alias,
+                    settings.CACHES[alias]["BACKEND"].rsplit(".", 1)[-1],
+                    result["hit_rate"],
+                    result["get_p50"],
+                    result["get_p99"],
+                    result["set_p50"],
+                    result["set_p99"],
+                )
+            )
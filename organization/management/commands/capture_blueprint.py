@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from wagtail.models import Site
+
+from organization.models import Blueprint
+
+
+class Command(BaseCommand):
+    help = (
+        "Save the pages, main menu and settings of a reference site as a "
+        "blueprint new organizations can start from"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("hostname", help="Hostname of the reference site")
+        parser.add_argument("name", help="Name of the blueprint, replaced if it exists")
+        parser.add_argument("--port", type=int, default=80)
+        parser.add_argument("--description", default="")
+
+    def handle(self, *args, **options):
+        site = Site.objects.filter(
+            hostname=options["hostname"], port=options["port"]
+        ).first()
+        if site is None:
+            raise CommandError(
+                "No site {}:{}".format(options["hostname"], options["port"])
+            )
+        blueprint = Blueprint.capture(
+            options["name"], site, description=options["description"]
+        )
+        self.stdout.write(
+            "Saved blueprint {} with {} pages".format(
+                blueprint.name, len(blueprint.data["pages"])
+            )
+        )
@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from organization.certificates import (
+    get_certificate_plan,
+    get_issuance_budget,
+    run_certificate_manager,
+    scan_certificates,
+)
+from organization.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Read the expiry of the certificates of the organizations and show "
+        "their status. With --run, also request, renew and delete one batch "
+        "of certificates within the Let's Encrypt budget"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--run",
+            action="store_true",
+            help="Run certbot for the next batch, as the celery task does",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list what the next batch would do",
+        )
+        parser.add_argument(
+            "--status",
+            action="append",
+            choices=[choice for choice, _ in Organization.CERTIFICATE_STATUS_CHOICES],
+            help="Only show the organizations with this status, can be repeated",
+        )
+
+    def write_plan(self, plan, left):
+        for action, organizations in zip(plan._fields, plan):
+            for organization in organizations:
+                self.stdout.write("{} {}".format(action, organization.domain))
+        if left:
+            self.stdout.write("{} left for the next runs".format(left))
+
+    def write_table(self, organizations, statuses):
+        now = timezone.now()
+        self.stdout.write(
+            "{:<40} {:<4} {:<9} {:<17} {:>5} {:<17} {}".format(
+                "domain", "ssl", "status", "expires", "days", "requested", "error"
+            )
+        )
+        counts = {}
+        for organization in organizations:
+            status = organization.certificate_status
+            counts[status] = counts.get(status, 0) + 1
+            if statuses and status not in statuses:
+                continue
+            expires_at = organization.certificate_expires_at
+            requested_at = organization.certificate_requested_at
+            self.stdout.write(
+                "{:<40} {:<4} {:<9} {:<17} {:>5} {:<17} {}".format(
+                    organization.domain,
+                    "yes" if organization.ssl_enabled else "no",
+                    status,
+                    expires_at.strftime("%Y-%m-%d %H:%M") if expires_at else "-",
+                    (expires_at - now).days if expires_at else "-",
+                    requested_at.strftime("%Y-%m-%d %H:%M") if requested_at else "-",
+                    organization.certificate_error.strip().split("\n")[-1],
+                )
+            )
+        self.stdout.write(
+            ", ".join(
+                "{} {}".format(count, status)
+                for status, count in sorted(counts.items())
+            )
+            or "no organization is served"
+        )
+
+    def handle(self, *args, **options):
+        if options["run"] and not options["dry_run"]:
+            plan, summary, left = run_certificate_manager()
+            self.write_plan(plan, left)
+            if summary:
+                self.stdout.write(
+                    "{issued} issued, {renewed} renewed, {removed} removed, "
+                    "{failed} failed".format(**summary)
+                )
+            organizations = scan_certificates()
+        else:
+            organizations = scan_certificates()
+            if options["dry_run"]:
+                self.write_plan(
+                    *get_certificate_plan(organizations, get_issuance_budget())
+                )
+        self.stdout.write(
+            "Issuance budget left in this window: {}".format(get_issuance_budget())
+        )
+        self.write_table(organizations, options["status"])
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from organization.models import Organization
+from organization.transfer import TRANSFER_CHUNK_SIZE, export_organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Export an organization with its pages, revisions, media, menus, "
+        "settings and members to a tar.gz archive"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("organization", help="Name or domain of the organization")
+        parser.add_argument("archive", help="Path of the tar.gz archive to write")
+        parser.add_argument("--chunk-size", type=int, default=TRANSFER_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        organization = Organization.objects.filter(
+            Q(name=options["organization"]) | Q(domain=options["organization"])
+        ).first()
+        if organization is None or organization.site is None:
+            raise CommandError(
+                "No provisioned organization {}".format(options["organization"])
+            )
+        with open(options["archive"], "wb") as archive:
+            counts = export_organization(
+                organization, archive, chunk_size=options["chunk_size"]
+            )
+        for label, count in counts.items():
+            if count and options["verbosity"] > 1:
+                self.stdout.write("{}: {}".format(label, count))
+        self.stdout.write(
+            "Exported {} rows of {} to {}".format(
+                sum(counts.values()), organization, options["archive"]
+            )
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from organization.transfer import TRANSFER_CHUNK_SIZE, import_organization
+
+
+class Command(BaseCommand):
+    help = "Create an organization from an archive of export_organization"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="Path of the tar.gz archive to read")
+        parser.add_argument("--name", help="Import the organization under this name")
+        parser.add_argument("--domain", help="Import the organization on this domain")
+        parser.add_argument("--chunk-size", type=int, default=TRANSFER_CHUNK_SIZE)
+        parser.add_argument(
+            "--map-user",
+            action="append",
+            default=[],
+            metavar="ARCHIVED=EXISTING",
+            help="Use the existing user EXISTING in place of the archived user "
+            "ARCHIVED, can be repeated",
+        )
+
+    def handle(self, *args, **options):
+        user_mapping = {}
+        for value in options["map_user"]:
+            archived, _, existing = value.partition("=")
+            if not archived or not existing:
+                raise CommandError("--map-user expects ARCHIVED=EXISTING")
+            user_mapping[archived] = existing
+        with open(options["archive"], "rb") as archive:
+            try:
+                organization = import_organization(
+                    archive,
+                    name=options["name"],
+                    domain=options["domain"],
+                    chunk_size=options["chunk_size"],
+                    user_mapping=user_mapping,
+                )
+            except ValueError as e:
+                raise CommandError(e)
+        self.stdout.write("Imported {} on {}".format(organization, organization.domain))
@@ -0,0 +1,216 @@
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from organization.containers import exec_in_container
+from organization.nginx import (
+    NGINX_CONTAINER,
+    NGINX_CONTAINER_SITES_AVAILABLE,
+    NGINX_SITES_AVAILABLE,
+    render_https_vhost,
+    render_locations,
+    render_tenants,
+)
+
+LAYOUTS = ("map", "server")
+SELF_SIGNED_CERTIFICATE = os.path.join(
+    settings.BASE_DIR, "nginx", "self-signed-ssl", "nginx-selfsigned.crt"
+)
+SELF_SIGNED_KEY = os.path.join(
+    settings.BASE_DIR, "nginx", "self-signed-ssl", "nginx-selfsigned.key"
+)
+
+MAIN_CONFIG = """
+worker_processes 1;
+pid {root}/nginx.pid;
+error_log {root}/error.log notice;
+events {{
+    worker_connections 1024;
+}}
+http {{
+    access_log off;
+    include {root}/sites/*;
+}}
+"""
+
+# times in milliseconds, the reload is done once the master logged the start
+# of its new workers
+MEASURE_SCRIPT = """
+cd {root} || exit 1
+now() {{ date +%s%N; }}
+for i in $(seq {repeat}); do
+    start=$(now)
+    {nginx} -t -q -c {root}/nginx.conf || exit 1
+    echo "parse $(( ($(now) - start) / 1000000 ))"
+done
+{nginx} -c {root}/nginx.conf || exit 1
+for i in $(seq {repeat}); do
+    before=$(grep -c "start worker processes" error.log)
+    start=$(now)
+    {nginx} -c {root}/nginx.conf -s reload
+    tries=0
+    while [ "$(grep -c "start worker processes" error.log)" -le "$before" ]; do
+        tries=$((tries + 1))
+        [ "$tries" -gt 6000 ] && echo "reload timed out" && exit 1
+        sleep 0.01
+    done
+    echo "reload $(( ($(now) - start) / 1000000 ))"
+done
+echo "rss $(awk '/VmRSS/ {{print $2}}' /proc/$(cat nginx.pid)/status)"
+{nginx} -c {root}/nginx.conf -s quit
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark nginx config parse and reload time, and master memory, with "
+        "the tenant vhost templates at growing numbers of tenants. The map "
+        "layout serves every tenant from the shared server of "
+        "tentron-tenants.conf, the server layout gives each tenant its own "
+        "https server block."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tenants",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help="Number of tenants to measure at",
+        )
+        parser.add_argument(
+            "--layout",
+            action="append",
+            dest="layouts",
+            choices=LAYOUTS,
+            help="Layout to measure, can be repeated. Defaults to both",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--port", type=int, default=18080)
+        parser.add_argument(
+            "--local",
+            action="store_true",
+            help="Run the nginx binary of this machine instead of the one of "
+            "the nginx container",
+        )
+        parser.add_argument("--nginx", default="nginx", help="nginx binary to run")
+
+    def write_configs(self, local_root, root, layout, tenants, options):
+        sites = os.path.join(local_root, "sites")
+        os.makedirs(sites)
+        with open(os.path.join(local_root, "nginx.conf"), "w") as f:
+            f.write(MAIN_CONFIG.format(root=root))
+        # without the microcache, its zone is the same whatever the layout and
+        # a local nginx could not create its directory
+        locations = os.path.join(root, "locations.inc")
+        with open(os.path.join(local_root, "locations.inc"), "w") as f:
+            f.write(render_locations(upstream="http://127.0.0.1:9", microcache_ttl=0))
+
+        domains = [
+            "tenant-{}.nginx-benchmark.invalid".format(number)
+            for number in range(tenants)
+        ]
+        if layout == "map":
+            with open(os.path.join(sites, "tentron-tenants.conf"), "w") as f:
+                f.write(
+                    render_tenants(
+                        domains,
+                        [],
+                        locations,
+                        port=options["port"],
+                        log_dir=root,
+                        microcache_ttl=0,
+                    )
+                )
+            return
+        shutil.copy(SELF_SIGNED_CERTIFICATE, os.path.join(local_root, "cert.pem"))
+        shutil.copy(SELF_SIGNED_KEY, os.path.join(local_root, "key.pem"))
+        for domain in domains:
+            with open(os.path.join(sites, domain + ".https.conf"), "w") as f:
+                f.write(
+                    render_https_vhost(
+                        domain,
+                        locations,
+                        certificate=os.path.join(root, "cert.pem"),
+                        certificate_key=os.path.join(root, "key.pem"),
+                        port=options["port"] + 1,
+                        ssl_options=False,
+                        log_dir=root,
+                    )
+                )
+
+    def run_script(self, script, options):
+        if options["local"]:
+            result = subprocess.run(
+                ["sh", "-c", script], capture_output=True, text=True
+            )
+            exit_code, output = result.returncode, result.stdout + result.stderr
+        else:
+            exit_code, output = exec_in_container(
+                NGINX_CONTAINER, ["sh", "-c", script], output_limit=None
+            )
+        if exit_code != 0:
+            raise CommandError("nginx failed: {}".format(output))
+        measures = {}
+        for line in output.splitlines():
+            name, _, value = line.partition(" ")
+            if name in ("parse", "reload", "rss"):
+                measures.setdefault(name, []).append(int(value))
+        return measures
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1 or min(options["tenants"]) < 1:
+            raise CommandError("--tenants and --repeat must be positive")
+        layouts = options["layouts"] or LAYOUTS
+        if "server" in layouts and not os.path.exists(SELF_SIGNED_CERTIFICATE):
+            raise CommandError(
+                "The server layout needs the certificate {}".format(
+                    SELF_SIGNED_CERTIFICATE
+                )
+            )
+
+        # the files are written here and read by nginx under root
+        if options["local"]:
+            base = tempfile.mkdtemp(prefix="nginx-benchmark-")
+            nginx_base = base
+        else:
+            base = os.path.join(NGINX_SITES_AVAILABLE, ".benchmark")
+            nginx_base = os.path.join(NGINX_CONTAINER_SITES_AVAILABLE, ".benchmark")
+            shutil.rmtree(base, ignore_errors=True)
+            os.makedirs(base)
+
+        self.stdout.write(
+            "{:>7} {:<7} {:>10} {:>10} {:>9}".format(
+                "tenants", "layout", "parse", "reload", "rss"
+            )
+        )
+        try:
+            for tenants in options["tenants"]:
+                for layout in layouts:
+                    name = "{}-{}".format(layout, tenants)
+                    root = os.path.join(nginx_base, name)
+                    self.write_configs(
+                        os.path.join(base, name), root, layout, tenants, options
+                    )
+                    measures = self.run_script(
+                        MEASURE_SCRIPT.format(
+                            root=root, repeat=options["repeat"], nginx=options["nginx"]
+                        ),
+                        options,
+                    )
+                    self.stdout.write(
+                        "{:>7} {:<7} {:>8}ms {:>8}ms {:>7}MB".format(
+                            tenants,
+                            layout,
+                            statistics.median(measures["parse"]),
+                            statistics.median(measures["reload"]),
+                            round(measures["rss"][-1] / 1024, 1),
+                        )
+                    )
+        finally:
+            shutil.rmtree(base, ignore_errors=True)
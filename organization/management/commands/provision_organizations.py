@@ -0,0 +1,43 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from organization.models import Organization
+from organization.tasks import provision_organization
+
+logger = logging.getLogger("tentron")
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue the provisioning of pending and failed organizations, each one "
+        "resumes after its last completed step"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--include-running",
+            action="store_true",
+            help="Also requeue organizations left running by a stopped worker",
+        )
+
+    def handle(self, *args, **options):
+        statuses = [
+            Organization.PROVISIONING_PENDING,
+            Organization.PROVISIONING_FAILED,
+        ]
+        if options["include_running"]:
+            Organization.objects.filter(
+                provisioning_status=Organization.PROVISIONING_RUNNING
+            ).update(provisioning_status=Organization.PROVISIONING_FAILED)
+
+        queued_count = 0
+        for organization_id in Organization.objects.filter(
+            provisioning_status__in=statuses
+        ).values_list("pk", flat=True):
+            provision_organization.delay(organization_id)
+            queued_count += 1
+        logger.info("Queued provisioning of {} organizations".format(queued_count))
+        self.stdout.write(
+            "Queued provisioning of {} organizations".format(queued_count)
+        )
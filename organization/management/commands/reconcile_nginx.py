@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from organization.nginx import reconcile_nginx_sites
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the nginx vhosts of the organizations, enable the http or https "
+        "one of each domain and reload nginx once if anything changed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the changes",
+        )
+
+    def handle(self, *args, **options):
+        changes = reconcile_nginx_sites(dry_run=options["dry_run"])
+        for action, names in (
+            ("write", changes.write),
+            ("remove", changes.remove),
+            ("enable", changes.enable),
+            ("disable", changes.disable),
+        ):
+            for name in names:
+                self.stdout.write("{} {}".format(action, name))
+        if not changes:
+            self.stdout.write("nginx is up to date")
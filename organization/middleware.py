@@ -1,9 +1,13 @@
 import logging
 
-from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import redirect, render
 
-from organization.models import ExtendedSite, Site
+from organization.page_cache import (
+    get_cached_response,
+    request_is_cacheable,
+    store_response,
+)
+from organization.tenant import get_tenant
 
 logger = logging.getLogger("tentron")
 
@@ -13,28 +17,15 @@ class ExtendedSiteMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
+        # resolve the tenant once, pages, blocks and views read request.tenant
+        tenant = get_tenant(request).record
         if request.user.is_superuser:
             return self.get_response(request)
-        current_site = Site.find_for_request(request)
         # get referrer info
         referrer = request.META.get("HTTP_REFERER", None)
         domain = request.get_host()
-        try:
-            e_site = ExtendedSite.objects.get(site=current_site)
-            # if organization active_status is False, redirect to the default site
-            if not e_site.organization.active_status:
-                logger.debug(
-                    "Organization is inactive or expired for %s, redirecting to subscription page",
-                    request.get_host(),
-                )
-                return render(
-                    request,
-                    "core/subscription.html",
-                    {"referrer": referrer, "domain": domain},
-                    status=404,
-                )
-
-        except ObjectDoesNotExist:
+
+        if tenant is None or not tenant.has_organization:
             # if dashboard url, redirect to the default site
             logger.debug(
                 "Extended Site not found for %s, redirecting to default site",
@@ -50,5 +41,41 @@ class ExtendedSiteMiddleware:
                 status=404,
             )
 
+        # if organization active_status is False or expired, redirect to the default site
+        if not tenant.is_active:
+            logger.debug(
+                "Organization is inactive or expired for %s, redirecting to subscription page",
+                request.get_host(),
+            )
+            return render(
+                request,
+                "core/subscription.html",
+                {"referrer": referrer, "domain": domain},
+                status=404,
+            )
+
+        response = self.get_response(request)
+        return response
+
+
+class PageCacheMiddleware:
+    """
+    Serve anonymous GET requests for wagtail pages from a per tenant cache.
+    Must come after ExtendedSiteMiddleware, so inactive tenants never reach it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tenant = get_tenant(request)
+        if tenant.site is None or not request_is_cacheable(request):
+            return self.get_response(request)
+
+        response = get_cached_response(request, tenant)
+        if response is not None:
+            return response
+
         response = self.get_response(request)
+        store_response(request, response)
         return response
@@ -0,0 +1,58 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("organization", "0013_organization_expiry_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="provisioning_error",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="provisioning_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                default="ready",
+                editable=False,
+                max_length=20,
+            ),
+        ),
+        # the existing organizations were provisioned synchronously
+        migrations.AlterField(
+            model_name="organization",
+            name="provisioning_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                editable=False,
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="provisioning_step",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Last completed provisioning step",
+                max_length=50,
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("organization", "0014_organization_provisioning"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blueprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("description", models.TextField(blank=True)),
+                ("data", models.JSONField(editable=False)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="blueprint",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Starter template of the site, the default pages are created without one.",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="organization.blueprint",
+            ),
+        ),
+    ]
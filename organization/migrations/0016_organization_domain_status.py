@@ -0,0 +1,46 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("organization", "0015_blueprint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="domain_checked_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="domain_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("verified", "Verified"),
+                    ("failed", "Not pointed to the server"),
+                ],
+                default="verified",
+                editable=False,
+                max_length=20,
+            ),
+        ),
+        # the domains of the existing organizations were checked on creation
+        migrations.AlterField(
+            model_name="organization",
+            name="domain_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("verified", "Verified"),
+                    ("failed", "Not pointed to the server"),
+                ],
+                default="pending",
+                editable=False,
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("organization", "0016_organization_domain_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="certificate_error",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="certificate_expires_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="certificate_requested_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="certificate_status",
+            field=models.CharField(
+                choices=[
+                    ("none", "None"),
+                    ("pending", "Pending"),
+                    ("valid", "Valid"),
+                    ("expiring", "Due for renewal"),
+                    ("expired", "Expired"),
+                    ("failed", "Failed"),
+                ],
+                default="none",
+                editable=False,
+                max_length=20,
+            ),
+        ),
+    ]
@@ -1,13 +1,9 @@
 # organizations/models.py
 import logging
-import os
 import re
-import socket
-import time
 import uuid
 from cProfile import run
 
-from celery import chain
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -28,15 +24,26 @@ from wagtail.contrib.settings.models import (
     register_setting,
 )
 from wagtail.fields import StreamField
+from wagtail.images import get_image_model
 from wagtail.images.blocks import ImageChooserBlock
 from wagtail.models import GroupPagePermission, Orderable, Page, Site
 from wagtail.models.collections import Collection, GroupCollectionPermission
 from wagtail.rich_text import RichText
+from wagtail.search import index
 from wagtailmenus.models import MenuPage
 from wagtailmodelchooser import Chooser, register_model_chooser
 from wagtailmodelchooser.blocks import ModelChooserBlock
 
-from .tasks import run_command_in_container
+from .blueprints import capture_blueprint, materialize_blueprint
+from .certificates import CERTBOT_CONTAINER, request_certificate_run
+from .domains import invalidate_dns_cache, points_to_server
+from .nginx import has_certificate, request_nginx_reconcile
+from .tasks import (
+    provision_organization,
+    run_command_in_container,
+    verify_organization_domain,
+)
+from .tenant import get_site_settings, get_tenant, invalidate_tenant_cache
 
 # from theme.models import Theme
 
@@ -72,6 +79,33 @@ class SiteSettingsTheme(Orderable):
         verbose_name_plural = _("Site Settings Themes")
 
 
+def _collect_chosen_objects(block, value, chosen):
+    if isinstance(block, blocks.StructBlock):
+        for name, child_block in block.child_blocks.items():
+            _collect_chosen_objects(child_block, value.get(name), chosen)
+    elif isinstance(block, blocks.ChooserBlock) and value is not None:
+        chosen[(block.model_class._meta.label_lower, value.pk)] = value
+
+
+def _restore_block_value(block, raw_value, chosen):
+    # same as block.to_python, but chooser values come from the chosen objects
+    if isinstance(block, blocks.StructBlock):
+        return block._to_struct_value(
+            [
+                (
+                    name,
+                    _restore_block_value(child_block, raw_value[name], chosen)
+                    if name in raw_value
+                    else child_block.get_default(),
+                )
+                for name, child_block in block.child_blocks.items()
+            ]
+        )
+    if isinstance(block, blocks.ChooserBlock):
+        return chosen.get((block.model_class._meta.label_lower, raw_value))
+    return block.to_python(raw_value)
+
+
 @register_setting
 class SiteSettings(ClusterableModel, BaseSiteSetting):
     # Basic Settings
@@ -342,6 +376,11 @@ class SiteSettings(ClusterableModel, BaseSiteSetting):
         ]
     )
 
+    # loaded with the settings, the base templates render all of them
+    select_related = ["site_logo", "site_favorite_icon", "default_social_image"]
+    snapshot_image_fields = ("site_logo", "site_favorite_icon", "default_social_image")
+    snapshot_stream_fields = ("contact_content", "social_media")
+
     class Meta:
         verbose_name = _("Site setting")
         verbose_name_plural = _("Site settings")
@@ -370,7 +409,7 @@ class SiteSettings(ClusterableModel, BaseSiteSetting):
         if hasattr(request, attr_name):
             return getattr(request, attr_name)
         site = Site.find_for_request(request)
-        site_settings = cls.for_site(site)
+        site_settings = get_site_settings(site)
         # to allow more efficient page url generation
         site_settings._request = request
         setattr(request, attr_name, site_settings)
@@ -379,6 +418,69 @@ class SiteSettings(ClusterableModel, BaseSiteSetting):
         #     raise PermissionDenied
         return site_settings
 
+    @classmethod
+    def build_snapshot(cls, site):
+        """
+        Load the settings of a site with everything the base templates touch:
+        images with their existing renditions, and decoded stream fields.
+        """
+        site_settings = cls.for_site(site)
+        site_settings.site = site
+
+        images = {}
+        for field_name in cls.snapshot_image_fields:
+            image = getattr(site_settings, field_name)
+            if image is not None:
+                image.prefetched_renditions = []
+                images.setdefault(image.id, []).append(image)
+        if images:
+            Rendition = get_image_model().get_rendition_model()
+            for rendition in Rendition.objects.filter(image_id__in=images):
+                for image in images[rendition.image_id]:
+                    image.prefetched_renditions.append(rendition)
+
+        for field_name in cls.snapshot_stream_fields:
+            # accessing the blocks converts the raw json, chooser blocks in bulk
+            list(getattr(site_settings, field_name) or [])
+        return site_settings
+
+    def __getstate__(self):
+        # blocks can not be pickled, keep the stream json and the objects chosen
+        # in it, __setstate__ rebuilds the decoded value without queries
+        state = super().__getstate__()
+        for field_name in self.snapshot_stream_fields:
+            value = state.get(field_name)
+            if isinstance(value, blocks.StreamValue):
+                chosen = {}
+                for child in value:
+                    _collect_chosen_objects(child.block, child.value, chosen)
+                state[field_name] = (value.get_prep_value(), chosen)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        for field_name in self.snapshot_stream_fields:
+            value = self.__dict__.get(field_name)
+            if isinstance(value, tuple):
+                raw_data, chosen = value
+                stream_block = self._meta.get_field(field_name).stream_block
+                self.__dict__[field_name] = blocks.StreamValue(
+                    stream_block,
+                    [
+                        (
+                            item["type"],
+                            _restore_block_value(
+                                stream_block.child_blocks[item["type"]],
+                                item["value"],
+                                chosen,
+                            ),
+                            item.get("id"),
+                        )
+                        for item in raw_data
+                        if item["type"] in stream_block.child_blocks
+                    ],
+                )
+
 
 @register_setting
 class FooterMenu(BaseSiteSetting):
@@ -493,6 +595,9 @@ class BasePage(MenuPage):
         FieldPanel("breadcrumb_background"),
         FieldPanel("disable_breadcrumb"),
     ]
+    search_fields = MenuPage.search_fields + [
+        index.FilterField("site"),
+    ]
 
     def user_can_view(self, user):
         group_name = self.site.extendedsite.organization.lower_name + " admins"
@@ -542,11 +647,7 @@ class BasePage(MenuPage):
         return current_page_count < cls.max_count_per_site
 
     def get_template(self, request, *args, **kwargs):
-
-        current_site = Site.find_for_request(request)
-
-        site_settings = SiteSettings.for_site(current_site)
-        template_folder = site_settings.site_settings_theme.first().template_folder
+        template_folder = get_tenant(request).template_folder
 
         template_name = f"{template_folder}/{self.template}"
         is_ajax = request.GET.get("is_ajax", None)
@@ -557,25 +658,19 @@ class BasePage(MenuPage):
         return template_name
 
     def get_landing_page_template(self, request, *args, **kwargs):
-
-        current_site = Site.find_for_request(request)
-
-        site_settings = SiteSettings.for_site(current_site)
-        template_folder = site_settings.site_settings_theme.first().template_folder
+        template_folder = get_tenant(request).template_folder
 
         return f"{template_folder}/{self.landing_page_template}"
 
     def get_context(self, request, *args, **kwargs):
         context = super().get_context(request, *args, **kwargs)
-
-        current_site = Site.find_for_request(request)
-
-        extended_site = ExtendedSite.objects.get(site=current_site)
+        tenant = get_tenant(request)
+        organization = tenant.organization
 
         context["organization"] = {
-            "name": extended_site.organization.name,
+            "name": organization.name if organization else None,
         }
-        context["tentron_current_site"] = current_site
+        context["tentron_current_site"] = tenant.site
 
         return context
 
@@ -604,6 +699,32 @@ class OrganizationRootPage(BasePage):
         verbose_name = "Organization Root Page"
 
 
+class Blueprint(models.Model):
+    """
+    A starter template for new organizations: the pages, main menu and
+    settings of a reference site, see organization.blueprints.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(blank=True)
+    data = models.JSONField(editable=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def capture(cls, name, site, description=""):
+        blueprint, created = cls.objects.update_or_create(
+            name=name,
+            defaults={"description": description, "data": capture_blueprint(site)},
+        )
+        return blueprint
+
+    def materialize(self, site, owner=None):
+        return materialize_blueprint(self.data, site, owner)
+
+
 class Organization(ClusterableModel, BaseModel):
     name = models.CharField(max_length=255, unique=True)
     domain = models.CharField(max_length=255, null=True, blank=True, unique=True)
@@ -613,6 +734,99 @@ class Organization(ClusterableModel, BaseModel):
     active_status = models.BooleanField(default=True)
     expiry_date = models.DateTimeField(null=True, blank=True)
     description = models.TextField(blank=True)
+    blueprint = models.ForeignKey(
+        Blueprint,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        help_text=_(
+            "Starter template of the site, the default pages are created "
+            "without one."
+        ),
+    )
+
+    PROVISIONING_PENDING = "pending"
+    PROVISIONING_RUNNING = "running"
+    PROVISIONING_READY = "ready"
+    PROVISIONING_FAILED = "failed"
+    PROVISIONING_STATUS_CHOICES = (
+        (PROVISIONING_PENDING, _("Pending")),
+        (PROVISIONING_RUNNING, _("Running")),
+        (PROVISIONING_READY, _("Ready")),
+        (PROVISIONING_FAILED, _("Failed")),
+    )
+    # run in this order by initialize_organization, see _provision_<step>
+    PROVISIONING_STEPS = (
+        "default_user",
+        "site",
+        "permissions",
+        "product_quote_page",
+        "default_pages",
+        "main_menu",
+        "nginx_config",
+    )
+    provisioning_status = models.CharField(
+        max_length=20,
+        choices=PROVISIONING_STATUS_CHOICES,
+        default=PROVISIONING_PENDING,
+        editable=False,
+    )
+    provisioning_step = models.CharField(
+        max_length=50,
+        blank=True,
+        editable=False,
+        help_text=_("Last completed provisioning step"),
+    )
+    provisioning_error = models.TextField(blank=True, editable=False)
+
+    DOMAIN_PENDING = "pending"
+    DOMAIN_VERIFIED = "verified"
+    DOMAIN_FAILED = "failed"
+    DOMAIN_STATUS_CHOICES = (
+        (DOMAIN_PENDING, _("Pending")),
+        (DOMAIN_VERIFIED, _("Verified")),
+        (DOMAIN_FAILED, _("Not pointed to the server")),
+    )
+    # set by verify_domain in a celery worker, the SSL certificate is only
+    # requested for a verified domain
+    domain_status = models.CharField(
+        max_length=20,
+        choices=DOMAIN_STATUS_CHOICES,
+        default=DOMAIN_PENDING,
+        editable=False,
+    )
+    domain_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    CERTIFICATE_NONE = "none"
+    CERTIFICATE_PENDING = "pending"
+    CERTIFICATE_VALID = "valid"
+    CERTIFICATE_EXPIRING = "expiring"
+    CERTIFICATE_EXPIRED = "expired"
+    CERTIFICATE_FAILED = "failed"
+    CERTIFICATE_STATUS_CHOICES = (
+        (CERTIFICATE_NONE, _("None")),
+        (CERTIFICATE_PENDING, _("Pending")),
+        (CERTIFICATE_VALID, _("Valid")),
+        (CERTIFICATE_EXPIRING, _("Due for renewal")),
+        (CERTIFICATE_EXPIRED, _("Expired")),
+        (CERTIFICATE_FAILED, _("Failed")),
+    )
+    # set by the certificate manager in a celery worker, see
+    # organization/certificates.py
+    certificate_status = models.CharField(
+        max_length=20,
+        choices=CERTIFICATE_STATUS_CHOICES,
+        default=CERTIFICATE_NONE,
+        editable=False,
+    )
+    certificate_expires_at = models.DateTimeField(
+        null=True, blank=True, editable=False
+    )
+    certificate_requested_at = models.DateTimeField(
+        null=True, blank=True, editable=False
+    )
+    certificate_error = models.TextField(blank=True, editable=False)
 
     panels = [
         FieldPanel("name"),
@@ -621,6 +835,7 @@ class Organization(ClusterableModel, BaseModel):
         FieldPanel("active_status"),
         FieldPanel("expiry_date"),
         FieldPanel("description"),
+        FieldPanel("blueprint"),
         InlinePanel("memberships", label="Members"),
     ]
 
@@ -638,26 +853,75 @@ class Organization(ClusterableModel, BaseModel):
                     _("Domain name is not valid, please check again.")
                 )
 
-    @transaction.atomic
     def initialize_organization(self):
-        default_user = self._create_default_user_and_membership()
-        (
-            new_site,
-            organization_root_page,
-            new_home_page,
-        ) = self._create_organization_site_and_root_page(default_user)
-        default_group = self._create_default_group_and_permissions(
-            default_user, organization_root_page
+        """
+        Run the provisioning steps not completed yet. Each step commits in its
+        own short transaction together with provisioning_step, so a failed or
+        interrupted run resumes after the last completed step.
+        """
+        if self.provisioning_step:
+            remaining = self.PROVISIONING_STEPS[
+                self.PROVISIONING_STEPS.index(self.provisioning_step) + 1 :
+            ]
+        else:
+            remaining = self.PROVISIONING_STEPS
+        self._set_provisioning_state(
+            provisioning_status=self.PROVISIONING_RUNNING, provisioning_error=""
         )
+        for step in remaining:
+            try:
+                with transaction.atomic():
+                    getattr(self, "_provision_" + step)()
+                    self._set_provisioning_state(provisioning_step=step)
+            except Exception as e:
+                logger.exception("Provisioning step %s of %s failed", step, self)
+                self._set_provisioning_state(
+                    provisioning_status=self.PROVISIONING_FAILED,
+                    provisioning_error="{}: {}".format(step, e),
+                )
+                raise
+        self._set_provisioning_state(provisioning_status=self.PROVISIONING_READY)
 
-        self._create_product_quote_page_and_fields(
-            default_user, new_site, new_home_page
-        )
-        self._create_default_pages_and_menu_items(
-            default_user, new_site, organization_root_page, new_home_page
+    def _set_provisioning_state(self, **values):
+        # update the columns only, save() would queue the certificate manager again
+        for field, value in values.items():
+            setattr(self, field, value)
+        Organization.all_objects.filter(pk=self.pk).update(**values)
+
+    def _provision_default_user(self):
+        self._create_default_user_and_membership()
+
+    def _provision_site(self):
+        self._create_organization_site_and_root_page(self.default_user)
+
+    def _provision_permissions(self):
+        self._create_default_group_and_permissions(
+            self.default_user, self.organization_root_page
         )
-        self._create_nginx_config_file()
-        self._create_nginx_ssl_config_file()
+
+    def _provision_product_quote_page(self):
+        # a blueprint brings its own quote page with the other pages
+        if self.blueprint_id is None:
+            self._create_product_quote_page_and_fields(
+                self.default_user, self.site, self.site.root_page
+            )
+
+    def _provision_default_pages(self):
+        if self.blueprint_id is None:
+            self._create_default_pages(
+                self.default_user, self.site, self.site.root_page
+            )
+        else:
+            self.blueprint.materialize(self.site, self.default_user)
+
+    def _provision_main_menu(self):
+        if self.blueprint_id is None:
+            self._create_main_menu(self.site, self.site.root_page)
+
+    def _provision_nginx_config(self):
+        request_nginx_reconcile()
+        if self.ssl_enabled:
+            request_certificate_run()
 
     def _create_default_user_and_membership(self):
         username = slugify(self.name)
@@ -689,8 +953,7 @@ class Organization(ClusterableModel, BaseModel):
         permissions = Permission.objects.filter(
             content_type__app_label=app_label, codename__in=codenames
         )
-        for permission in permissions:
-            group.permissions.add(permission)
+        group.permissions.add(*permissions)
 
     def _add_collection_permissions_to_group(
         self, group, collection, app_label, codenames
@@ -698,12 +961,14 @@ class Organization(ClusterableModel, BaseModel):
         permissions = Permission.objects.filter(
             content_type__app_label=app_label, codename__in=codenames
         )
-        for permission in permissions:
-            GroupCollectionPermission.objects.create(
-                group=group,
-                collection=collection,
-                permission=permission,
-            )
+        GroupCollectionPermission.objects.bulk_create(
+            [
+                GroupCollectionPermission(
+                    group=group, collection=collection, permission=permission
+                )
+                for permission in permissions
+            ]
+        )
 
     def _assign_default_group_permissions(self, default_group, organization_root_page):
         # 在这里添加分配默认组权限的代码
@@ -716,12 +981,16 @@ class Organization(ClusterableModel, BaseModel):
             "unlock",
         ]
 
-        for permission_type in wagtail_permission_types:
-            GroupPagePermission.objects.create(
-                group=default_group,
-                page=organization_root_page,
-                permission_type=permission_type,
-            )
+        GroupPagePermission.objects.bulk_create(
+            [
+                GroupPagePermission(
+                    group=default_group,
+                    page=organization_root_page,
+                    permission_type=permission_type,
+                )
+                for permission_type in wagtail_permission_types
+            ]
+        )
 
         # use organization name to create organization's collection, and assign default permissions to image, document, and collection management.
         # get root collection
@@ -877,15 +1146,17 @@ class Organization(ClusterableModel, BaseModel):
         ExtendedSite.objects.create(
             site=new_site, organization=self, template_folder="default"
         )
+        # only the site is written, verify_domain runs at the same time and
+        # its domain status must not be put back to the loaded value
         self.site = new_site
-        self.save(handle_ssl=False)
+        Organization.all_objects.filter(pk=self.pk).update(site=new_site)
+        # update() sends no post_save, a tenant record without site may be cached
+        invalidate_tenant_cache()
         return new_site, organization_root_page, new_home_page
 
     def _create_product_quote_page_and_fields(
         self, default_user, new_site, new_home_page
     ):
-        # 在这里添加创建产品报价页面和字段的代码
-
         ProductForm = apps.get_model("core", "ProductForm")
         ProductFormField = apps.get_model("core", "ProductFormField")
         product_quote_page = ProductForm(
@@ -899,688 +1170,159 @@ class Organization(ClusterableModel, BaseModel):
             search_description="Get a Quote",
         )
         new_home_page.add_child(instance=product_quote_page)
-        product_quote_page_first_name_field = ProductFormField(
-            label="First Name",
-            field_type="singleline",
-            required=True,
-            column_width=6,
-            page=product_quote_page,
-            sort_order=1,
-        )
-        product_quote_page_first_name_field.save()
-        product_quote_page_last_name_field = ProductFormField(
-            label="Last Name",
-            field_type="singleline",
-            required=True,
-            column_width=6,
-            page=product_quote_page,
-            sort_order=2,
-        )
-        product_quote_page_last_name_field.save()
-        product_quote_page_email_field = ProductFormField(
-            label="Email",
-            field_type="email",
-            required=True,
-            column_width=6,
-            page=product_quote_page,
-            sort_order=3,
-        )
-        product_quote_page_email_field.save()
-        product_quote_page_phone_number_field = ProductFormField(
-            label="Phone Number",
-            field_type="number",
-            required=True,
-            column_width=6,
-            page=product_quote_page,
-            sort_order=4,
-        )
-        product_quote_page_phone_number_field.save()
-        product_quote_page_message_field = ProductFormField(
-            label="Message",
-            field_type="multiline",
-            required=True,
-            column_width=12,
-            page=product_quote_page,
-            sort_order=5,
+        ProductFormField.objects.bulk_create(
+            [
+                ProductFormField(
+                    label=label,
+                    field_type=field_type,
+                    required=True,
+                    column_width=column_width,
+                    page=product_quote_page,
+                    sort_order=sort_order,
+                )
+                for sort_order, (label, field_type, column_width) in enumerate(
+                    [
+                        ("First Name", "singleline", 6),
+                        ("Last Name", "singleline", 6),
+                        ("Email", "email", 6),
+                        ("Phone Number", "number", 6),
+                        ("Message", "multiline", 12),
+                    ],
+                    start=1,
+                )
+            ]
         )
-        product_quote_page_message_field.save()
         # lock down product quote page
         # product_quote_page.locked = True
         # product_quote_page.locked_at = timezone.now()
         # # get superuser
         # superuser = get_user_model().objects.get(is_superuser=True)
         # product_quote_page.locked_by = superuser
-        product_quote_page.save()
-
-    def _create_default_pages_and_menu_items(
-        self, default_user, new_site, organization_root_page, new_home_page
-    ):
-        # 在这里添加创建默认页面的代码
+        return product_quote_page
 
-        # about page
-        AboutPage = apps.get_model("core", "AboutPage")
-        about_page = AboutPage(
-            title="About",
-            slug="about",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="About",
-            search_description="About",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=about_page)
-        about_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        about_page.save()
+    def _create_default_pages(self, default_user, new_site, new_home_page):
+        # (model, title, slug, extra fields) of the pages under the home page
+        default_pages = [
+            ("AboutPage", "About", "about", {}),
+            ("BlogListPage", "Blog", "blog", {}),
+            (
+                "ContactPage",
+                "Contact us",
+                "contact-us",
+                {
+                    "intro": "<p>Please fill out the form below to contact us.</p>",
+                    "thank_you_text": "<p>Thank you for your message. We will get back to you soon.</p>",
+                },
+            ),
+            ("FaqPage", "FAQ", "faq", {}),
+            ("ProductListPage", "Products", "products", {}),
+            ("ProjectListPage", "Projects", "projects", {}),
+            ("ServiceListPage", "Services", "services", {}),
+            ("TeamListPage", "Team", "team", {}),
+            ("ThankYouPage", "Thank You", "thank-you", {}),
+        ]
+        pages = {}
+        for model_name, title, slug, extra_fields in default_pages:
+            # the content is set before add_child so each page is written once
+            page = apps.get_model("core", model_name)(
+                title=title,
+                slug=slug,
+                site=new_site,
+                first_published_at=timezone.now(),
+                live=True,
+                owner=default_user,
+                seo_title=title,
+                search_description=title,
+                show_in_menus=True,
+                content=[
+                    (
+                        "rich_text",
+                        RichText("<p>This is demo body text, please change it.</p>"),
+                    )
+                ],
+                **extra_fields,
+            )
+            new_home_page.add_child(instance=page)
+            pages[slug] = page
 
-        # blog list page
-        BlogListPage = apps.get_model("core", "BlogListPage")
-        blog_list_page = BlogListPage(
-            title="Blog",
-            slug="blog",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Blog",
-            search_description="Blog",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=blog_list_page)
-        blog_list_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        blog_list_page.save()
-        # contact page
-        ContactPage = apps.get_model("core", "ContactPage")
-        contact_page = ContactPage(
-            title="Contact",
-            slug="contact",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Contact",
-            search_description="Contact",
-            show_in_menus=True,
-        )
         ## add default contact form to contact page, include first name, last name, email, phone number, message
-        ContactPage = apps.get_model("core", "ContactPage")
         ContactPageField = apps.get_model("core", "FormField")
-        contact_page = ContactPage(
-            title="Contact us",
-            slug="contact-us",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Contact us",
-            search_description="Contact us",
-            intro="<p>Please fill out the form below to contact us.</p>",
-            thank_you_text="<p>Thank you for your message. We will get back to you soon.</p>",
-            show_in_menus=True,
-        )
-
-        new_home_page.add_child(instance=contact_page)
-        contact_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        contact_page.save()
-        contact_page_first_name_field = ContactPageField(
-            label="First Name",
-            field_type="singleline",
-            required=True,
-            page=contact_page,
-            sort_order=1,
-        )
-        contact_page_first_name_field.save()
-        contact_page_last_name_field = ContactPageField(
-            label="Last Name",
-            field_type="singleline",
-            required=True,
-            page=contact_page,
-            sort_order=2,
-        )
-        contact_page_last_name_field.save()
-        contact_page_email_field = ContactPageField(
-            label="Email",
-            field_type="email",
-            required=True,
-            page=contact_page,
-            sort_order=3,
-        )
-        contact_page_email_field.save()
-        contact_page_phone_number_field = ContactPageField(
-            label="Phone Number",
-            field_type="number",
-            required=True,
-            page=contact_page,
-            sort_order=4,
-        )
-        contact_page_phone_number_field.save()
-        contact_page_message_field = ContactPageField(
-            label="Message",
-            field_type="multiline",
-            required=True,
-            page=contact_page,
-            sort_order=5,
-        )
-        contact_page_message_field.save()
-
-        # faq page
-        FaqPage = apps.get_model("core", "FaqPage")
-        faq_page = FaqPage(
-            title="FAQ",
-            slug="faq",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="FAQ",
-            search_description="FAQ",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=faq_page)
-        faq_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        faq_page.save()
-        # product list page
-        ProductListPage = apps.get_model("core", "ProductListPage")
-        product_list_page = ProductListPage(
-            title="Products",
-            slug="products",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Products",
-            search_description="Products",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=product_list_page)
-        product_list_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        product_list_page.save()
-
-        # project list page
-        ProjectListPage = apps.get_model("core", "ProjectListPage")
-        project_list_page = ProjectListPage(
-            title="Projects",
-            slug="projects",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Projects",
-            search_description="Projects",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=project_list_page)
-        project_list_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        project_list_page.save()
-
-        # service list page
-        ServiceListPage = apps.get_model("core", "ServiceListPage")
-        service_list_page = ServiceListPage(
-            title="Services",
-            slug="services",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Services",
-            search_description="Services",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=service_list_page)
-        service_list_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        service_list_page.save()
-
-        # team list page
-        TeamListPage = apps.get_model("core", "TeamListPage")
-        team_list_page = TeamListPage(
-            title="Team",
-            slug="team",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Team",
-            search_description="Team",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=team_list_page)
-        team_list_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
-        )
-        team_list_page.save()
-
-        # thank you page
-        ThankYouPage = apps.get_model("core", "ThankYouPage")
-        thank_you_page = ThankYouPage(
-            title="Thank You",
-            slug="thank-you",
-            site=new_site,
-            first_published_at=timezone.now(),
-            live=True,
-            owner=default_user,
-            seo_title="Thank You",
-            search_description="Thank You",
-            show_in_menus=True,
-        )
-        new_home_page.add_child(instance=thank_you_page)
-        thank_you_page.content.append(
-            ("rich_text", RichText("<p>This is demo body text, please change it.</p>"))
+        ContactPageField.objects.bulk_create(
+            [
+                ContactPageField(
+                    label=label,
+                    field_type=field_type,
+                    required=True,
+                    page=pages["contact-us"],
+                    sort_order=sort_order,
+                )
+                for sort_order, (label, field_type) in enumerate(
+                    [
+                        ("First Name", "singleline"),
+                        ("Last Name", "singleline"),
+                        ("Email", "email"),
+                        ("Phone Number", "number"),
+                        ("Message", "multiline"),
+                    ],
+                    start=1,
+                )
+            ]
         )
-        thank_you_page.save()
+        return pages
 
-        # main menu
+    def _create_main_menu(self, new_site, new_home_page):
+        # the pages are looked up by slug, the step may run in a later task
+        # than _create_default_pages
+        pages = {page.slug: page for page in new_home_page.get_children()}
         MainMenu = apps.get_model("organization_menu", "OrganizationMainMenu")
         main_menu = MainMenu.objects.create(
             site=new_site,
             max_levels=2,
         )
 
-        # main menu items
         MenuItem = apps.get_model("organization_menu", "OrganizationMainMenuItem")
-        home_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=new_home_page,
-            link_text="Home",
-            sort_order=1,
-        )
-        products_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=product_list_page,
-            link_text="Products",
-            sort_order=2,
-        )
-        about_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=about_page,
-            link_text="About",
-            sort_order=3,
-        )
-
-        faq_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=faq_page,
-            link_text="FAQ",
-            sort_order=4,
-        )
-
-        projects_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=project_list_page,
-            link_text="Projects",
-            sort_order=5,
-        )
-        services_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=service_list_page,
-            link_text="Services",
-            sort_order=6,
-        )
-        team_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=team_list_page,
-            link_text="Team",
-            sort_order=7,
-        )
-        contact_menu_item = MenuItem.objects.create(
-            menu=main_menu,
-            link_page=contact_page,
-            link_text="Contact",
-            sort_order=8,
+        menu_items = [
+            (new_home_page, "Home"),
+            (pages["products"], "Products"),
+            (pages["about"], "About"),
+            (pages["faq"], "FAQ"),
+            (pages["projects"], "Projects"),
+            (pages["services"], "Services"),
+            (pages["team"], "Team"),
+            (pages["contact-us"], "Contact"),
+        ]
+        MenuItem.objects.bulk_create(
+            [
+                MenuItem(
+                    menu=main_menu,
+                    link_page=link_page,
+                    link_text=link_text,
+                    sort_order=sort_order,
+                )
+                for sort_order, (link_page, link_text) in enumerate(
+                    menu_items, start=1
+                )
+            ]
         )
-
-    def _create_nginx_config_file(self):
-
-        template = """
-        # development
-        server {{
-
-            proxy_connect_timeout       300s;
-            proxy_send_timeout          300s;
-            proxy_read_timeout          300s;
-            send_timeout                300s;
-
-            listen 80;
-            server_name {domain};
-            #server_tokens off;
-            root /home/app/;
-            client_max_body_size 2048M;
-
-            error_page 500 502 503 504 /50x.html;
-            location = /50x.html {{
-                root /var/www/error_page;
-            }}
-            location / {{
-            # checks for static file, if not found proxy to app
-            try_files $uri @proxy_to_dev;
-            }}
-
-            location @proxy_to_dev {{
-            proxy_pass http://backend_app:9000;
-            proxy_set_header Host $http_host;
-            proxy_set_header X-Real-IP $remote_addr;
-            proxy_set_header X-Forwarded-Proto $scheme;
-            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-            proxy_set_header HTTP_X_FORWARDED_FOR $remote_addr;
-            # we don't want nginx trying to do something clever with
-            # redirects, we set the Host: header above already.
-            proxy_redirect off;
-
-            }}
-
-
-            location /static/ {{
-                alias /home/app/static/;
-            }}
-            location /media/ {{
-                alias /home/app/media/;
-            }}
-            #Css and Js
-            location ~* \.(css|js)$ {{
-                expires 365d;
-            }}
-            #Image
-            location ~* \.(jpg|jpeg|gif|png|webp|ico)$ {{
-                expires 365d;
-            }}
-
-            #Video
-            location ~* \.(mp4|mpeg|avi)$ {{
-                expires 365d;
-            }}
-
-
-            location /.well-known/acme-challenge/ {{
-                root /var/www/certbot;
-            }}
-            location = /favicon.ico {{
-                root  /home/app/media/default;
-            }}
-            access_log /var/log/nginx/{domain}.access.dev.log;
-            error_log /var/log/nginx/{domain}.error.dev.log;
-        }}
-
-        """
-        config = template.format(domain=self.domain)
-        with open(
-            "/home/tentron/nginx/sites-available/{}.http.conf".format(self.domain), "w"
-        ) as f:
-            f.write(config)
-        chain(
-            run_command_in_container.s(
-                None,
-                "tentron_nginx",
-                "ln -s /etc/nginx/sites-available/{}.http.conf /etc/nginx/sites-enabled/".format(
-                    self.domain
-                ),
-            ),
-            run_command_in_container.s("tentron_nginx", "nginx -t"),
-            run_command_in_container.s("tentron_nginx", "nginx -s reload"),
-        ).apply_async()
-
-    def _remove_nginx_config_file(self):
-        chain(
-            run_command_in_container.s(
-                None,
-                "tentron_nginx",
-                "rm /etc/nginx/sites-enabled/{}.http.conf".format(self.domain),
-            ),
-            run_command_in_container.s(
-                "tentron_nginx",
-                "rm /etc/nginx/sites-available/{}.http.conf".format(self.domain),
-            ),
-            run_command_in_container.s("tentron_nginx", "nginx -t"),
-            run_command_in_container.s("tentron_nginx", "nginx -s reload"),
-        ).apply_async()
-
-    def _create_nginx_ssl_config_file(self):
-        # create ssl config for later use
-        template = """
-        # production
-        server {{
-
-            listen 80;
-            server_name  {domain};
-            charset     utf-8;
-
-            client_max_body_size 2048M;
-
-            location /.well-known/acme-challenge/ {{
-                root /var/www/certbot;
-            }}
-            
-            location / {{
-                return 301 https://{domain}$request_uri;
-            }}
-
-        }}
-
-        # Production www 443
-        server {{
-
-            proxy_connect_timeout       300s;
-            proxy_send_timeout          300s;
-            proxy_read_timeout          300s;
-            send_timeout                300s;
-
-            listen 443 ssl;
-            http2 on;
-            server_name {domain};
-            #server_tokens off;
-            root /home/app/;
-            client_max_body_size 2048M;
-
-            ssl_certificate /etc/letsencrypt/live/{domain}/fullchain.pem;
-            ssl_certificate_key /etc/letsencrypt/live/{domain}/privkey.pem;
-
-            include /etc/letsencrypt/options-ssl-nginx.conf;
-            ssl_dhparam /etc/letsencrypt/ssl-dhparams.pem;
-
-            error_page 500 502 503 504 /50x.html;
-            location = /50x.html {{
-                root /var/www/error_page;
-            }}
-
-            location / {{
-            # checks for static file, if not found proxy to app
-            try_files $uri @proxy_to_prod;
-            }}
-
-            location @proxy_to_prod {{
-            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-            proxy_set_header X-Forwarded-Proto $scheme;
-            proxy_set_header Host $http_host;
-            # we don't want nginx trying to do something clever with
-            # redirects, we set the Host: header above already.
-            proxy_redirect off;
-            proxy_pass http://backend_app:9000;
-            }}
-
-
-
-            location /static/ {{
-                alias /home/app/static/;
-            }}
-            location /media/ {{
-                alias /home/app/media/;
-            }}
-            #Css and Js
-            location ~* \.(css|js)$ {{
-                expires 365d;
-            }}
-            #Image
-            location ~* \.(jpg|jpeg|gif|png|webp|ico)$ {{
-                expires 365d;
-            }}
-
-            #Video
-            location ~* \.(mp4|mpeg|avi)$ {{
-                expires 365d;
-            }}
-
-
-            location /.well-known/acme-challenge/ {{
-                root /var/www/certbot;
-            }}
-            location = /favicon.ico {{
-                root  /home/app/media/default;
-            }}
-
-            access_log /var/log/nginx/{domain}.https.log;
-            error_log /var/log/nginx/{domain}.https.log;
-        }}
-
-
-        """
-        config = template.format(domain=self.domain)
-        with open(
-            "/home/tentron/nginx/sites-available/{}.https.conf".format(self.domain), "w"
-        ) as f:
-            f.write(config)
-
-    def _remove_nginx_ssl_config_file(self):
-        chain(
-            run_command_in_container.s(
-                None,
-                "tentron_nginx",
-                "rm /etc/nginx/sites-enabled/{}.https.conf".format(self.domain),
-            ),
-            run_command_in_container.s(
-                "tentron_nginx",
-                "rm /etc/nginx/sites-available/{}.https.conf".format(self.domain),
-            ),
-            run_command_in_container.s("tentron_nginx", "nginx -t"),
-            run_command_in_container.s("tentron_nginx", "nginx -s reload"),
-            run_command_in_container.s(
-                "CertBot",
-                "certbot delete --cert-name {} --non-interactive".format(self.domain),
-            ),
-        ).apply_async()
-
-    def _apply_ssl_certificate(self):
-        print("apply ssl certificate")
-        # apply ssl certificate
-        # For development use --test-cert to avoid rate limit
-        if settings.DEBUG:
-            test_command = "certbot certonly --webroot -w /var/www/certbot \
-                    --test-cert \
-                    --register-unsafely-without-email \
-                    -d {} \
-                    --rsa-key-size 4096 \
-                    --agree-tos \
-                    --force-renewal".format(
-                self.domain
-            )
-        else:
-            # For production use dry-run test network
-            test_command = "certbot certonly --webroot -w /var/www/certbot \
-                        --dry-run \
-                        --register-unsafely-without-email \
-                        -d {} \
-                        --rsa-key-size 4096 \
-                        --agree-tos \
-                        --force-renewal".format(
-                self.domain
-            )
-        if settings.DEBUG:
-            # For development use --test-cert to avoid rate limit
-            apply_command = "certbot certonly --webroot -w /var/www/certbot \
-                --test-cert \
-                --register-unsafely-without-email \
-                -d {} \
-                --rsa-key-size 4096 \
-                --agree-tos \
-                --force-renewal".format(
-                self.domain
-            )
-        else:
-            # For production use
-            apply_command = "certbot certonly --webroot -w /var/www/certbot \
-                --register-unsafely-without-email \
-                -d {} \
-                --rsa-key-size 4096 \
-                --agree-tos \
-                --force-renewal".format(
-                self.domain
-            )
-        chain(
-            run_command_in_container.s(None, "CertBot", test_command),
-            run_command_in_container.s("CertBot", apply_command),
-            run_command_in_container.s(
-                "tentron_nginx",
-                "rm /etc/nginx/sites-enabled/{}.http.conf".format(self.domain),
-            ),
-            run_command_in_container.s(
-                "tentron_nginx",
-                "ln -s /etc/nginx/sites-available/{}.https.conf /etc/nginx/sites-enabled/".format(
-                    self.domain
-                ),
-            ),
-            run_command_in_container.s("tentron_nginx", "nginx -t"),
-            run_command_in_container.s("tentron_nginx", "nginx -s reload"),
-        ).apply_async()
-
-    def _renew_ssl_certificate(self):
-        print("renew ssl certificate")
-        pass
+        return main_menu
 
     def _remove_ssl_certificate(self):
-        # Remove ssl certificate config files, link to http config file
-        chain(
-            run_command_in_container.s(
-                None,
-                "tentron_nginx",
-                "rm /etc/nginx/sites-enabled/{}.https.conf".format(self.domain),
-            ),
-            run_command_in_container.s(
-                "tentron_nginx",
-                "ln -s /etc/nginx/sites-available/{}.http.conf /etc/nginx/sites-enabled/".format(
-                    self.domain
-                ),
-            ),
-            run_command_in_container.s("tentron_nginx", "nginx -t"),
-            run_command_in_container.s("tentron_nginx", "nginx -s reload"),
-            run_command_in_container.s(
-                "CertBot",
-                "certbot delete --cert-name {} --non-interactive".format(self.domain),
-            ),
-        ).apply_async()
+        # the certificate manager would not find the renamed domain, used by
+        # delete
+        if has_certificate(self.domain):
+            run_command_in_container.apply_async(
+                (
+                    None,
+                    CERTBOT_CONTAINER,
+                    "certbot delete --cert-name {} --non-interactive".format(
+                        self.domain
+                    ),
+                )
+            )
 
     def shutdown_organization(self):
-
-        # remove organization from nginx config file
-        run_command_in_container.apply_async(
-            (
-                None,
-                "tentron_nginx",
-                "rm /etc/nginx/sites-enabled/{}.http.conf".format(self.domain),
-            ),
-        )
-
-        run_command_in_container.apply_async(
-            (
-                None,
-                "tentron_nginx",
-                "rm /etc/nginx/sites-enabled/{}.https.conf".format(self.domain),
-            ),
-        )
-
-        run_command_in_container.apply_async((None, "tentron_nginx", "nginx -s reload"))
-        # shutdown organization
+        # the renamed domain is not served anymore, save requests the nginx
+        # reconcile which removes its vhosts
         self.active_status = False
         self.domain = "deleted-" + uuid.uuid4().hex + "-" + self.domain
         self.save(handle_ssl=False)
@@ -1589,54 +1331,97 @@ class Organization(ClusterableModel, BaseModel):
     def lower_name(self):
         return self.name.lower()
 
+    @property
+    def default_user(self):
+        membership = (
+            OrganizationMembership.objects.filter(organization=self)
+            .select_related("user")
+            .order_by("sort_order")
+            .first()
+        )
+        return membership.user if membership else None
+
+    @property
+    def organization_root_page(self):
+        return OrganizationRootPage.objects.get(site=self.site)
+
     def save(self, handle_ssl=True, *args, **kwargs):
         is_new = self.pk is None
+        previous_domain = previous_ssl_enabled = None
+        if not is_new:
+            previous = (
+                Organization.all_objects.filter(pk=self.pk)
+                .values_list("domain", "ssl_enabled")
+                .first()
+            )
+            if previous is not None:
+                previous_domain, previous_ssl_enabled = previous
+        # a new or changed domain, or one that failed before, is checked again
+        verify_domain = (
+            bool(self.domain)
+            and not self.domain.startswith("deleted-")
+            and self.active_status
+            and (
+                self.domain != previous_domain
+                or (handle_ssl and self.domain_status != self.DOMAIN_VERIFIED)
+            )
+        )
+        if verify_domain:
+            self.domain_status = self.DOMAIN_PENDING
         super().save(*args, **kwargs)
+        if verify_domain:
+            # the check resolves the domain again, the admin may just have
+            # fixed its DNS records
+            invalidate_dns_cache(self.domain)
+            # the DNS lookup runs in a celery worker, not on the request thread
+            transaction.on_commit(lambda: verify_organization_domain.delay(self.pk))
         if is_new:
-            # if environment is production, use target ip otherwise disable this function for develop.
-            if not settings.DEBUG:
-                self._check_domain_name()
-
-            self.initialize_organization()
-
-        # Handle SSL certificate only if not a new instance
-        elif handle_ssl:
-            if self.ssl_enabled:
-                self._handle_ssl_certificate()
-            else:
-                self._remove_ssl_certificate()
-
-    def _check_domain_name(self):
-        target_ip = settings.SERVER_IP
-        try:
-            ip_address = socket.gethostbyname(self.domain)
-
-            if ip_address != target_ip:
-                raise ValidationError(
-                    "Domain name is not pointed to the correct ip address."
-                )
-        except (socket.gaierror, Exception) as e:
-            print(e)
-            logger.error(e)
-            raise ValidationError(
-                "Domain name is not pointed to the correct ip address."
+            # the site, pages and nginx config are created by a celery worker,
+            # see initialize_organization for the steps
+            transaction.on_commit(lambda: provision_organization.delay(self.pk))
+            return
+
+        if self.domain != previous_domain or self.ssl_enabled != previous_ssl_enabled:
+            # the vhosts follow the domain and the SSL setting
+            request_nginx_reconcile()
+        if handle_ssl and (self.ssl_enabled or previous_ssl_enabled):
+            # certbot runs in the certificate manager, it requests, renews or
+            # deletes the certificates of every organization in batches
+            request_certificate_run()
+
+    def verify_domain(self):
+        """
+        Check that the domain points to the server and record the result.
+        The certificate manager runs on the transition to verified.
+        Return whether the domain is verified.
+        """
+        # in development the domain is not checked
+        verified = settings.DEBUG or points_to_server(self.domain)
+        status = self.DOMAIN_VERIFIED if verified else self.DOMAIN_FAILED
+        # a concurrent check or a change of domain wins over this result
+        changed = (
+            Organization.all_objects.filter(pk=self.pk, domain=self.domain)
+            .exclude(domain_status=status)
+            .update(domain_status=status, domain_checked_at=timezone.now())
+        )
+        self.domain_status = status
+        if not changed:
+            Organization.all_objects.filter(pk=self.pk, domain=self.domain).update(
+                domain_checked_at=timezone.now()
             )
-
-    def _handle_ssl_certificate(self):
-        cert_path = "/etc/letsencrypt/live/{}/fullchain.pem".format(self.domain)
-        privkey_path = "/etc/letsencrypt/live/{}/privkey.pem".format(self.domain)
-
-        if os.path.exists(cert_path) and os.path.exists(privkey_path):
-            self._renew_ssl_certificate_if_needed(cert_path)
-        else:
-            self._apply_ssl_certificate()
-
-    def _renew_ssl_certificate_if_needed(self, cert_path):
-        if os.path.getmtime(cert_path) < time.time() - 60 * 60 * 24 * 30:
-            logger.info("Renewing SSL certificate for %s", self.domain)
-            self._renew_ssl_certificate()
+            return verified
+        if verified:
+            logger.info("Domain %s of %s is verified", self.domain, self)
+            if self.ssl_enabled:
+                request_certificate_run()
         else:
-            logger.info("Certificate is not older than 30 days, do nothing")
+            logger.warning(
+                "Domain %s of %s is not pointed to %s",
+                self.domain,
+                self,
+                settings.SERVER_IP,
+            )
+        return verified
 
     def delete(self, *args, **kwargs):
         # delete organization root page
@@ -1698,12 +1483,8 @@ class Organization(ClusterableModel, BaseModel):
             logger.error("Default group not found")
             pass
 
-        try:
-            self._remove_nginx_config_file()
-            self._remove_nginx_ssl_config_file()
-        except:
-            logger.error("Nginx config file not found")
-            pass
+        # the vhosts of the renamed domain are removed by the nginx reconcile
+        self._remove_ssl_certificate()
 
         self.name = "deleted-" + uuid.uuid4().hex + "-" + self.name
         self.domain = "deleted-" + uuid.uuid4().hex + "-" + self.domain
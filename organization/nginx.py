@@ -0,0 +1,453 @@
+# organizations/nginx.py
+import hashlib
+import logging
+import os
+import shlex
+import tempfile
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils.encoding import iri_to_uri
+
+from .containers import exec_in_container
+from .page_cache import PAGE_CACHE_EXCLUDED_PATHS
+
+logger = logging.getLogger("tentron")
+
+NGINX_CONTAINER = getattr(settings, "NGINX_CONTAINER", "tentron_nginx")
+# sites-available is a volume shared with the nginx container, the app writes
+# the vhosts there and nginx reads them under NGINX_CONTAINER_SITES_AVAILABLE
+NGINX_SITES_AVAILABLE = getattr(
+    settings, "NGINX_SITES_AVAILABLE", "/home/tentron/nginx/sites-available"
+)
+NGINX_CONTAINER_SITES_AVAILABLE = getattr(
+    settings, "NGINX_CONTAINER_SITES_AVAILABLE", "/etc/nginx/sites-available"
+)
+NGINX_CONTAINER_SITES_ENABLED = getattr(
+    settings, "NGINX_CONTAINER_SITES_ENABLED", "/etc/nginx/sites-enabled"
+)
+LETSENCRYPT_LIVE = getattr(settings, "LETSENCRYPT_LIVE", "/etc/letsencrypt/live")
+
+# seconds the worker waits before reconciling, the tenant changes made
+# meanwhile are applied with a single reload
+NGINX_RECONCILE_DELAY = getattr(settings, "NGINX_RECONCILE_DELAY", 10)
+NGINX_RECONCILE_SCHEDULED_KEY = "nginx:reconcile:scheduled"
+NGINX_RECONCILE_LOCK_KEY = "nginx:reconcile:lock"
+NGINX_RECONCILE_LOCK_TIMEOUT = 60 * 5
+
+NGINX_UPSTREAM = getattr(settings, "NGINX_UPSTREAM", "http://backend_app:9000")
+NGINX_LOG_DIR = getattr(settings, "NGINX_LOG_DIR", "/var/log/nginx")
+NGINX_OPEN_FILE_CACHE_MAX = getattr(settings, "NGINX_OPEN_FILE_CACHE_MAX", 10000)
+
+# seconds nginx serves an anonymous response without asking the app, 0 turns
+# the microcache off. The cache lives in the nginx container.
+NGINX_MICROCACHE_TTL = getattr(settings, "NGINX_MICROCACHE_TTL", 5)
+NGINX_MICROCACHE_PATH = getattr(
+    settings, "NGINX_MICROCACHE_PATH", "/var/cache/nginx/tentron"
+)
+NGINX_MICROCACHE_ZONE_SIZE = getattr(settings, "NGINX_MICROCACHE_ZONE_SIZE", "10m")
+NGINX_MICROCACHE_MAX_SIZE = getattr(settings, "NGINX_MICROCACHE_MAX_SIZE", "1g")
+# the python side of the key is get_microcache_key, keep them in line
+NGINX_MICROCACHE_KEY = "$scheme://$host$request_uri|$tentron_ajax"
+NGINX_MICROCACHE_SCHEMES = ("http", "https")
+NGINX_MICROCACHE_VARIANTS = ("", "ajax")
+
+# organization/templates/organization/nginx/, bump the version with them
+NGINX_TEMPLATE_VERSION = 3
+NGINX_TEMPLATE_HEADER = (
+    "generated by tentron from organization/nginx/{name} (version {version}), "
+    "changes are overwritten"
+)
+
+# the files of sites-available owned by the reconciler, the others
+# (tentron.conf) are left alone. Version 1 wrote a .http.conf per tenant, the
+# reconciler removes them.
+NGINX_LOCATIONS_FILE = "tentron-locations.inc"
+NGINX_TENANTS_FILE = "tentron-tenants.conf"
+HTTP_VHOST_SUFFIX = ".http.conf"
+HTTPS_VHOST_SUFFIX = ".https.conf"
+
+
+class NginxChanges(
+    namedtuple("NginxChanges", ["write", "remove", "enable", "disable"])
+):
+    """
+    Difference between the vhosts of the organizations and the files on disk:
+    {file name: config} to write to sites-available, file names to remove from
+    it, and the links to add to or remove from sites-enabled.
+    """
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return any(self)
+
+
+def is_managed_file_name(name):
+    return (
+        name in (NGINX_LOCATIONS_FILE, NGINX_TENANTS_FILE)
+        or name.endswith(HTTP_VHOST_SUFFIX)
+        or name.endswith(HTTPS_VHOST_SUFFIX)
+    )
+
+
+def has_certificate(domain):
+    live = os.path.join(LETSENCRYPT_LIVE, domain)
+    return os.path.exists(os.path.join(live, "fullchain.pem")) and os.path.exists(
+        os.path.join(live, "privkey.pem")
+    )
+
+
+def get_served_organizations():
+    Organization = apps.get_model("organization", "Organization")
+    return (
+        Organization.objects.exclude(Q(domain__isnull=True) | Q(domain=""))
+        # shutdown_organization and delete rename the domain
+        .exclude(domain__startswith="deleted-")
+        # the vhost is created by the last provisioning step
+        .filter(
+            Q(provisioning_status=Organization.PROVISIONING_READY)
+            | Q(provisioning_step="nginx_config")
+        )
+        .only("domain", "ssl_enabled")
+        .order_by("domain")
+    )
+
+
+def render_nginx_template(name, **context):
+    context["header"] = NGINX_TEMPLATE_HEADER.format(
+        name=name, version=NGINX_TEMPLATE_VERSION
+    )
+    return render_to_string("organization/nginx/" + name, context)
+
+
+def get_microcache_context(microcache_ttl=NGINX_MICROCACHE_TTL):
+    return {
+        "microcache_ttl": microcache_ttl,
+        "microcache_key": NGINX_MICROCACHE_KEY,
+        "microcache_path": NGINX_MICROCACHE_PATH,
+        "microcache_zone_size": NGINX_MICROCACHE_ZONE_SIZE,
+        "microcache_max_size": NGINX_MICROCACHE_MAX_SIZE,
+        "bypass_cookies": "|".join(
+            [settings.SESSION_COOKIE_NAME, settings.CSRF_COOKIE_NAME, "messages"]
+        ),
+        "bypass_paths": "|".join(path.strip("/") for path in PAGE_CACHE_EXCLUDED_PATHS),
+    }
+
+
+def render_locations(upstream=NGINX_UPSTREAM, microcache_ttl=NGINX_MICROCACHE_TTL):
+    return render_nginx_template(
+        "locations.conf",
+        upstream=upstream,
+        open_file_cache_max=NGINX_OPEN_FILE_CACHE_MAX,
+        **get_microcache_context(microcache_ttl)
+    )
+
+
+def render_tenants(
+    http_domains,
+    https_domains,
+    locations,
+    port=80,
+    log_dir=NGINX_LOG_DIR,
+    microcache_ttl=NGINX_MICROCACHE_TTL,
+):
+    return render_nginx_template(
+        "tenants.conf",
+        http_domains=http_domains,
+        https_domains=https_domains,
+        locations=locations,
+        port=port,
+        log_dir=log_dir,
+        hash_max_size=max(1024, 2 * (len(http_domains) + len(https_domains))),
+        **get_microcache_context(microcache_ttl)
+    )
+
+
+def render_https_vhost(
+    domain,
+    locations,
+    certificate=None,
+    certificate_key=None,
+    port=443,
+    ssl_options=True,
+    log_dir=NGINX_LOG_DIR,
+):
+    live = "/etc/letsencrypt/live/{}".format(domain)
+    return render_nginx_template(
+        "https.conf",
+        domain=domain,
+        locations=locations,
+        certificate=certificate or live + "/fullchain.pem",
+        certificate_key=certificate_key or live + "/privkey.pem",
+        port=port,
+        ssl_options=ssl_options,
+        log_dir=log_dir,
+    )
+
+
+def render_vhosts(organizations):
+    """
+    Return the desired state of nginx: {file name: config} of sites-available
+    and the set of file names enabled. The http tenants share the server of
+    NGINX_TENANTS_FILE, a tenant gets its own https server block once its
+    certificate exists.
+    """
+    http_domains = []
+    https_domains = []
+    for organization in organizations:
+        if organization.ssl_enabled and has_certificate(organization.domain):
+            https_domains.append(organization.domain)
+        else:
+            http_domains.append(organization.domain)
+    if not http_domains and not https_domains:
+        return {}, set()
+
+    locations = os.path.join(NGINX_CONTAINER_SITES_AVAILABLE, NGINX_LOCATIONS_FILE)
+    available = {
+        NGINX_LOCATIONS_FILE: render_locations(),
+        NGINX_TENANTS_FILE: render_tenants(http_domains, https_domains, locations),
+    }
+    enabled = {NGINX_TENANTS_FILE}
+    for domain in https_domains:
+        name = domain + HTTPS_VHOST_SUFFIX
+        available[name] = render_https_vhost(domain, locations)
+        enabled.add(name)
+    return available, enabled
+
+
+def read_sites_available():
+    available = {}
+    for name in os.listdir(NGINX_SITES_AVAILABLE):
+        if is_managed_file_name(name):
+            with open(os.path.join(NGINX_SITES_AVAILABLE, name)) as f:
+                available[name] = f.read()
+    return available
+
+
+def read_sites_enabled():
+    result = exec_in_container(
+        NGINX_CONTAINER, ["ls", "-1", NGINX_CONTAINER_SITES_ENABLED], output_limit=None
+    )
+    if not result.ok:
+        raise RuntimeError(
+            "Could not list {}: {}".format(NGINX_CONTAINER_SITES_ENABLED, result.output)
+        )
+    return {name for name in result.output.split() if is_managed_file_name(name)}
+
+
+def diff_vhosts(desired_available, desired_enabled, available, enabled):
+    return NginxChanges(
+        write={
+            name: config
+            for name, config in sorted(desired_available.items())
+            if available.get(name) != config
+        },
+        remove=sorted(set(available) - set(desired_available)),
+        enable=sorted(desired_enabled - enabled),
+        disable=sorted(enabled - desired_enabled),
+    )
+
+
+def get_apply_script(changes):
+    """
+    Shell script run in the nginx container: switch the links of
+    sites-enabled, then test the configuration once and reload, or put the
+    links back when the test fails.
+    """
+
+    def link(name):
+        return "ln -sfn {} {}".format(
+            shlex.quote(os.path.join(NGINX_CONTAINER_SITES_AVAILABLE, name)),
+            shlex.quote(name),
+        )
+
+    def unlink(name):
+        return "rm -f {}".format(shlex.quote(name))
+
+    apply = [unlink(name) for name in changes.disable] + [
+        link(name) for name in changes.enable
+    ]
+    rollback = [unlink(name) for name in changes.enable] + [
+        link(name) for name in changes.disable
+    ]
+    return "\n".join(
+        ["cd {} || exit 1".format(shlex.quote(NGINX_CONTAINER_SITES_ENABLED))]
+        + apply
+        + ["if nginx -t; then", "  nginx -s reload", "else"]
+        + ["  " + line for line in rollback]
+        + ["  exit 1", "fi"]
+    )
+
+
+def write_file(path, content):
+    # nginx never reads a half written vhost
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def apply_changes(changes, available):
+    for name, config in changes.write.items():
+        write_file(os.path.join(NGINX_SITES_AVAILABLE, name), config)
+    result = exec_in_container(NGINX_CONTAINER, ["sh", "-c", get_apply_script(changes)])
+    if not result.ok:
+        # the links are back, the vhosts follow them
+        for name in changes.write:
+            path = os.path.join(NGINX_SITES_AVAILABLE, name)
+            if name in available:
+                write_file(path, available[name])
+            else:
+                os.unlink(path)
+        raise RuntimeError("nginx rejected the configuration: {}".format(result.output))
+    # not linked anymore, nginx can forget them
+    for name in changes.remove:
+        os.unlink(os.path.join(NGINX_SITES_AVAILABLE, name))
+
+
+def reconcile_nginx_sites(dry_run=False):
+    """
+    Bring sites-available and sites-enabled in line with the organizations:
+    only the changed vhosts are written and nginx is tested and reloaded
+    once, whatever the number of tenants changed. Return the NginxChanges.
+    """
+    desired_available, desired_enabled = render_vhosts(get_served_organizations())
+    available = read_sites_available()
+    changes = diff_vhosts(
+        desired_available, desired_enabled, available, read_sites_enabled()
+    )
+    if changes and not dry_run:
+        apply_changes(changes, available)
+        logger.info(
+            "Reconciled nginx: %s vhosts written, %s removed, %s enabled, "
+            "%s disabled",
+            len(changes.write),
+            len(changes.remove),
+            len(changes.enable),
+            len(changes.disable),
+        )
+    return changes
+
+
+def schedule_nginx_reconcile():
+    from .tasks import reconcile_nginx
+
+    # a single delayed task applies every change made until it runs
+    if not cache.add(NGINX_RECONCILE_SCHEDULED_KEY, 1, NGINX_RECONCILE_DELAY):
+        return
+    try:
+        reconcile_nginx.apply_async(countdown=NGINX_RECONCILE_DELAY)
+    except Exception:
+        cache.delete(NGINX_RECONCILE_SCHEDULED_KEY)
+        # the next change or the reconcile_nginx command applies it
+        logger.exception("Could not schedule the nginx reconcile")
+
+
+def request_nginx_reconcile():
+    """
+    Reconcile nginx once the current transaction commits.
+    """
+    transaction.on_commit(schedule_nginx_reconcile)
+
+
+def get_microcache_key(url, variant=""):
+    """
+    NGINX_MICROCACHE_KEY of a request of url, an absolute url without port.
+    """
+    parts = urlsplit(url)
+    # $request_uri is what the browser sent, the slugs percent encoded
+    request_uri = iri_to_uri(parts.path or "/")
+    if parts.query:
+        request_uri += "?" + iri_to_uri(parts.query)
+    return "{}://{}{}|{}".format(parts.scheme, parts.hostname, request_uri, variant)
+
+
+def get_microcache_file(key):
+    # levels=1:2 of proxy_cache_path, the last characters of the md5
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return os.path.join(NGINX_MICROCACHE_PATH, digest[-1], digest[-3:-1], digest)
+
+
+def get_microcache_files(urls):
+    files = set()
+    for url in urls:
+        parts = urlsplit(url)
+        for scheme in NGINX_MICROCACHE_SCHEMES:
+            for variant in NGINX_MICROCACHE_VARIANTS:
+                key = get_microcache_key(
+                    parts._replace(scheme=scheme).geturl(), variant
+                )
+                files.add(get_microcache_file(key))
+    return sorted(files)
+
+
+def get_page_purge_urls(page):
+    """
+    Urls whose cached responses show page: itself, its parent listing it and
+    the home page of its site.
+    """
+    site = page.get_site()
+    if site is None:
+        return []
+    urls = []
+    for candidate in (page, page.get_parent(), site.root_page):
+        url = candidate.get_full_url() if candidate else None
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def purge_microcache(urls):
+    """
+    Drop the microcached responses of urls, under both schemes and for the
+    ajax requests too. The free nginx has no purge, the cache files are
+    removed and nginx fetches the next request from the app.
+    """
+    files = get_microcache_files(urls)
+    if not files:
+        return 0
+    result = exec_in_container(NGINX_CONTAINER, ["rm", "-f"] + files)
+    if not result.ok:
+        raise RuntimeError("Could not purge the microcache: {}".format(result.output))
+    return len(files)
+
+
+def schedule_microcache_purge(urls):
+    from .tasks import purge_nginx_microcache
+
+    try:
+        purge_nginx_microcache.delay(urls)
+    except Exception:
+        # the cached responses expire after NGINX_MICROCACHE_TTL anyway
+        logger.exception("Could not schedule the microcache purge of %s", urls)
+
+
+def request_microcache_purge(urls):
+    """
+    Purge the microcache of urls once the current transaction commits.
+    """
+    if NGINX_MICROCACHE_TTL and urls:
+        transaction.on_commit(lambda: schedule_microcache_purge(urls))
+
+
+def reload_nginx():
+    """
+    Reload nginx for files it reads on reload only, the renewed certificates.
+    """
+    result = exec_in_container(
+        NGINX_CONTAINER, ["sh", "-c", "nginx -t && nginx -s reload"]
+    )
+    if not result.ok:
+        raise RuntimeError("nginx rejected the configuration: {}".format(result.output))
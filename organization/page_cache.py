@@ -0,0 +1,152 @@
+# organizations/page_cache.py
+import hashlib
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.cache import patch_cache_control
+
+from tentron.caches import fragment_cache
+
+logger = logging.getLogger("tentron")
+
+PAGE_CACHE_EXCLUDED_PATHS = ("/tadmin/", "/documents/", "/static/", "/media/")
+# the query parameters read by the served pages: the pagination, the blog
+# filters and the ajax variant. Any other parameter would only add copies of
+# the same page to the cache, such requests are not cached.
+PAGE_CACHE_QUERY_PARAMS = ("page", "category", "tag", "is_ajax")
+PAGE_CACHE_HITS_KEY = "pagecache:hits"
+PAGE_CACHE_MISSES_KEY = "pagecache:misses"
+
+
+def get_page_cache_version(site_id):
+    return fragment_cache.get_or_set("pagecache:version:{}".format(site_id), 1, None)
+
+
+def invalidate_page_cache(site_id):
+    """
+    Bump the page cache version of a site, every cached response of that site
+    is ignored from now on and expires on its own.
+    """
+    if site_id is None:
+        return
+    key = "pagecache:version:{}".format(site_id)
+    try:
+        fragment_cache.incr(key)
+    except ValueError:
+        fragment_cache.set(key, 1, None)
+
+
+def get_page_cache_path(request):
+    # the value the pages read is the last one of a repeated parameter
+    query = urlencode(
+        [
+            (name, request.GET[name])
+            for name in sorted(request.GET)
+            if name in PAGE_CACHE_QUERY_PARAMS
+        ]
+    )
+    return "{}?{}".format(request.path, query) if query else request.path
+
+
+def get_page_cache_key(request, tenant):
+    is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest" or bool(
+        request.GET.get("is_ajax", None)
+    )
+    return "pagecache:{}:{}:{}:{}:{}:{}".format(
+        tenant.site.id,
+        get_page_cache_version(tenant.site.id),
+        tenant.site.hostname,
+        translation.get_language(),
+        "ajax" if is_ajax else "html",
+        hashlib.md5(get_page_cache_path(request).encode()).hexdigest(),
+    )
+
+
+def request_is_cacheable(request):
+    if not getattr(settings, "PAGE_CACHE_ENABLED", True):
+        return False
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.path.startswith(PAGE_CACHE_EXCLUDED_PATHS):
+        return False
+    # flash messages are rendered once, never serve them from the cache
+    if "messages" in request.COOKIES:
+        return False
+    if any(name not in PAGE_CACHE_QUERY_PARAMS for name in request.GET):
+        return False
+    return not request.user.is_authenticated
+
+
+def mark_served_page(page, request):
+    """
+    Record whether the page served to request has view restrictions, called
+    by a before_serve_page hook running ahead of the restriction check.
+    """
+    request._page_cache_restricted = bool(page.get_view_restrictions())
+
+
+def response_is_cacheable(request, response):
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None or resolver_match.url_name != "wagtail_serve":
+        return False
+    # the password or login check runs in the view, a hit would skip it. A
+    # page not seen by mark_served_page is not cached either.
+    if getattr(request, "_page_cache_restricted", True):
+        return False
+    if response.status_code != 200 or response.streaming:
+        return False
+    # pages with a form set the csrf cookie, the token must not be shared
+    if response.cookies or "Cookie" in response.get("Vary", ""):
+        return False
+    return "private" not in response.get("Cache-Control", "")
+
+
+def _incr_counter(key):
+    if not fragment_cache.add(key, 1, None):
+        try:
+            fragment_cache.incr(key)
+        except ValueError:
+            pass
+
+
+def get_cached_response(request, tenant):
+    cache_key = get_page_cache_key(request, tenant)
+    cached = fragment_cache.get(cache_key)
+    if cached is None:
+        _incr_counter(PAGE_CACHE_MISSES_KEY)
+        request._page_cache_key = cache_key
+        return None
+    _incr_counter(PAGE_CACHE_HITS_KEY)
+    content, status, content_type = cached
+    response = HttpResponse(content, status=status, content_type=content_type)
+    response["X-Page-Cache"] = "HIT"
+    return response
+
+
+def store_response(request, response):
+    if getattr(request, "_page_cache_restricted", False):
+        # nor by nginx or any other shared cache
+        patch_cache_control(response, private=True)
+    cache_key = getattr(request, "_page_cache_key", None)
+    if cache_key is None or not response_is_cacheable(request, response):
+        return
+    fragment_cache.set(
+        cache_key,
+        (response.content, response.status_code, response["Content-Type"]),
+        getattr(settings, "PAGE_CACHE_TIMEOUT", 60 * 60),
+    )
+    response["X-Page-Cache"] = "MISS"
+
+
+def get_page_cache_stats():
+    hits = fragment_cache.get(PAGE_CACHE_HITS_KEY, 0)
+    misses = fragment_cache.get(PAGE_CACHE_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+    }
@@ -36,34 +36,34 @@ def page_filter_search(q, pages, all_pages=None, ordering=None):
     return pages, all_pages
 
 
-from django.apps import apps
-from django.db.models import Q, Subquery
 from wagtail.models import Site
 
-from organization.models import BasePage
+from organization.models import OrganizationRootPage
 
 
-def model_subclasses(mclas):
-    return [m for m in apps.get_models() if issubclass(m, mclas)]
+def get_site_pages(site):
+    """
+    Return the pages of a site: the subtree of its organization root page,
+    which holds the site root page and the pages beside it. Filtering on the
+    indexed tree path replaces one subquery per BasePage subclass.
+    """
+    if site is None:
+        return Page.objects.none()
+    tree_root = (
+        OrganizationRootPage.objects.filter(site=site).only("path", "depth").first()
+        or site.root_page
+    )
+    return Page.objects.descendant_of(tree_root, inclusive=True)
 
 
-def abstract_page_query_filter(mclass, filter_params, pk_attr="page_ptr"):
-    if not mclass._meta.abstract:
-        raise ValueError("mclass must be abstract")
-    pclasses = model_subclasses(mclass)
-    if len(pclasses) == 0:
-        raise ValueError("mclass must have subclasses")
-    if len(pclasses):
-        qf = Q(
-            pk__in=Subquery(pclasses[0].objects.filter(**filter_params).values(pk_attr))
-        )
-        for pclass in pclasses[1:]:
-            qf |= Q(
-                pk__in=Subquery(pclass.objects.filter(**filter_params).values(pk_attr))
-            )
-        return qf
-    else:
-        return None
+def get_content_type_facets(all_pages):
+    facets = all_pages.facet("content_type_id")
+    content_types = ContentType.objects.in_bulk(list(facets))
+    return [
+        (content_types[content_type_id], count)
+        for content_type_id, count in facets.items()
+        if content_type_id in content_types
+    ]
 
 
 @vary_on_headers("X-Requested-With")
@@ -72,9 +72,7 @@ def search(request):
     site = Site.find_for_request(request)
     if not request.user.is_superuser:
         pages = all_pages = (
-            Page.objects.filter(abstract_page_query_filter(BasePage, {"site": site}))
-            .prefetch_related("content_type")
-            .specific()
+            get_site_pages(site).prefetch_related("content_type").specific()
         )
     else:
         pages = all_pages = (
@@ -140,12 +138,7 @@ def search(request):
             pages, all_pages = page_filter_search(q, pages, all_pages, ordering)
             # Facets
             if pages.supports_facet:
-                content_types = [
-                    (ContentType.objects.get(id=content_type_id), count)
-                    for content_type_id, count in all_pages.facet(
-                        "content_type_id"
-                    ).items()
-                ]
+                content_types = get_content_type_facets(all_pages)
 
     else:
         form = SearchForm()
@@ -0,0 +1,139 @@
+# organizations/signals.py
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from wagtail.contrib.settings.models import BaseSiteSetting
+from wagtail.images import get_image_model
+from wagtail.models import PageViewRestriction, Site
+from wagtail.signals import page_published, page_unpublished
+from wagtailmenus.models import (
+    AbstractFlatMenu,
+    AbstractFlatMenuItem,
+    AbstractMainMenu,
+    AbstractMainMenuItem,
+)
+
+from theme.models import Theme
+
+from .models import (
+    BaseModel,
+    ExtendedSite,
+    Organization,
+    SiteSettings,
+    SiteSettingsTheme,
+)
+from .nginx import get_page_purge_urls, request_microcache_purge
+from .page_cache import invalidate_page_cache
+from .tenant import (
+    invalidate_site_settings,
+    invalidate_template_folder,
+    invalidate_tenant_cache,
+)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+@receiver(post_save, sender=ExtendedSite)
+@receiver(post_delete, sender=ExtendedSite)
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_tenant_cache_on_change(sender, **kwargs):
+    invalidate_tenant_cache()
+
+
+@receiver(post_save, sender=SiteSettings)
+def invalidate_template_folder_on_site_settings_change(sender, instance, **kwargs):
+    invalidate_template_folder(instance.site_id)
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def invalidate_site_settings_on_change(sender, instance, **kwargs):
+    invalidate_site_settings(instance.site_id)
+
+
+# pre_delete for images, SET_NULL clears the settings references before post_delete
+@receiver(post_save, sender=get_image_model())
+@receiver(pre_delete, sender=get_image_model())
+@receiver(post_save, sender=get_image_model().get_rendition_model())
+@receiver(post_delete, sender=get_image_model().get_rendition_model())
+def invalidate_site_settings_on_image_change(sender, instance, **kwargs):
+    # the snapshot holds the settings images and their renditions
+    image_id = getattr(instance, "image_id", instance.pk)
+    condition = Q()
+    for field_name in SiteSettings.snapshot_image_fields:
+        condition |= Q(**{"{}_id".format(field_name): image_id})
+    site_ids = SiteSettings.objects.filter(condition).values_list("site_id", flat=True)
+    for site_id in site_ids:
+        invalidate_site_settings(site_id)
+
+
+@receiver(post_save, sender=SiteSettingsTheme)
+@receiver(post_delete, sender=SiteSettingsTheme)
+def invalidate_template_folder_on_site_settings_theme_change(
+    sender, instance, **kwargs
+):
+    site_id = (
+        SiteSettings.objects.filter(pk=instance.site_settings_id)
+        .values_list("site_id", flat=True)
+        .first()
+    )
+    if site_id is not None:
+        invalidate_template_folder(site_id)
+        invalidate_page_cache(site_id)
+
+
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+def invalidate_template_folder_on_theme_change(sender, instance, **kwargs):
+    site_ids = SiteSettingsTheme.objects.filter(theme_id=instance.pk).values_list(
+        "site_settings__site_id", flat=True
+    )
+    for site_id in site_ids:
+        invalidate_template_folder(site_id)
+        invalidate_page_cache(site_id)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def invalidate_page_cache_on_publish(sender, instance, **kwargs):
+    site_id = getattr(instance, "site_id", None)
+    if site_id is None:
+        site = instance.get_site()
+        site_id = site.id if site else None
+    invalidate_page_cache(site_id)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def purge_microcache_on_publish(sender, instance, **kwargs):
+    request_microcache_purge(get_page_purge_urls(instance))
+
+
+@receiver(post_save, sender=PageViewRestriction)
+@receiver(post_delete, sender=PageViewRestriction)
+def invalidate_page_cache_on_view_restriction_change(sender, instance, **kwargs):
+    # pages cached before the restriction was added
+    try:
+        site = instance.page.get_site()
+    except ObjectDoesNotExist:
+        # the page is being deleted, its unpublish covers the site
+        return
+    invalidate_page_cache(site.id if site else None)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_page_cache_on_site_content_change(sender, instance, **kwargs):
+    # settings, footer menu, menus and site scoped snippets are rendered on pages
+    if isinstance(
+        instance, (BaseModel, BaseSiteSetting, AbstractMainMenu, AbstractFlatMenu)
+    ):
+        invalidate_page_cache(instance.site_id)
+    elif isinstance(instance, (AbstractMainMenuItem, AbstractFlatMenuItem)):
+        try:
+            invalidate_page_cache(instance.menu.site_id)
+        except ObjectDoesNotExist:
+            # the menu is being deleted too, its own signal covers the site
+            pass
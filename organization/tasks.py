@@ -1,31 +1,126 @@
 # Create your tasks here
 import logging
 
-import docker
 from celery import shared_task
+from celery.exceptions import MaxRetriesExceededError
+from django.core.cache import cache
+
+from .containers import exec_in_container
 
 logger = logging.getLogger("celery")
 
 
 @shared_task
 def run_command_in_container(previous_task_result, container_name, command):
-    print(f"Running command {command} in container {container_name}")
-    if previous_task_result is not None:
-        if previous_task_result[0] != 0:
-            print(f"Previous task failed with exit code {previous_task_result}")
-            logger.error(f"Previous task failed with exit code {previous_task_result}")
-            return previous_task_result
-        print(f"Previous task result: {previous_task_result}")
-    client = docker.from_env()
-
-    container = client.containers.get(container_name)
-    exec_id = container.exec_run(cmd=command, stdout=True, stderr=True)
-
-    if exec_id.exit_code != 0:
-        print(f"Error executing command: {exec_id.output.decode()}")
-        logger.error(f"Error executing command: {exec_id.output.decode()}")
+    if previous_task_result is not None and previous_task_result[0] != 0:
+        # a failed step stops the rest of the chain
+        logger.error(
+            f"Skipped {command} in {container_name}, the previous command "
+            f"exited with {previous_task_result[0]}"
+        )
+        return previous_task_result
+
+    result = exec_in_container(container_name, command)
+    if not result.ok:
+        logger.error(
+            f"Command {command} in {container_name} exited with "
+            f"{result.exit_code}: {result.output}"
+        )
     else:
-        print(f"Command output: {exec_id.output.decode()}")
-        logger.info(f"Command output: {exec_id.output.decode()}")
+        logger.debug(f"Command {command} in {container_name}: {result.output}")
+    return result
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def provision_organization(self, organization_id):
+    # imported here, organization.models imports this module
+    from .models import Organization
+
+    # claim the organization, a second task for it stops here
+    claimed = Organization.all_objects.filter(
+        pk=organization_id,
+        provisioning_status__in=[
+            Organization.PROVISIONING_PENDING,
+            Organization.PROVISIONING_FAILED,
+        ],
+    ).update(provisioning_status=Organization.PROVISIONING_RUNNING)
+    if not claimed:
+        logger.info(f"Organization {organization_id} is already provisioned or running")
+        return
+
+    organization = Organization.all_objects.get(pk=organization_id)
+    try:
+        organization.initialize_organization()
+    except Exception as exc:
+        # the completed steps are kept, the retry resumes after them
+        raise self.retry(exc=exc)
+
+
+@shared_task(bind=True, max_retries=12, default_retry_delay=60 * 5)
+def verify_organization_domain(self, organization_id):
+    from .models import Organization
+
+    organization = Organization.all_objects.filter(pk=organization_id).first()
+    if organization is None or not organization.domain:
+        return
+    if organization.domain_status == Organization.DOMAIN_VERIFIED:
+        return
+    if not organization.verify_domain():
+        # the DNS record may still be propagating, check again later
+        try:
+            raise self.retry()
+        except MaxRetriesExceededError:
+            logger.warning(
+                f"Domain {organization.domain} of organization {organization_id} "
+                "is not pointed to the server"
+            )
+
+
+@shared_task
+def reconcile_nginx():
+    from .nginx import (
+        NGINX_RECONCILE_LOCK_KEY,
+        NGINX_RECONCILE_LOCK_TIMEOUT,
+        reconcile_nginx_sites,
+        schedule_nginx_reconcile,
+    )
+
+    # runs one at a time, a run started meanwhile comes back later
+    if not cache.add(NGINX_RECONCILE_LOCK_KEY, 1, NGINX_RECONCILE_LOCK_TIMEOUT):
+        schedule_nginx_reconcile()
+        return
+    try:
+        changes = reconcile_nginx_sites()
+    finally:
+        cache.delete(NGINX_RECONCILE_LOCK_KEY)
+    return {field: len(value) for field, value in changes._asdict().items()}
+
+
+@shared_task
+def purge_nginx_microcache(urls):
+    from .nginx import purge_microcache
+
+    return purge_microcache(urls)
+
+
+@shared_task
+def manage_certificates():
+    from .certificates import (
+        CERTIFICATE_RUN_LOCK_KEY,
+        CERTIFICATE_RUN_LOCK_TIMEOUT,
+        get_next_run_countdown,
+        run_certificate_manager,
+        schedule_certificate_run,
+    )
 
-    return exec_id
+    # runs one at a time, a run started meanwhile comes back later
+    if not cache.add(CERTIFICATE_RUN_LOCK_KEY, 1, CERTIFICATE_RUN_LOCK_TIMEOUT):
+        schedule_certificate_run()
+        return
+    try:
+        plan, summary, left = run_certificate_manager()
+    finally:
+        cache.delete(CERTIFICATE_RUN_LOCK_KEY)
+    if left:
+        schedule_certificate_run(get_next_run_countdown())
+    return summary
@@ -0,0 +1,292 @@
+# organizations/tenant.py
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.http.request import split_domain_port
+from django.utils import timezone
+from wagtail.models import Site
+from wagtail.models.sites import get_site_for_hostname
+
+from tentron.caches import settings_cache, tenant_cache
+
+logger = logging.getLogger("tentron")
+
+TENANT_CACHE_VERSION_KEY = "tenant:version"
+# bumped when the fields of TenantRecord change, the pickles of the previous
+# release cannot be loaded
+TENANT_RECORD_FORMAT = 2
+# shared cache (all gunicorn workers and celery) timeout, in seconds
+TENANT_CACHE_TIMEOUT = getattr(settings, "TENANT_CACHE_TIMEOUT", 60 * 60)
+# in-process cache timeout, other workers pick up invalidations after this delay
+TENANT_LOCAL_CACHE_TIMEOUT = getattr(settings, "TENANT_LOCAL_CACHE_TIMEOUT", 10)
+TENANT_LOCAL_CACHE_MAX_SIZE = getattr(settings, "TENANT_LOCAL_CACHE_MAX_SIZE", 1024)
+
+THEME_CACHE_TIMEOUT = getattr(settings, "THEME_CACHE_TIMEOUT", 60 * 60 * 24)
+SITE_SETTINGS_CACHE_TIMEOUT = getattr(
+    settings, "SITE_SETTINGS_CACHE_TIMEOUT", 60 * 60 * 24
+)
+
+SITE_FIELDS = ("id", "hostname", "port", "site_name", "root_page_id", "is_default_site")
+
+_NOT_CACHED = object()
+_local_cache = {}
+
+
+class TenantRecord(
+    namedtuple(
+        "TenantRecord",
+        [
+            "site_id",
+            "hostname",
+            "port",
+            "site_name",
+            "root_page_id",
+            "is_default_site",
+            "organization_id",
+            "active_status",
+            "expiry_date",
+        ],
+    )
+):
+    """
+    Compact, picklable description of the tenant serving a hostname:port.
+    organization_id is None when the site has no ExtendedSite.
+    """
+
+    __slots__ = ()
+
+    @property
+    def has_organization(self):
+        return self.organization_id is not None
+
+    @property
+    def is_active(self):
+        if not self.active_status:
+            return False
+        return self.expiry_date is None or self.expiry_date > timezone.now()
+
+    def get_site(self):
+        # rebuild the Site without a query, root_page is loaded lazily
+        return Site.from_db(
+            None,
+            SITE_FIELDS,
+            (
+                self.site_id,
+                self.hostname,
+                self.port,
+                self.site_name,
+                self.root_page_id,
+                self.is_default_site,
+            ),
+        )
+
+
+def get_tenant_cache_version():
+    return tenant_cache.get_or_set(TENANT_CACHE_VERSION_KEY, 1, None)
+
+
+def invalidate_tenant_cache():
+    """
+    Drop every cached tenant record, in this process and in the shared cache.
+    """
+    _local_cache.clear()
+    try:
+        tenant_cache.incr(TENANT_CACHE_VERSION_KEY)
+    except ValueError:
+        tenant_cache.set(TENANT_CACHE_VERSION_KEY, 1, None)
+
+
+def get_theme_cache_version(site_id):
+    return settings_cache.get_or_set("theme:version:{}".format(site_id), 1, None)
+
+
+def invalidate_template_folder(site_id):
+    """
+    Bump the theme cache version of a site, the next lookup resolves it again.
+    """
+    key = "theme:version:{}".format(site_id)
+    try:
+        settings_cache.incr(key)
+    except ValueError:
+        settings_cache.set(key, 1, None)
+
+
+def get_template_folder(site_id):
+    """
+    Return the template folder of the theme selected in the SiteSettings of a
+    site, memoized in the cache under a per site version.
+    """
+    from .models import SiteSettingsTheme
+
+    cache_key = "theme:folder:{}:{}".format(site_id, get_theme_cache_version(site_id))
+    template_folder = settings_cache.get(cache_key)
+    if template_folder is None:
+        site_settings_theme = (
+            SiteSettingsTheme.objects.filter(site_settings__site_id=site_id)
+            .select_related("theme")
+            .order_by("sort_order")
+            .first()
+        )
+        # fall back to the default theme rather than rendering "None/..."
+        template_folder = (
+            site_settings_theme.template_folder if site_settings_theme else "default"
+        )
+        settings_cache.set(cache_key, template_folder, THEME_CACHE_TIMEOUT)
+    return template_folder
+
+
+def get_site_settings(site):
+    """
+    Return the SiteSettings snapshot of a site, shared by all requests until
+    the settings or one of their images change.
+    """
+    from .models import SiteSettings
+
+    cache_key = "sitesettings:{}".format(site.id)
+    site_settings = settings_cache.get(cache_key)
+    if site_settings is None:
+        site_settings = SiteSettings.build_snapshot(site)
+        settings_cache.set(cache_key, site_settings, SITE_SETTINGS_CACHE_TIMEOUT)
+    return site_settings
+
+
+def invalidate_site_settings(site_id):
+    settings_cache.delete("sitesettings:{}".format(site_id))
+
+
+def build_tenant_record(hostname, port):
+    """
+    Resolve hostname:port against the database, return None if no Site matches.
+    """
+    from .models import ExtendedSite
+
+    try:
+        site = get_site_for_hostname(hostname, port)
+    except Site.DoesNotExist:
+        return None
+
+    e_site = (
+        ExtendedSite.objects.select_related("organization").filter(site=site).first()
+    )
+    organization = e_site.organization if e_site else None
+    return TenantRecord(
+        site_id=site.id,
+        hostname=site.hostname,
+        port=site.port,
+        site_name=site.site_name,
+        root_page_id=site.root_page_id,
+        is_default_site=site.is_default_site,
+        organization_id=organization.id if organization else None,
+        active_status=organization.active_status if organization else False,
+        expiry_date=organization.expiry_date if organization else None,
+    )
+
+
+def get_tenant_record(request):
+    """
+    Return the TenantRecord for the request host, or None if no Site matches.
+    Lookups go through a short lived in-process cache, then the shared cache,
+    and only hit the database on a miss.
+    """
+    hostname = split_domain_port(request.get_host())[0]
+    port = request.get_port()
+    host_key = "{}:{}".format(hostname, port)
+
+    now = time.monotonic()
+    local = _local_cache.get(host_key)
+    if local is not None and local[0] > now:
+        return local[1]
+
+    cache_key = "tenant:{}:{}:{}".format(
+        TENANT_RECORD_FORMAT, get_tenant_cache_version(), host_key
+    )
+    record = tenant_cache.get(cache_key, _NOT_CACHED)
+    if record is _NOT_CACHED:
+        logger.debug("Tenant cache miss for %s", host_key)
+        record = build_tenant_record(hostname, port)
+        tenant_cache.set(cache_key, record, TENANT_CACHE_TIMEOUT)
+
+    if len(_local_cache) >= TENANT_LOCAL_CACHE_MAX_SIZE:
+        _local_cache.clear()
+    _local_cache[host_key] = (now + TENANT_LOCAL_CACHE_TIMEOUT, record)
+    return record
+
+
+class TenantContext:
+    """
+    Everything the page, block and view code needs to know about the tenant
+    serving a request. Built once per request by ExtendedSiteMiddleware and
+    available as request.tenant, related objects are loaded on first access.
+    """
+
+    __slots__ = (
+        "request",
+        "record",
+        "site",
+        "_extended_site",
+        "_site_settings",
+        "_template_folder",
+    )
+
+    def __init__(self, request, record):
+        self.request = request
+        self.record = record
+        self.site = record.get_site() if record is not None else None
+        self._extended_site = _NOT_CACHED
+        self._site_settings = _NOT_CACHED
+        self._template_folder = _NOT_CACHED
+
+    @property
+    def extended_site(self):
+        if self._extended_site is _NOT_CACHED:
+            from .models import ExtendedSite
+
+            if self.record is None or not self.record.has_organization:
+                self._extended_site = None
+            else:
+                self._extended_site = (
+                    ExtendedSite.objects.select_related("organization")
+                    .filter(site_id=self.record.site_id)
+                    .first()
+                )
+        return self._extended_site
+
+    @property
+    def organization(self):
+        extended_site = self.extended_site
+        return extended_site.organization if extended_site else None
+
+    @property
+    def site_settings(self):
+        if self._site_settings is _NOT_CACHED:
+            from .models import SiteSettings
+
+            self._site_settings = (
+                SiteSettings.for_request(self.request) if self.site else None
+            )
+        return self._site_settings
+
+    @property
+    def template_folder(self):
+        if self._template_folder is _NOT_CACHED:
+            self._template_folder = (
+                get_template_folder(self.site.id) if self.site else None
+            )
+        return self._template_folder
+
+
+def get_tenant(request):
+    """
+    Return the TenantContext of the request, building it if the request
+    did not go through ExtendedSiteMiddleware.
+    """
+    tenant = getattr(request, "tenant", None)
+    if tenant is None:
+        tenant = TenantContext(request, get_tenant_record(request))
+        if tenant.site is not None and not hasattr(request, "_wagtail_site"):
+            # seed wagtail's per request site cache, saves Site.find_for_request query
+            request._wagtail_site = tenant.site
+        request.tenant = tenant
+    return tenant
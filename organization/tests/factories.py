@@ -60,6 +60,7 @@ class OrganizationRootPageFactory(DjangoModelFactory):
 
 class OrganizationFactory(DjangoModelFactory):
     name = factory.Sequence(lambda n: f"Tentron{n}")
+    domain = factory.Sequence(lambda n: f"tentron{n}.localhost")
 
     class Meta:
         model = Organization
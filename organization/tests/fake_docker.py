@@ -0,0 +1,61 @@
+from unittest import mock
+
+from docker.errors import NotFound
+from docker.models.containers import ExecResult
+
+from ..containers import reset_docker_client
+
+
+class FakeContainer:
+    """
+    Stand-in for docker.models.containers.Container, handler(cmd) returns the
+    (exit_code, output bytes) of a command.
+    """
+
+    def __init__(self, name, handler=None):
+        self.name = name
+        self.handler = handler or (lambda cmd: (0, b""))
+        self.commands = []
+        self.removed = False
+
+    def exec_run(self, cmd, stdout=True, stderr=True, **kwargs):
+        if self.removed:
+            raise NotFound("No such container: {}".format(self.name))
+        self.commands.append(cmd)
+        return ExecResult(*self.handler(cmd))
+
+
+class FakeContainerCollection:
+    def __init__(self):
+        self.by_name = {}
+        self.lookups = 0
+
+    def get(self, name):
+        self.lookups += 1
+        if name not in self.by_name:
+            raise NotFound("No such container: {}".format(name))
+        return self.by_name[name]
+
+
+class FakeDockerClient:
+    def __init__(self, *containers):
+        self.containers = FakeContainerCollection()
+        for container in containers:
+            self.add(container)
+
+    def add(self, container):
+        self.containers.by_name[container.name] = container
+
+
+def use_fake_docker(test_case, *containers):
+    """
+    Make docker.from_env return a FakeDockerClient for the duration of the
+    test, the client cached by organization.containers is dropped around it.
+    """
+    client = FakeDockerClient(*containers)
+    patcher = mock.patch("docker.from_env", return_value=client)
+    from_env = patcher.start()
+    reset_docker_client()
+    test_case.addCleanup(reset_docker_client)
+    test_case.addCleanup(patcher.stop)
+    return client, from_env
@@ -0,0 +1,164 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from wagtail.fields import StreamField
+from wagtail.models import Page
+
+from core.models import (
+    AboutPage,
+    ContactPage,
+    FormField,
+    ProductFormField,
+    TestimonialItem,
+)
+from organization_menu.models import OrganizationFlatMenu, OrganizationMainMenuItem
+
+from ..models import Blueprint, FooterMenu, Organization
+
+
+@mock.patch("organization.models.request_nginx_reconcile")
+class BlueprintTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+
+    def create_organization(self, name, blueprint=None):
+        # bulk_create skips save(), which would queue the celery task
+        (organization,) = Organization.objects.bulk_create(
+            [
+                Organization(
+                    name=name,
+                    domain="{}.localhost".format(name.lower()),
+                    blueprint=blueprint,
+                )
+            ]
+        )
+        organization.initialize_organization()
+        organization.refresh_from_db()
+        return organization
+
+    def get_blueprint(self):
+        reference = self.create_organization("Acme")
+        contact_page = ContactPage.objects.get(site=reference.site)
+        contact_page.intro = "<p>Write to Acme</p>"
+        contact_page.save()
+        return Blueprint.capture("Starter", reference.site)
+
+    def test_materialize_blueprint(self, *mocks):
+        blueprint = self.get_blueprint()
+        organization = self.create_organization("Globex", blueprint)
+
+        site = organization.site
+        pages = Page.objects.descendant_of(site.root_page).order_by("path")
+        self.assertEqual(
+            sorted(pages.values_list("slug", flat=True)),
+            [
+                "about",
+                "blog",
+                "contact-us",
+                "faq",
+                "product-quote-page",
+                "products",
+                "projects",
+                "services",
+                "team",
+                "thank-you",
+            ],
+        )
+        for page in pages.specific():
+            self.assertEqual(page.site, site)
+            self.assertEqual(page.owner, organization.default_user)
+            self.assertEqual(page.url_path, site.root_page.url_path + page.slug + "/")
+        self.assertEqual(site.root_page.get_children().count(), 10)
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+
+        contact_page = ContactPage.objects.get(site=site)
+        self.assertEqual(contact_page.intro, "<p>Write to Acme</p>")
+        self.assertEqual(FormField.objects.filter(page=contact_page).count(), 5)
+        self.assertEqual(ProductFormField.objects.filter(page__site=site).count(), 7)
+        menu_items = OrganizationMainMenuItem.objects.filter(menu__site=site)
+        self.assertEqual(menu_items.count(), 8)
+        self.assertFalse(
+            menu_items.exclude(
+                link_page__in=Page.objects.descendant_of(site.root_page, inclusive=True)
+            ).exists()
+        )
+
+    def test_materialize_in_few_queries(self, *mocks):
+        blueprint = self.get_blueprint()
+        organization = self.create_organization("Globex")
+        # drop the default pages so the blueprint is loaded on its own
+        for page in organization.site.root_page.get_children():
+            page.delete()
+        organization.site.root_page.refresh_from_db()
+
+        with CaptureQueriesContext(connection) as queries:
+            pages = blueprint.materialize(organization.site)
+        self.assertEqual(len(pages), 11)
+        # one insert per page table and child model, not per page
+        self.assertLessEqual(len(queries), 21)
+
+    def test_stream_links_stay_in_the_site(self, *mocks):
+        reference = self.create_organization("Acme")
+        other = self.create_organization("Initech")
+        testimonial = TestimonialItem.objects.create(
+            site=reference.site,
+            name="Wile E. Coyote",
+            content="<p>Great rockets</p>",
+            position="Genius",
+            company="Acme",
+        )
+        about_page = AboutPage.objects.get(site=reference.site)
+        about_page.content = [
+            {"type": "testimonials", "value": {"testimonials": [testimonial.pk]}}
+        ]
+        about_page.save()
+        home_page = reference.site.root_page.specific
+        home_page.content = [
+            {"type": "default_slider", "value": {"page": about_page.pk}},
+            {"type": "default_slider", "value": {"page": other.site.root_page.pk}},
+        ]
+        home_page.save()
+        FooterMenu.objects.create(
+            site=reference.site,
+            footer_menu=[
+                {
+                    "type": "column",
+                    "value": OrganizationFlatMenu.objects.create(
+                        site=reference.site, title="Legal", handle="legal"
+                    ).pk,
+                }
+            ],
+        )
+        blueprint = Blueprint.capture("Starter", reference.site)
+
+        organization = self.create_organization("Globex", blueprint)
+        site = organization.site
+        site_pages = Page.objects.descendant_of(site.root_page, inclusive=True)
+        references = []
+        for page in site_pages.specific():
+            for field in type(page)._meta.concrete_fields:
+                if isinstance(field, StreamField):
+                    value = getattr(page, field.name)
+                    references.extend(field.extract_references(value))
+        self.assertTrue(references)
+        for model, pk, _, _ in references:
+            if issubclass(model, Page):
+                self.assertTrue(site_pages.filter(pk=pk).exists())
+            else:
+                self.assertEqual(model.objects.get(pk=pk).site, site)
+
+        # the link to the about page follows the copy, the others are cleared
+        home_page = site.root_page.specific
+        self.assertEqual(
+            [block.value["page"] for block in home_page.content],
+            [AboutPage.objects.get(site=site).page_ptr, None],
+        )
+        self.assertEqual(
+            list(AboutPage.objects.get(site=site).content[0].value["testimonials"]),
+            [None],
+        )
+        self.assertFalse(FooterMenu.objects.filter(site=site).exists())
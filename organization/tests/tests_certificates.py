@@ -0,0 +1,239 @@
+import base64
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import certificates, nginx
+from ..models import Organization
+from ..tasks import manage_certificates
+from .fake_docker import FakeContainer, use_fake_docker
+
+
+def der(tag, content):
+    if len(content) < 0x80:
+        return bytes([tag, len(content)]) + content
+    size = (len(content).bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + len(content).to_bytes(size, "big") + content
+
+
+def make_certificate(not_after):
+    """
+    PEM of a certificate reduced to what get_certificate_not_after reads.
+    """
+    validity = der(
+        0x30,
+        der(0x17, b"240101000000Z")
+        + der(0x18, not_after.strftime("%Y%m%d%H%M%SZ").encode()),
+    )
+    tbs = der(
+        0x30,
+        b"".join(
+            [
+                der(0xA0, der(0x02, b"\x02")),
+                der(0x02, b"\x01" * 16),
+                der(0x30, b""),
+                # an issuer long enough for a long form length
+                der(0x30, b"\x31" * 200),
+                validity,
+                der(0x30, b""),
+            ]
+        ),
+    )
+    certificate = der(0x30, tbs + der(0x30, b"") + der(0x03, b"\x00"))
+    return "-----BEGIN CERTIFICATE-----\n{}-----END CERTIFICATE-----\n".format(
+        base64.encodebytes(certificate).decode()
+    )
+
+
+# certbot of the CertBot container, copies $PEM as the certificate of any
+# domain but the ones of $FAIL
+FAKE_CERTBOT = """
+certbot() {
+    action=$1
+    while [ $# -gt 0 ]; do
+        [ "$1" = --cert-name ] && name=$2
+        shift
+    done
+    case " $FAIL " in
+        *" $name "*) echo "Some challenges have failed for $name."; return 1;;
+    esac
+    if [ "$action" = delete ]; then
+        rm -r "$LIVE/$name"
+    else
+        mkdir -p "$LIVE/$name"
+        cp "$PEM" "$LIVE/$name/fullchain.pem"
+        touch "$LIVE/$name/privkey.pem"
+    fi
+}
+"""
+
+
+class CertificateTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        self.live = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.live)
+        for module in (certificates, nginx):
+            patcher = mock.patch.object(module, "LETSENCRYPT_LIVE", self.live)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def create_organizations(self, *domains, **kwargs):
+        fields = {
+            "ssl_enabled": True,
+            "provisioning_status": Organization.PROVISIONING_READY,
+            "domain_status": Organization.DOMAIN_VERIFIED,
+        }
+        fields.update(kwargs)
+        # bulk_create skips save(), which would queue the celery tasks
+        return Organization.objects.bulk_create(
+            [Organization(name=domain, domain=domain, **fields) for domain in domains]
+        )
+
+    def write_certificate(self, domain, days):
+        os.makedirs(os.path.join(self.live, domain))
+        with open(os.path.join(self.live, domain, "fullchain.pem"), "w") as f:
+            f.write(make_certificate(self.now + timedelta(days=days)))
+        open(os.path.join(self.live, domain, "privkey.pem"), "w").close()
+
+    def statuses(self):
+        return dict(
+            Organization.objects.order_by("domain").values_list(
+                "domain", "certificate_status"
+            )
+        )
+
+    def test_expiry_is_read_from_the_certificate(self):
+        path = os.path.join(
+            settings.BASE_DIR, "nginx", "self-signed-ssl", "nginx-selfsigned.crt"
+        )
+        with open(path) as f:
+            pem = f.read()
+        der = base64.b64decode(certificates.PEM_CERTIFICATE_RE.search(pem).group(1))
+        self.assertEqual(
+            certificates.get_certificate_not_after(der),
+            datetime(2024, 6, 1, 1, 57, 2, tzinfo=dt_timezone.utc),
+        )
+
+        self.write_certificate("acme.com", 60)
+        self.assertEqual(
+            certificates.read_certificate_expiry("acme.com"),
+            self.now + timedelta(days=60),
+        )
+        self.assertIsNone(certificates.read_certificate_expiry("globex.com"))
+
+    def test_scan(self):
+        self.create_organizations("valid.com", "expiring.com", "expired.com", "new.com")
+        self.create_organizations("plain.com", ssl_enabled=False)
+        self.write_certificate("valid.com", 60)
+        self.write_certificate("expiring.com", 10)
+        self.write_certificate("expired.com", -1)
+
+        certificates.scan_certificates()
+        self.assertEqual(
+            self.statuses(),
+            {
+                "expired.com": Organization.CERTIFICATE_EXPIRED,
+                "expiring.com": Organization.CERTIFICATE_EXPIRING,
+                "new.com": Organization.CERTIFICATE_PENDING,
+                "plain.com": Organization.CERTIFICATE_NONE,
+                "valid.com": Organization.CERTIFICATE_VALID,
+            },
+        )
+        self.assertEqual(
+            Organization.objects.get(domain="valid.com").certificate_expires_at,
+            self.now + timedelta(days=60),
+        )
+
+    @mock.patch.object(certificates, "CERTIFICATE_ISSUANCE_LIMIT", 3)
+    @mock.patch.object(certificates, "reload_nginx")
+    @mock.patch.object(certificates, "request_nginx_reconcile")
+    def test_batch_within_the_budget(self, request_nginx_reconcile, reload_nginx):
+        self.create_organizations("renew.com", "new1.com", "new2.com", "new3.com")
+        self.create_organizations("off.com", ssl_enabled=False)
+        self.create_organizations(
+            "unverified.com", domain_status=Organization.DOMAIN_PENDING
+        )
+        self.write_certificate("renew.com", 5)
+        self.write_certificate("off.com", 60)
+
+        pem = os.path.join(self.live, "issued.pem")
+        with open(pem, "w") as f:
+            f.write(make_certificate(self.now + timedelta(days=90)))
+
+        def run(cmd):
+            result = subprocess.run(
+                ["sh", "-c", FAKE_CERTBOT + cmd[-1]],
+                capture_output=True,
+                env={"LIVE": self.live, "PEM": pem, "FAIL": "new2.com"},
+            )
+            return result.returncode, result.stdout + result.stderr
+
+        certbot = FakeContainer(certificates.CERTBOT_CONTAINER, run)
+        use_fake_docker(self, certbot)
+
+        plan, summary, left = certificates.run_certificate_manager()
+        # the renewal comes first, new3.com waits for the next window
+        self.assertEqual(
+            [[organization.domain for organization in part] for part in plan],
+            [["new1.com", "new2.com"], ["renew.com"], ["off.com"]],
+        )
+        self.assertEqual(left, 1)
+        self.assertEqual(
+            summary, {"issued": 1, "renewed": 1, "removed": 1, "failed": 1}
+        )
+        self.assertEqual(len(certbot.commands), 1)
+        request_nginx_reconcile.assert_called_once()
+        reload_nginx.assert_called_once()
+
+        self.assertEqual(
+            self.statuses(),
+            {
+                "new1.com": Organization.CERTIFICATE_VALID,
+                "new2.com": Organization.CERTIFICATE_FAILED,
+                "new3.com": Organization.CERTIFICATE_PENDING,
+                "off.com": Organization.CERTIFICATE_NONE,
+                "renew.com": Organization.CERTIFICATE_VALID,
+                "unverified.com": Organization.CERTIFICATE_PENDING,
+            },
+        )
+        new2 = Organization.objects.get(domain="new2.com")
+        self.assertIn("Some challenges have failed", new2.certificate_error)
+        self.assertIsNotNone(new2.certificate_requested_at)
+        self.assertFalse(os.path.exists(os.path.join(self.live, "off.com")))
+        self.assertEqual(certificates.get_issuance_budget(), 0)
+
+        # the budget is used, the task comes back with the next window
+        with mock.patch.object(manage_certificates, "apply_async") as apply_async:
+            self.assertIsNone(manage_certificates.apply().get())
+        self.assertEqual(len(certbot.commands), 1)
+        countdown = apply_async.call_args.kwargs["countdown"]
+        self.assertGreater(countdown, 0)
+        self.assertLessEqual(countdown, certificates.CERTIFICATE_ISSUANCE_WINDOW + 1)
+
+    @mock.patch("organization.models.request_nginx_reconcile")
+    def test_save_only_queues_the_manager(self, request_nginx_reconcile):
+        (organization,) = self.create_organizations("acme.com", ssl_enabled=False)
+        certbot = FakeContainer(certificates.CERTBOT_CONTAINER)
+        use_fake_docker(self, certbot)
+
+        with mock.patch.object(manage_certificates, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                for ssl_enabled in (True, False, True):
+                    organization.ssl_enabled = ssl_enabled
+                    organization.save()
+        apply_async.assert_called_once_with(
+            countdown=certificates.CERTIFICATE_RUN_DELAY
+        )
+        self.assertEqual(certbot.commands, [])
@@ -0,0 +1,66 @@
+import json
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from ..containers import get_command_stats
+from ..tasks import run_command_in_container
+from .fake_docker import FakeContainer, use_fake_docker
+
+
+class RunCommandTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+
+    def run_command(self, previous_task_result, container_name, command):
+        return run_command_in_container.apply(
+            args=(previous_task_result, container_name, command)
+        ).get()
+
+    def test_client_and_container_are_reused(self):
+        certbot = FakeContainer("CertBot", lambda cmd: (0, b"Certificate renewed"))
+        client, from_env = use_fake_docker(self, certbot)
+
+        first = self.run_command(None, "CertBot", "certbot renew")
+        second = self.run_command(first, "CertBot", "certbot certificates")
+
+        self.assertEqual(tuple(second), (0, "Certificate renewed"))
+        self.assertEqual(certbot.commands, ["certbot renew", "certbot certificates"])
+        from_env.assert_called_once()
+        self.assertEqual(client.containers.lookups, 1)
+        self.assertEqual(json.dumps(first), '[0, "Certificate renewed"]')
+
+        stats = get_command_stats("CertBot", "certbot")
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["failures"], 0)
+
+    def test_failed_command_stops_the_chain(self):
+        nginx = FakeContainer(
+            "tentron_nginx", lambda cmd: (1, b"x" * 5000 + b"test failed")
+        )
+        use_fake_docker(self, nginx)
+
+        result = self.run_command(None, "tentron_nginx", "nginx -t")
+        self.assertEqual(result[0], 1)
+        self.assertTrue(result[1].endswith("test failed"))
+        self.assertLess(len(result[1]), 5000)
+
+        self.assertEqual(
+            self.run_command(result, "tentron_nginx", "nginx -s reload"), result
+        )
+        self.assertEqual(nginx.commands, ["nginx -t"])
+        self.assertEqual(get_command_stats("tentron_nginx", "nginx")["failures"], 1)
+
+    def test_recreated_container(self):
+        old = FakeContainer("tentron_nginx")
+        client, from_env = use_fake_docker(self, old)
+        self.run_command(None, "tentron_nginx", "nginx -t")
+
+        old.removed = True
+        new = FakeContainer("tentron_nginx")
+        client.add(new)
+        self.run_command(None, "tentron_nginx", "nginx -s reload")
+
+        self.assertEqual(new.commands, ["nginx -s reload"])
+        self.assertEqual(client.containers.lookups, 2)
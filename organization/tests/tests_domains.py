@@ -0,0 +1,112 @@
+import socket
+import threading
+from unittest import mock
+
+from celery.exceptions import Retry
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from .. import domains
+from ..models import Organization
+from ..tasks import verify_organization_domain
+
+
+def getaddrinfo(*addresses):
+    return [
+        (socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, 0))
+        for address in addresses
+    ]
+
+
+class ResolveTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+
+    @mock.patch("socket.getaddrinfo", return_value=getaddrinfo("203.0.113.10"))
+    def test_answers_are_cached(self, lookup):
+        self.assertEqual(domains.resolve("acme.com"), ["203.0.113.10"])
+        self.assertEqual(domains.resolve("ACME.com"), ["203.0.113.10"])
+        lookup.assert_called_once()
+
+        domains.invalidate_dns_cache("acme.com")
+        domains.resolve("acme.com")
+        self.assertEqual(lookup.call_count, 2)
+
+    @mock.patch("socket.getaddrinfo", side_effect=socket.gaierror("unknown"))
+    def test_unknown_domain(self, lookup):
+        self.assertEqual(domains.resolve("acme.com"), [])
+
+    def test_slow_lookup_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_lookup(*args, **kwargs):
+            release.wait(5)
+            return getaddrinfo("203.0.113.10")
+
+        with mock.patch("socket.getaddrinfo", side_effect=slow_lookup):
+            self.assertEqual(domains.resolve("acme.com", timeout=0.05), [])
+
+
+@override_settings(SERVER_IP="203.0.113.10")
+@mock.patch("organization.models.request_certificate_run")
+class VerifyDomainTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        # bulk_create skips save(), which would queue the celery tasks
+        (self.organization,) = Organization.objects.bulk_create(
+            [Organization(name="Acme", domain="acme.com", ssl_enabled=True)]
+        )
+
+    def test_save_does_not_resolve(self, certificate_run):
+        with mock.patch("socket.getaddrinfo") as lookup, mock.patch.object(
+            verify_organization_domain, "delay"
+        ) as delay, mock.patch("organization.models.provision_organization"):
+            with self.captureOnCommitCallbacks(execute=True):
+                organization = Organization(name="Globex", domain="globex.com")
+                organization.save()
+        lookup.assert_not_called()
+        delay.assert_called_once_with(organization.pk)
+        self.assertEqual(organization.domain_status, Organization.DOMAIN_PENDING)
+
+    def test_ssl_waits_for_verification(self, certificate_run):
+        with mock.patch.object(verify_organization_domain, "delay"):
+            self.organization.save()
+        # the certificate manager skips the domain until it is verified
+        self.assertEqual(self.organization.domain_status, Organization.DOMAIN_PENDING)
+        certificate_run.reset_mock()
+
+        with mock.patch("socket.getaddrinfo", return_value=getaddrinfo("203.0.113.10")):
+            verify_organization_domain.apply(args=(self.organization.pk,))
+        self.organization.refresh_from_db()
+        self.assertEqual(self.organization.domain_status, Organization.DOMAIN_VERIFIED)
+        self.assertIsNotNone(self.organization.domain_checked_at)
+        certificate_run.assert_called_once()
+
+        # the certificate is requested on the transition only
+        self.organization.verify_domain()
+        certificate_run.assert_called_once()
+
+    def test_domain_pointed_elsewhere(self, certificate_run):
+        with mock.patch(
+            "socket.getaddrinfo", return_value=getaddrinfo("198.51.100.7")
+        ), mock.patch.object(
+            verify_organization_domain, "retry", return_value=Retry()
+        ) as retry:
+            verify_organization_domain.apply(args=(self.organization.pk,))
+        retry.assert_called_once()
+        self.organization.refresh_from_db()
+        self.assertEqual(self.organization.domain_status, Organization.DOMAIN_FAILED)
+        certificate_run.assert_not_called()
+
+    def test_save_forgets_the_cached_answer(self, certificate_run):
+        with mock.patch("socket.getaddrinfo", side_effect=socket.gaierror("unknown")):
+            self.assertFalse(self.organization.verify_domain())
+
+        # the DNS records are fixed and the admin saves to check again
+        with mock.patch.object(verify_organization_domain, "delay"):
+            self.organization.save()
+        with mock.patch("socket.getaddrinfo", return_value=getaddrinfo("203.0.113.10")):
+            self.assertTrue(self.organization.verify_domain())
@@ -0,0 +1,254 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from wagtail.models import Page, Site
+
+from tentron.storage import CompressedManifestStaticFilesStorage
+
+from .. import nginx
+from ..models import Organization
+from ..tasks import purge_nginx_microcache, reconcile_nginx
+from .fake_docker import FakeContainer, use_fake_docker
+
+
+class FakeNginxContainer(FakeContainer):
+    def __init__(self):
+        super().__init__(nginx.NGINX_CONTAINER, self.run)
+        self.enabled = set()
+        self.scripts = []
+        self.exit_code = 0
+
+    def run(self, cmd):
+        if cmd[0] == "ls":
+            return 0, "\n".join(sorted(self.enabled)).encode()
+        self.scripts.append(cmd[-1])
+        return self.exit_code, b"nginx: configuration file test failed"
+
+
+class ReconcileTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        self.sites_available = tempfile.mkdtemp()
+        self.letsencrypt_live = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sites_available)
+        self.addCleanup(shutil.rmtree, self.letsencrypt_live)
+        with open(os.path.join(self.sites_available, "tentron.conf"), "w") as f:
+            f.write("server {}")
+        self.container = FakeNginxContainer()
+        for name, value in (
+            ("NGINX_SITES_AVAILABLE", self.sites_available),
+            ("LETSENCRYPT_LIVE", self.letsencrypt_live),
+        ):
+            patcher = mock.patch.object(nginx, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        use_fake_docker(self, self.container)
+
+    def create_organizations(self, count, **kwargs):
+        # bulk_create skips save(), which would queue the celery tasks
+        return Organization.objects.bulk_create(
+            [
+                Organization(
+                    name="Tenant{}".format(i),
+                    domain="tenant{}.com".format(i),
+                    provisioning_status=Organization.PROVISIONING_READY,
+                    **kwargs
+                )
+                for i in range(count)
+            ]
+        )
+
+    def reconcile(self):
+        changes = nginx.reconcile_nginx_sites()
+        # what the apply script did in the container
+        self.container.enabled = (self.container.enabled - set(changes.disable)) | set(
+            changes.enable
+        )
+        return changes
+
+    def read(self, name):
+        with open(os.path.join(self.sites_available, name)) as f:
+            return f.read()
+
+    def test_many_tenants_single_reload(self):
+        self.create_organizations(50)
+        Organization.objects.bulk_create(
+            [Organization(name="Pending", domain="pending.com")]
+        )
+        changes = self.reconcile()
+
+        self.assertEqual(
+            sorted(changes.write),
+            [nginx.NGINX_LOCATIONS_FILE, nginx.NGINX_TENANTS_FILE],
+        )
+        self.assertEqual(changes.enable, [nginx.NGINX_TENANTS_FILE])
+        self.assertEqual(len(self.container.scripts), 1)
+        self.assertEqual(self.container.scripts[0].count("nginx -s reload"), 1)
+        tenants = self.read(nginx.NGINX_TENANTS_FILE)
+        self.assertIn("    tenant7.com http;\n", tenants)
+        self.assertIn(
+            "include /etc/nginx/sites-available/tentron-locations.inc;", tenants
+        )
+        self.assertNotIn("pending.com", tenants)
+
+        # nothing to do, nginx is not touched
+        self.assertFalse(self.reconcile())
+        self.assertEqual(len(self.container.scripts), 1)
+
+    def test_https_once_the_certificate_exists(self):
+        self.create_organizations(2, ssl_enabled=True)
+        self.reconcile()
+        self.assertEqual(self.container.enabled, {nginx.NGINX_TENANTS_FILE})
+
+        live = os.path.join(self.letsencrypt_live, "tenant0.com")
+        os.makedirs(live)
+        for name in ("fullchain.pem", "privkey.pem"):
+            open(os.path.join(live, name), "w").close()
+        changes = self.reconcile()
+        self.assertEqual(
+            sorted(changes.write), ["tenant0.com.https.conf", nginx.NGINX_TENANTS_FILE]
+        )
+        self.assertEqual(changes.enable, ["tenant0.com.https.conf"])
+        self.assertEqual(changes.disable, [])
+        self.assertIn("    tenant0.com https;\n", self.read(nginx.NGINX_TENANTS_FILE))
+        self.assertIn(
+            "ssl_certificate /etc/letsencrypt/live/tenant0.com/fullchain.pem;",
+            self.read("tenant0.com.https.conf"),
+        )
+
+    def test_removed_tenant(self):
+        (organization,) = self.create_organizations(1)
+        self.reconcile()
+        Organization.objects.filter(pk=organization.pk).update(
+            domain="deleted-0-tenant0.com"
+        )
+        changes = self.reconcile()
+        self.assertEqual(changes.disable, [nginx.NGINX_TENANTS_FILE])
+        self.assertEqual(os.listdir(self.sites_available), ["tentron.conf"])
+
+    def test_per_tenant_http_vhosts_are_replaced(self):
+        self.create_organizations(1)
+        with open(
+            os.path.join(self.sites_available, "tenant0.com.http.conf"), "w"
+        ) as f:
+            f.write("server {}")
+        self.container.enabled = {"tenant0.com.http.conf"}
+
+        changes = self.reconcile()
+        self.assertEqual(changes.enable, [nginx.NGINX_TENANTS_FILE])
+        self.assertEqual(changes.disable, ["tenant0.com.http.conf"])
+        self.assertNotIn("tenant0.com.http.conf", os.listdir(self.sites_available))
+
+    def test_rejected_configuration_is_rolled_back(self):
+        self.create_organizations(1)
+        self.container.exit_code = 1
+        with self.assertRaises(RuntimeError):
+            nginx.reconcile_nginx_sites()
+        self.assertEqual(os.listdir(self.sites_available), ["tentron.conf"])
+        self.assertIn(
+            "rm -f {}".format(nginx.NGINX_TENANTS_FILE), self.container.scripts[0]
+        )
+
+    def test_reconcile_is_debounced(self):
+        with mock.patch.object(reconcile_nginx, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                for organization in self.create_organizations(3):
+                    organization.ssl_enabled = True
+                    organization.save(handle_ssl=False)
+        apply_async.assert_called_once_with(countdown=nginx.NGINX_RECONCILE_DELAY)
+
+
+class MicrocacheTestCase(TestCase):
+    def test_rules(self):
+        tenants = nginx.render_tenants(["tenant0.com"], [], "locations.inc")
+        self.assertIn("keys_zone=tentron_microcache:", tenants)
+        self.assertIn('"~(^|;\\s*)(sessionid|csrftoken|messages)=" 1;', tenants)
+        locations = nginx.render_locations()
+        self.assertIn("proxy_cache tentron_microcache;", locations)
+        self.assertIn(
+            'proxy_cache_key "$scheme://$host$request_uri|$tentron_ajax";', locations
+        )
+        self.assertIn("gzip_static on;", locations)
+
+        # off, no zone and no reference to it
+        self.assertNotIn(
+            "tentron_microcache",
+            nginx.render_tenants(["tenant0.com"], [], "locations.inc", microcache_ttl=0)
+            + nginx.render_locations(microcache_ttl=0),
+        )
+
+    def test_purge_removes_the_cache_files(self):
+        # what nginx computes for a GET http://tenant0.com/about/?page=2
+        digest = hashlib.md5(b"http://tenant0.com/about/?page=2|").hexdigest()
+        self.assertIn(
+            os.path.join(
+                nginx.NGINX_MICROCACHE_PATH, digest[-1], digest[-3:-1], digest
+            ),
+            nginx.get_microcache_files(["https://Tenant0.com:8000/about/?page=2"]),
+        )
+
+        container = FakeContainer(nginx.NGINX_CONTAINER)
+        use_fake_docker(self, container)
+        purged = purge_nginx_microcache.apply(
+            args=(["http://tenant0.com/", "http://tenant0.com/\u65b0\u95fb/"],)
+        ).get()
+        self.assertEqual(purged, 8)
+        (command,) = container.commands
+        self.assertEqual(command[:2], ["rm", "-f"])
+        self.assertEqual(
+            command[2:],
+            nginx.get_microcache_files(
+                ["http://tenant0.com/", "http://tenant0.com/%E6%96%B0%E9%97%BB/"]
+            ),
+        )
+
+    def test_publish_purges_the_page(self):
+        root = Page.objects.get(depth=1).add_child(
+            instance=Page(title="Acme", slug="acme")
+        )
+        Site.objects.create(hostname="acme.localhost", port=80, root_page=root)
+        news = root.add_child(instance=Page(title="News", slug="news", live=False))
+        article = news.add_child(instance=Page(title="Launch", slug="launch"))
+
+        # the search index queue is scheduled by the same commit
+        with mock.patch("search.queue.schedule_index_queue"), mock.patch.object(
+            purge_nginx_microcache, "delay"
+        ) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                article.save_revision().publish()
+        delay.assert_called_once_with(
+            [
+                "http://acme.localhost/news/launch/",
+                "http://acme.localhost/news/",
+                "http://acme.localhost/",
+            ]
+        )
+
+
+class CompressedStaticFilesTestCase(TestCase):
+    def test_text_assets_are_compressed(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        storage = CompressedManifestStaticFilesStorage(location=location)
+        css = b"body { color: red; }\n" * 100
+        storage.save("app.css", ContentFile(css))
+        storage.save("logo.png", ContentFile(b"\x89PNG" * 100))
+
+        list(
+            storage.post_process(
+                {name: (storage, name) for name in ("app.css", "logo.png")}
+            )
+        )
+
+        for name in ("app.css", storage.stored_name("app.css")):
+            with gzip.open(storage.path(name) + ".gz") as f:
+                self.assertEqual(f.read(), css)
+        self.assertFalse(os.path.exists(storage.path("logo.png") + ".gz"))
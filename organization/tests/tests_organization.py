@@ -1,8 +1,10 @@
+from unittest import mock
+
 from django.contrib.auth.models import Group, Permission
 from django.test import TestCase
 from wagtail.models import Page, Site
 
-from ..models import ExtendedSite, OrganizationRootPage
+from ..models import ExtendedSite, Organization, OrganizationRootPage
 from .factories import (
     OrganizationFactory,
     OrganizationRootPageFactory,
@@ -13,7 +15,14 @@ from .factories import (
 
 class BasePageTestCase(TestCase):
     def setUp(self):
-        self.organization = OrganizationFactory()
+        # bulk_create skips save(), which would queue the provisioning task
+        # on commit, never reached in a TestCase
+        (self.organization,) = Organization.objects.bulk_create(
+            [OrganizationFactory.build()]
+        )
+        # the nginx config of the tenant is not needed by these tests
+        with mock.patch.object(Organization, "_provision_nginx_config"):
+            self.organization.initialize_organization()
 
         self.organization_group = Group.objects.get(
             name=self.organization.lower_name + " admins"
@@ -0,0 +1,119 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import ResolverMatch
+from wagtail import hooks
+from wagtail.models import Page, PageViewRestriction, Site
+
+from ..middleware import PageCacheMiddleware
+from ..models import ExtendedSite, Organization, SiteSettings
+from ..page_cache import get_page_cache_stats
+from ..tenant import invalidate_tenant_cache
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheMiddlewareTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        invalidate_tenant_cache()
+        (organization,) = Organization.objects.bulk_create(
+            [Organization(name="Acme", domain="acme.localhost")]
+        )
+        self.site = Site.objects.create(
+            hostname="acme.localhost", port=80, root_page=Page.objects.get(depth=1)
+        )
+        ExtendedSite.objects.create(site=self.site, organization=organization)
+        self.page = self.site.root_page
+        self.rendered = 0
+        self.middleware = PageCacheMiddleware(self.serve)
+
+    def serve(self, request):
+        # what wagtail.views.serve does around page.serve
+        self.rendered += 1
+        request.resolver_match = ResolverMatch(
+            lambda request: None, (), {}, url_name="wagtail_serve"
+        )
+        for fn in hooks.get_hooks("before_serve_page"):
+            result = fn(self.page, request, [], {})
+            if isinstance(result, HttpResponse):
+                return result
+        return HttpResponse("page {}".format(self.rendered))
+
+    def get(self, path="/", session=None, **extra):
+        request = RequestFactory().get(path, HTTP_HOST="acme.localhost", **extra)
+        request.user = AnonymousUser()
+        request.session = session or {}
+        return self.middleware(request)
+
+    def test_anonymous_response_is_cached(self):
+        self.assertEqual(self.get()["X-Page-Cache"], "MISS")
+        response = self.get()
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+        self.assertEqual(response.content, b"page 1")
+        self.assertEqual(self.rendered, 1)
+        self.assertEqual(get_page_cache_stats()["hits"], 1)
+
+    def test_ajax_variant_and_path_are_cached_separately(self):
+        self.get()
+        self.get(HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.get("/?is_ajax=1")
+        self.get("/about/")
+        self.assertEqual(self.rendered, 4)
+
+    def test_query_parameters_are_sorted_in_the_key(self):
+        self.get("/?page=2&tag=news")
+        response = self.get("/?tag=news&page=2")
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+        self.get("/?tag=news&page=3")
+        self.assertEqual(self.rendered, 2)
+
+    def test_unknown_query_parameter_is_not_cached(self):
+        for n in range(2):
+            response = self.get("/?page=2&nocache={}".format(n))
+            self.assertNotIn("X-Page-Cache", response)
+        self.assertEqual(self.rendered, 2)
+        self.assertEqual(get_page_cache_stats()["misses"], 0)
+
+    def test_site_settings_save_invalidates_site(self):
+        self.get()
+        SiteSettings.objects.create(site=self.site)
+        self.assertEqual(self.get().content, b"page 2")
+
+    def test_restricted_page_is_never_cached(self):
+        self.page = self.page.add_child(instance=Page(title="Secret", slug="secret"))
+        restriction = PageViewRestriction.objects.create(
+            page=self.page,
+            restriction_type=PageViewRestriction.PASSWORD,
+            password="swordfish",
+        )
+
+        # a visitor who entered the password, then one who did not
+        response = self.get(
+            "/secret/",
+            session={
+                restriction.passed_view_restrictions_session_key: [restriction.pk]
+            },
+        )
+        self.assertEqual(response.content, b"page 1")
+        self.assertNotIn("X-Page-Cache", response)
+        self.assertIn("private", response["Cache-Control"])
+
+        response = self.get("/secret/")
+        self.assertEqual(self.rendered, 2)
+        self.assertNotIn("X-Page-Cache", response)
+        self.assertIn("password_required", response.template_name)
+
+        # the password form is not cached either
+        self.get("/secret/")
+        self.assertEqual(self.rendered, 3)
+
+    def test_new_restriction_invalidates_site(self):
+        self.get()
+        PageViewRestriction.objects.create(
+            page=self.page, restriction_type=PageViewRestriction.LOGIN
+        )
+        self.assertEqual(self.rendered, 1)
+        self.get()
+        self.assertEqual(self.rendered, 2)
@@ -0,0 +1,133 @@
+from unittest import mock
+
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import FormField, ProductFormField
+from organization_menu.models import OrganizationMainMenuItem
+
+from ..models import Organization, OrganizationRootPage
+from ..tasks import provision_organization
+
+
+@mock.patch("organization.models.request_nginx_reconcile")
+class ProvisioningTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        # bulk_create skips save(), which would queue the celery task
+        (self.organization,) = Organization.objects.bulk_create(
+            [Organization(name="Acme", domain="acme.localhost")]
+        )
+
+    def assertProvisioned(self, organization):
+        organization.refresh_from_db()
+        self.assertEqual(
+            organization.provisioning_status, Organization.PROVISIONING_READY
+        )
+        self.assertEqual(organization.provisioning_step, "nginx_config")
+        self.assertEqual(organization.provisioning_error, "")
+
+        home_page = organization.site.root_page
+        self.assertEqual(
+            sorted(home_page.get_children().values_list("slug", flat=True)),
+            [
+                "about",
+                "blog",
+                "contact-us",
+                "faq",
+                "product-quote-page",
+                "products",
+                "projects",
+                "services",
+                "team",
+                "thank-you",
+            ],
+        )
+        self.assertEqual(
+            list(
+                OrganizationMainMenuItem.objects.filter(
+                    menu__site=organization.site
+                ).values_list("link_text", flat=True)
+            ),
+            [
+                "Home",
+                "Products",
+                "About",
+                "FAQ",
+                "Projects",
+                "Services",
+                "Team",
+                "Contact",
+            ],
+        )
+        self.assertEqual(
+            FormField.objects.filter(page__site=organization.site).count(), 5
+        )
+        # ProductForm.save() adds the hidden product id and page type fields
+        self.assertEqual(
+            ProductFormField.objects.filter(page__site=organization.site).count(), 7
+        )
+        group = Group.objects.get(name="acme admins")
+        self.assertTrue(group.permissions.filter(codename="access_admin").exists())
+        self.assertEqual(
+            group.page_permissions.get(permission_type="publish").page_id,
+            OrganizationRootPage.objects.get(site=organization.site).pk,
+        )
+
+    def test_initialize_organization(self, *mocks):
+        self.organization.initialize_organization()
+        self.assertProvisioned(self.organization)
+
+    def test_failed_step_resumes(self, *mocks):
+        with mock.patch.object(
+            Organization, "_create_main_menu", side_effect=RuntimeError("boom")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.organization.initialize_organization()
+
+        organization = Organization.objects.get(pk=self.organization.pk)
+        self.assertEqual(
+            organization.provisioning_status, Organization.PROVISIONING_FAILED
+        )
+        self.assertEqual(organization.provisioning_step, "default_pages")
+        self.assertEqual(organization.provisioning_error, "main_menu: boom")
+
+        # the pages are not created a second time
+        organization.initialize_organization()
+        self.assertProvisioned(organization)
+
+    def test_site_step_keeps_the_domain_status(self, *mocks):
+        # verify_organization_domain is queued on the same commit as the
+        # provisioning and may finish before the site step
+        Organization.objects.filter(pk=self.organization.pk).update(
+            domain_status=Organization.DOMAIN_VERIFIED, domain_checked_at=timezone.now()
+        )
+        self.organization.initialize_organization()
+        self.organization.refresh_from_db()
+        self.assertEqual(self.organization.domain_status, Organization.DOMAIN_VERIFIED)
+        self.assertIsNotNone(self.organization.domain_checked_at)
+        self.assertIsNotNone(self.organization.site)
+
+    def test_task_claims_the_organization(self, request_nginx_reconcile, *mocks):
+        provision_organization.apply(args=(self.organization.pk,))
+        self.assertProvisioned(self.organization)
+
+        provision_organization.apply(args=(self.organization.pk,))
+        request_nginx_reconcile.assert_called_once()
+
+    @override_settings(DEBUG=True)
+    def test_save_queues_the_task(self, *mocks):
+        with mock.patch.object(provision_organization, "delay") as delay, mock.patch(
+            "organization.models.verify_organization_domain"
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                organization = Organization(name="Globex", domain="globex.localhost")
+                organization.save()
+        delay.assert_called_once_with(organization.pk)
+        self.assertEqual(
+            organization.provisioning_status, Organization.PROVISIONING_PENDING
+        )
+        self.assertIsNone(organization.site)
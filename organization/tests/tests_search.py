@@ -0,0 +1,54 @@
+from django.test import TestCase
+from wagtail.models import Page, Site
+
+from core.models import AboutPage
+from home.models import HomePage
+from search.queue import index_pending
+
+from ..models import OrganizationRootPage
+from ..search import get_content_type_facets, get_site_pages
+
+
+class AdminSearchTestCase(TestCase):
+    def setUp(self):
+        root = Page.objects.get(depth=1)
+        self.site, self.acme_pages = self.create_tenant(root, "acme")
+        self.other_site, _ = self.create_tenant(root, "other")
+        index_pending()
+
+    def create_tenant(self, root, name):
+        site = Site.objects.create(
+            hostname="{}.localhost".format(name), port=80, root_page=root
+        )
+        organization_root = root.add_child(
+            instance=OrganizationRootPage(
+                title="{} root".format(name), slug=name, site=site
+            )
+        )
+        home = organization_root.add_child(
+            instance=HomePage(title="{} home".format(name), slug="home", site=site)
+        )
+        about = home.add_child(
+            instance=AboutPage(title="{} about".format(name), slug="about", site=site)
+        )
+        site.root_page = home
+        site.save()
+        return site, [organization_root, home, about]
+
+    def test_site_pages_are_the_organization_tree(self):
+        with self.assertNumQueries(2):
+            pages = list(get_site_pages(self.site))
+        self.assertEqual(
+            [page.pk for page in pages], [page.pk for page in self.acme_pages]
+        )
+
+    def test_content_type_facets_in_one_query(self):
+        all_pages = get_site_pages(self.site).search("acme")
+        # warm up the content type cache of the search backend
+        get_content_type_facets(all_pages)
+        with self.assertNumQueries(2):
+            facets = get_content_type_facets(all_pages)
+        self.assertEqual(
+            sorted((content_type.model, count) for content_type, count in facets),
+            [("aboutpage", 1), ("homepage", 1), ("organizationrootpage", 1)],
+        )
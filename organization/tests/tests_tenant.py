@@ -0,0 +1,106 @@
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase
+from wagtail.models import Page, Site
+
+from theme.models import Theme
+
+from ..models import ExtendedSite, Organization, SiteSettings, SiteSettingsTheme
+from ..tenant import (
+    get_template_folder,
+    get_tenant,
+    get_tenant_record,
+    invalidate_tenant_cache,
+)
+
+
+class TenantRecordTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        invalidate_tenant_cache()
+        (self.organization,) = Organization.objects.bulk_create(
+            [Organization(name="Acme", domain="acme.localhost")]
+        )
+        self.site = Site.objects.create(
+            hostname="acme.localhost",
+            port=80,
+            root_page=Page.objects.get(depth=1),
+            site_name="Acme Site",
+        )
+        self.extended_site = ExtendedSite.objects.create(
+            site=self.site, organization=self.organization
+        )
+        self.request = RequestFactory().get("/", HTTP_HOST="acme.localhost")
+
+    def test_record_is_cached(self):
+        record = get_tenant_record(self.request)
+        self.assertEqual(record.site_id, self.site.id)
+        self.assertEqual(record.organization_id, self.organization.id)
+        self.assertTrue(record.is_active)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_tenant_record(self.request), record)
+            self.assertEqual(record.get_site().hostname, "acme.localhost")
+
+    def test_record_is_invalidated_on_organization_change(self):
+        self.assertTrue(get_tenant_record(self.request).is_active)
+
+        self.organization.active_status = False
+        self.organization.save(handle_ssl=False)
+
+        self.assertFalse(get_tenant_record(self.request).is_active)
+
+    def test_site_without_extended_site(self):
+        self.extended_site.delete()
+
+        record = get_tenant_record(self.request)
+        self.assertEqual(record.site_id, self.site.id)
+        self.assertFalse(record.has_organization)
+
+    def test_tenant_context_is_built_once_per_request(self):
+        tenant = get_tenant(self.request)
+        self.assertIs(self.request.tenant, tenant)
+        self.assertIs(get_tenant(self.request), tenant)
+        self.assertEqual(tenant.organization, self.organization)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(tenant.extended_site, self.extended_site)
+            self.assertIs(Site.find_for_request(self.request), tenant.site)
+
+    def test_template_folder_is_memoized_until_theme_changes(self):
+        theme = Theme.objects.create(name="Capatel", slug="capatel")
+        site_settings = SiteSettings.objects.create(site=self.site)
+        SiteSettingsTheme.objects.create(site_settings=site_settings, theme=theme)
+
+        self.assertEqual(get_template_folder(self.site.id), "capatel")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_template_folder(self.site.id), "capatel")
+
+        theme.slug = "default"
+        theme.save()
+        self.assertEqual(get_template_folder(self.site.id), "default")
+
+    def test_site_settings_snapshot_is_shared_across_requests(self):
+        SiteSettings.objects.create(
+            site=self.site,
+            site_name="Acme",
+            social_media=[
+                (
+                    "social_media",
+                    {"title": "Twitter", "link": "https://twitter.com/acme"},
+                )
+            ],
+        )
+        self.assertEqual(get_tenant(self.request).site_settings.site_name, "Acme")
+
+        request = RequestFactory().get("/", HTTP_HOST="acme.localhost")
+        with self.assertNumQueries(0):
+            site_settings = get_tenant(request).site_settings
+            self.assertEqual(site_settings.site_name, "Acme")
+            self.assertIsNone(site_settings.site_logo)
+            self.assertEqual(site_settings.social_media[0].value["title"], "Twitter")
+
+        site_settings.site_name = "Acme Corp"
+        site_settings.save()
+        request = RequestFactory().get("/", HTTP_HOST="acme.localhost")
+        self.assertEqual(SiteSettings.for_request(request).site_name, "Acme Corp")
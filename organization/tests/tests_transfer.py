@@ -0,0 +1,218 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+import wagtail_factories
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from wagtail.images import get_image_model
+from wagtail.models import Page
+from wagtail.rich_text import RichText
+
+from core.models import (
+    AboutPage,
+    BlogDetailPage,
+    BlogListPage,
+    ContactPage,
+    FormField,
+)
+from organization_menu.models import OrganizationMainMenuItem
+
+from ..models import Organization, OrganizationRootPage
+from ..transfer import export_organization, import_organization
+
+
+@mock.patch("organization.transfer.verify_organization_domain")
+@mock.patch("organization.transfer.request_nginx_reconcile")
+@mock.patch("organization.models.request_nginx_reconcile")
+class TransferTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_organization(self):
+        (organization,) = Organization.objects.bulk_create(
+            [Organization(name="Acme", domain="acme.localhost")]
+        )
+        organization.initialize_organization()
+        organization.refresh_from_db()
+
+        image = wagtail_factories.ImageFactory(collection=organization.collection)
+        contact_page = ContactPage.objects.get(site=organization.site)
+        about_page = AboutPage.objects.get(site=organization.site)
+        about_page.content = [
+            (
+                "image_content_block",
+                {
+                    "image": image,
+                    "caption": "Team",
+                    "content": RichText(
+                        '<p><a linktype="page" id="{}">Write to us</a></p>'.format(
+                            contact_page.pk
+                        )
+                    ),
+                },
+            )
+        ]
+        about_page.save_revision().publish()
+        return organization
+
+    def export_and_import(self, organization, **kwargs):
+        archive = io.BytesIO()
+        export_organization(organization, archive, chunk_size=3)
+        archive.seek(0)
+        return import_organization(
+            archive, name="Globex", domain="globex.localhost", chunk_size=3, **kwargs
+        )
+
+    def test_import_creates_a_copy(self, *mocks):
+        acme = self.create_organization()
+        globex = self.export_and_import(acme, user_mapping={"acme": "acme"})
+
+        self.assertEqual(globex.name, "Globex")
+        self.assertEqual(globex.site.hostname, "globex.localhost")
+        self.assertNotEqual(globex.site.pk, acme.site.pk)
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+
+        acme_root = OrganizationRootPage.objects.get(site=acme.site)
+        globex_root = OrganizationRootPage.objects.get(site=globex.site)
+        self.assertEqual(
+            list(globex_root.get_descendants().values_list("slug", "content_type")),
+            list(acme_root.get_descendants().values_list("slug", "content_type")),
+        )
+        self.assertEqual(globex.site.root_page.get_parent().pk, globex_root.pk)
+
+        # the chooser and the rich text link point at the copies
+        about_page = AboutPage.objects.get(site=globex.site)
+        block = about_page.content[0].value
+        contact_page = ContactPage.objects.get(site=globex.site)
+        self.assertEqual(block["image"].collection, globex.collection)
+        self.assertNotEqual(
+            block["image"].file.name,
+            AboutPage.objects.get(site=acme.site).content[0].value["image"].file.name,
+        )
+        self.assertIn('id="{}"'.format(contact_page.pk), block["content"].source)
+        self.assertEqual(get_image_model().objects.count(), 2)
+
+        # revisions follow their page
+        self.assertEqual(about_page.revisions.count(), 1)
+        self.assertEqual(about_page.live_revision.object_id, str(about_page.pk))
+        self.assertEqual(
+            about_page.live_revision.as_object().content[0].value["image"],
+            block["image"],
+        )
+
+        self.assertEqual(FormField.objects.filter(page=contact_page).count(), 5)
+        menu_items = OrganizationMainMenuItem.objects.filter(menu__site=globex.site)
+        self.assertEqual(menu_items.count(), 8)
+        self.assertFalse(
+            menu_items.exclude(link_page__in=globex_root.get_descendants()).exists()
+        )
+
+        # the mapped member keeps its groups, the group is renamed
+        self.assertEqual(globex.default_user, acme.default_user)
+        group = Group.objects.get(name="globex admins")
+        self.assertEqual(
+            group.page_permissions.filter(page=globex_root).count(),
+            acme.default_group.page_permissions.count(),
+        )
+        self.assertNotIn(group, globex.default_user.groups.all())
+
+    def test_import_checks_the_new_domain(
+        self, _, request_nginx_reconcile, verify_organization_domain
+    ):
+        acme = self.create_organization()
+        Organization.objects.filter(pk=acme.pk).update(
+            domain_status=Organization.DOMAIN_VERIFIED,
+            domain_checked_at=timezone.now(),
+            certificate_status=Organization.CERTIFICATE_VALID,
+            certificate_expires_at=timezone.now(),
+        )
+        # the search index queue is scheduled by the same commit
+        with mock.patch("search.queue.schedule_index_queue"):
+            with self.captureOnCommitCallbacks(execute=True):
+                globex = self.export_and_import(acme, user_mapping={"acme": "acme"})
+
+        globex.refresh_from_db()
+        self.assertEqual(globex.domain_status, Organization.DOMAIN_PENDING)
+        self.assertIsNone(globex.domain_checked_at)
+        self.assertEqual(globex.certificate_status, Organization.CERTIFICATE_NONE)
+        self.assertIsNone(globex.certificate_expires_at)
+        request_nginx_reconcile.assert_called_once_with()
+        verify_organization_domain.delay.assert_called_once_with(globex.pk)
+
+    def test_import_users(self, *mocks):
+        User = get_user_model()
+        acme = self.create_organization()
+        acme.default_user.is_superuser = True
+        acme.default_user.is_staff = True
+        acme.default_user.save()
+        acme.default_user.user_permissions.add(
+            Permission.objects.get(codename="add_organization")
+        )
+
+        archive = io.BytesIO()
+        export_organization(acme, archive)
+
+        def import_archive(**kwargs):
+            return import_organization(
+                io.BytesIO(archive.getvalue()),
+                name="Globex",
+                domain="globex.localhost",
+                **kwargs
+            )
+
+        # an existing username is never taken over
+        with self.assertRaises(ValueError):
+            import_archive()
+        with self.assertRaises(ValueError):
+            import_archive(user_mapping={"acme": "nobody"})
+        self.assertFalse(Organization.objects.filter(name="Globex").exists())
+
+        # in another environment, the users of the archive are created
+        User.objects.filter(pk=acme.default_user.pk).update(username="acme-old")
+        globex = import_archive()
+        user = User.objects.get(username="acme")
+        self.assertEqual(globex.default_user, user)
+        self.assertFalse(user.is_superuser)
+        self.assertFalse(user.is_staff)
+        self.assertFalse(user.user_permissions.exists())
+        self.assertEqual(
+            list(user.groups.all()), [Group.objects.get(name="globex admins")]
+        )
+
+    def test_blog_media_point_at_the_copies(self, *mocks):
+        acme = self.create_organization()
+        document = wagtail_factories.DocumentFactory(collection=acme.collection)
+        BlogListPage.objects.get(site=acme.site).add_child(
+            instance=BlogDetailPage(
+                title="Episode",
+                slug="episode",
+                blog_type="audio",
+                site=acme.site,
+                content=[("audio", {"file": document})],
+            )
+        )
+        globex = self.export_and_import(acme, user_mapping={"acme": "acme"})
+
+        post = BlogDetailPage.objects.get(site=globex.site)
+        self.assertEqual(post.audio_document.collection, globex.collection)
+        self.assertEqual(post.audio_document, post.content[0].value["file"])
+        self.assertNotEqual(post.get_audio_url(), document.url)
+
+    def test_import_refuses_existing_organization(self, *mocks):
+        acme = self.create_organization()
+        archive = io.BytesIO()
+        export_organization(acme, archive)
+        archive.seek(0)
+        with self.assertRaises(ValueError):
+            import_organization(archive)
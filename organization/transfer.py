@@ -0,0 +1,811 @@
+# organization/transfer.py
+"""
+Move an organization between environments as a tar.gz archive: its users,
+collections, images, documents, pages, revisions, menus and settings.
+
+The archive holds manifest.json, then one JSON lines member per model in
+the order they are imported, and the media files right before the records
+of their model. Records are read and written by chunks and files are copied
+as streams, so memory stays bounded whatever the size of the tenant.
+
+Primary keys are not kept: the importer allocates new ones and rewrites the
+foreign keys, chooser blocks and rich text links pointing inside the archive.
+Groups, tags, themes, locales, content types and permissions are matched
+with the existing rows by their natural key. Users are created without their
+superuser and staff flags; a username taken already stops the import unless
+it is mapped to an existing account, which the archive does not change.
+"""
+import io
+import json
+import logging
+import re
+import tarfile
+import tempfile
+import uuid
+from collections import defaultdict
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import CharField, Max, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+from modelcluster.models import get_all_child_relations
+from taggit.models import Tag
+from treebeard.mp_tree import MP_Node
+from wagtail import blocks
+from wagtail.documents import get_document_model
+from wagtail.fields import StreamField
+from wagtail.images import get_image_model
+from wagtail.models import (
+    Collection,
+    GroupCollectionPermission,
+    GroupPagePermission,
+    Locale,
+    Page,
+    Revision,
+    Site,
+)
+from wagtail.search.index import class_is_indexed
+
+from core.autocomplete import get_site_tags
+from search.queue import enqueue
+
+from .blueprints import bulk_insert
+from .nginx import request_nginx_reconcile
+from .tasks import verify_organization_domain
+
+logger = logging.getLogger("tentron")
+
+ARCHIVE_VERSION = 1
+TRANSFER_CHUNK_SIZE = getattr(settings, "ORGANIZATION_TRANSFER_CHUNK_SIZE", 500)
+# tar needs the size of a member before its content, the records of a model
+# are spooled to a temporary file past this size
+TRANSFER_SPOOL_SIZE = 8 * 1024 * 1024
+
+# models shared by the tenants, matched on import by these fields and
+# created when missing if the flag is set
+MATCHED_MODELS = {
+    "contenttypes.contenttype": (("app_label", "model"), False),
+    "auth.permission": (("content_type", "codename"), False),
+    "auth.group": (("name",), True),
+    "wagtailcore.locale": (("language_code",), True),
+    "taggit.tag": (("name",), True),
+    "theme.theme": (("slug",), True),
+}
+
+# fields of the archived users reset on import, the accounts only get the
+# access of their groups and organization memberships
+USER_RESET_FIELDS = {"is_superuser": False, "is_staff": False, "user_permissions": []}
+
+RICH_TEXT_REFERENCE_RE = re.compile(
+    r"<(?:a|embed)\b[^>]*\b(?:linktype|embedtype)=\"(page|image|document)\"[^>]*>"
+)
+RICH_TEXT_ID_RE = re.compile(r"\bid=\"(\d+)\"")
+
+
+def get_root_label(model):
+    """
+    The label the primary keys of model are mapped under, the rows of the
+    tables of a multi-table model share their primary key.
+    """
+    parents = model._meta.concrete_model._meta.get_parent_list()
+    return (parents[-1] if parents else model)._meta.label_lower
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def sort_models(models_, key):
+    """
+    Order models so the targets of their foreign keys come first. Ties and
+    cycles are broken by key, the foreign keys of a cycle are deferred by the
+    importer.
+    """
+    dependencies = {
+        model: {
+            field.related_model._meta.concrete_model
+            for field in model._meta.concrete_fields
+            if field.is_relation
+            and field.related_model._meta.concrete_model is not model
+        }
+        for model in models_
+    }
+    ordered = []
+    remaining = set(models_)
+    while remaining:
+        ready = [model for model in remaining if not dependencies[model] & remaining]
+        model = min(
+            ready or remaining, key=lambda model: (key(model), model._meta.label_lower)
+        )
+        ordered.append(model)
+        remaining.remove(model)
+    return ordered
+
+
+def get_references_models():
+    return {
+        "page": Page,
+        "image": get_image_model(),
+        "document": get_document_model(),
+    }
+
+
+class OrganizationExporter:
+    def __init__(self, organization, chunk_size=TRANSFER_CHUNK_SIZE):
+        self.organization = organization
+        self.chunk_size = chunk_size
+        self.site = organization.site
+        self.group = Group.objects.filter(
+            name=organization.lower_name + " admins"
+        ).first()
+
+    def get_page_queryset(self):
+        organization_root_page = apps.get_model(
+            "organization", "OrganizationRootPage"
+        ).objects.get(site=self.site)
+        return Page.objects.descendant_of(organization_root_page, inclusive=True)
+
+    def get_site_models(self, page_queryset):
+        """
+        Return {model: Q} of the page tables, the models scoped by the site and
+        their child relations, all exported after the pages.
+        """
+        skipped = {
+            model._meta.concrete_model
+            for model in (
+                apps.get_model("organization", "Organization"),
+                apps.get_model("organization", "ExtendedSite"),
+                apps.get_model("organization", "OrganizationMembership"),
+            )
+        }
+        filters = defaultdict(list)
+        page_ids = page_queryset.values("pk")
+        for content_type_id in (
+            page_queryset.order_by().values_list("content_type", flat=True).distinct()
+        ):
+            page_model = ContentType.objects.get_for_id(content_type_id).model_class()
+            for parent in page_model._meta.get_parent_list() + [page_model]:
+                if parent is not Page and not parent._meta.abstract:
+                    filters[parent] = [Q(pk__in=page_ids)]
+        for model in apps.get_models():
+            if issubclass(model, Page) or model in skipped:
+                continue
+            for field in model._meta.concrete_fields:
+                if field.name == "site" and field.related_model is Site:
+                    filters[model].append(Q(site=self.site))
+
+        # the child relations of the exported rows, until no new model shows up
+        relations = defaultdict(list)
+        parents = list(filters)
+        seen = set(parents)
+        while parents:
+            parent = parents.pop()
+            for relation in get_all_child_relations(parent):
+                child = relation.related_model._meta.concrete_model
+                if child in skipped:
+                    continue
+                relations[child].append((parent, relation.field.name))
+                if child not in seen:
+                    seen.add(child)
+                    parents.append(child)
+
+        resolved = {}
+
+        def get_filter(model):
+            if model not in resolved:
+                # a cycle of child relations stops at the rows found so far
+                resolved[model] = Q(pk__in=[])
+                q_list = list(filters[model])
+                for parent, field_name in relations[model]:
+                    parent_ids = parent._base_manager.filter(get_filter(parent)).values(
+                        "pk"
+                    )
+                    q_list.append(Q(**{field_name + "__in": parent_ids}))
+                resolved[model] = reduce(or_, q_list)
+            return resolved[model]
+
+        return {model: get_filter(model) for model in seen}
+
+    def get_sections(self):
+        User = get_user_model()
+        organization = self.organization
+        page_queryset = self.get_page_queryset()
+        collection = organization.collection
+        collections = (
+            Collection.objects.filter(path__startswith=collection.path)
+            if collection
+            else Collection.objects.none()
+        )
+
+        users = Q(organization_memberships__organization=organization)
+        if self.group:
+            users |= Q(groups=self.group)
+
+        sections = [
+            (ContentType, ContentType.objects.order_by("pk")),
+            (
+                Permission,
+                Permission.objects.filter(
+                    Q(group=self.group) | Q(groupcollectionpermission__group=self.group)
+                ).distinct()
+                if self.group
+                else Permission.objects.none(),
+            ),
+            (Group, Group.objects.filter(pk=getattr(self.group, "pk", None))),
+            (User, User.objects.filter(users).distinct()),
+            (Locale, Locale.objects.all()),
+            (Tag, get_site_tags(Tag, self.site)[0].distinct()),
+            (apps.get_model("theme", "Theme"), None),
+            (Collection, collections.order_by("path")),
+            (
+                get_image_model(),
+                get_image_model().objects.filter(collection__in=collections),
+            ),
+            (
+                get_document_model(),
+                get_document_model().objects.filter(collection__in=collections),
+            ),
+            (Page, page_queryset.order_by("path")),
+            (Site, Site.objects.filter(pk=self.site.pk)),
+            (
+                type(organization),
+                type(organization).all_objects.filter(pk=organization.pk),
+            ),
+            (
+                apps.get_model("organization", "ExtendedSite"),
+                apps.get_model("organization", "ExtendedSite").objects.filter(
+                    site=self.site
+                ),
+            ),
+            (
+                apps.get_model("organization", "OrganizationMembership"),
+                apps.get_model("organization", "OrganizationMembership").objects.filter(
+                    organization=organization
+                ),
+            ),
+        ]
+        site_models = self.get_site_models(page_queryset)
+        # snippets before the pages, their stream fields may choose them
+        for model in sort_models(
+            set(site_models), key=lambda model: issubclass(model, Page)
+        ):
+            sections.append(
+                (model, model._base_manager.filter(site_models[model]).order_by("pk"))
+            )
+        sections += [
+            (
+                Revision,
+                Revision.objects.filter(
+                    base_content_type=ContentType.objects.get_for_model(Page),
+                    object_id__in=page_queryset.annotate(
+                        object_id=Cast("pk", CharField())
+                    ).values("object_id"),
+                ).order_by("pk"),
+            ),
+            (
+                GroupPagePermission,
+                GroupPagePermission.objects.filter(
+                    group=self.group, page__in=page_queryset
+                ),
+            ),
+            (
+                GroupCollectionPermission,
+                GroupCollectionPermission.objects.filter(
+                    group=self.group, collection__in=collections
+                ),
+            ),
+        ]
+        return [
+            (model, model._base_manager.all() if queryset is None else queryset)
+            for model, queryset in sections
+        ]
+
+    def write(self, fileobj):
+        sections = self.get_sections()
+        manifest = {
+            "version": ARCHIVE_VERSION,
+            "exported_at": timezone.now().isoformat(),
+            "organization": {
+                "name": self.organization.name,
+                "domain": self.organization.domain,
+            },
+            "sections": [model._meta.label_lower for model, _ in sections],
+        }
+        counts = {}
+        with tarfile.open(fileobj=fileobj, mode="w:gz") as archive:
+            data = json.dumps(manifest).encode()
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+            for position, (model, queryset) in enumerate(sections):
+                self.add_files(archive, model, queryset)
+                counts[model._meta.label_lower] = self.add_records(
+                    archive, position, model, queryset
+                )
+        return counts
+
+    def add_files(self, archive, model, queryset):
+        file_fields = [
+            field
+            for field in model._meta.local_concrete_fields
+            if isinstance(field, models.FileField)
+        ]
+        for field in file_fields:
+            names = queryset.exclude(**{field.name: ""}).values_list(
+                field.name, flat=True
+            )
+            for name in names.iterator(chunk_size=self.chunk_size):
+                if not field.storage.exists(name):
+                    logger.warning("Skipping missing file %s", name)
+                    continue
+                info = tarfile.TarInfo(
+                    "media/{}/{}/{}".format(model._meta.label_lower, field.name, name)
+                )
+                info.size = field.storage.size(name)
+                with field.storage.open(name, "rb") as media_file:
+                    # copied by blocks, the file is never read whole
+                    archive.addfile(info, media_file)
+
+    def add_records(self, archive, position, model, queryset):
+        count = 0
+        with tempfile.SpooledTemporaryFile(TRANSFER_SPOOL_SIZE) as spool:
+            for chunk in iter_chunks(
+                queryset.iterator(chunk_size=self.chunk_size), self.chunk_size
+            ):
+                for record in serializers.serialize("python", chunk):
+                    spool.write(json.dumps(record, cls=DjangoJSONEncoder).encode())
+                    spool.write(b"\n")
+                    count += 1
+            info = tarfile.TarInfo(
+                "records/{:03d}-{}.jsonl".format(position, model._meta.label_lower)
+            )
+            info.size = spool.tell()
+            spool.seek(0)
+            archive.addfile(info, spool)
+        return count
+
+
+class OrganizationImporter:
+    def __init__(
+        self, name=None, domain=None, chunk_size=TRANSFER_CHUNK_SIZE, user_mapping=None
+    ):
+        self.name = name
+        self.domain = domain
+        self.chunk_size = chunk_size
+        # archived username -> username of the existing account taking its place
+        self.user_mapping = user_mapping or {}
+        # root label -> {primary key in the archive: new primary key}
+        self.mapping = defaultdict(dict)
+        self.file_names = {}
+        self.saved_files = []
+        self.translation_keys = {}
+        # (model, new pk, attname, target label, archived target pk) of the
+        # foreign keys pointing at rows not imported yet
+        self.deferred = []
+        self.tree_prefixes = {}
+        self.tree_offsets = {}
+        # {model: [new pk]} of the pages with media columns derived from
+        # their content, see denormalize_media
+        self.denormalized = defaultdict(list)
+        self.organization = None
+
+    def read(self, fileobj):
+        # the archive is read as a stream, members are handled in order
+        with tarfile.open(fileobj=fileobj, mode="r|gz") as archive:
+            for member in archive:
+                member_file = archive.extractfile(member)
+                if member_file is None:
+                    continue
+                if member.name == "manifest.json":
+                    self.load_manifest(json.load(member_file))
+                elif member.name.startswith("media/"):
+                    self.import_file(member, member_file)
+                elif member.name.startswith("records/"):
+                    label = member.name.split("-", 1)[1][: -len(".jsonl")]
+                    self.import_records(apps.get_model(label), member_file)
+        self.resolve_deferred()
+        self.denormalize_media()
+        return self.organization
+
+    def load_manifest(self, manifest):
+        if manifest.get("version") != ARCHIVE_VERSION:
+            raise ValueError("Unsupported archive version %r" % manifest.get("version"))
+        self.original_name = manifest["organization"]["name"]
+        self.original_domain = manifest["organization"]["domain"]
+        self.name = self.name or self.original_name
+        self.domain = self.domain or self.original_domain
+        self.pending_labels = [
+            get_root_label(apps.get_model(label)) for label in manifest["sections"]
+        ]
+
+        Organization = apps.get_model("organization", "Organization")
+        if Organization.all_objects.filter(name=self.name).exists():
+            raise ValueError("Organization %s exists already" % self.name)
+        if Site.objects.filter(hostname=self.domain).exists():
+            raise ValueError("A site with the domain %s exists already" % self.domain)
+
+    def import_file(self, member, member_file):
+        _, label, field_name, name = member.name.split("/", 3)
+        field = apps.get_model(label)._meta.get_field(field_name)
+        content = File(member_file, name=name)
+        content.size = member.size
+        new_name = field.storage.save(name, content)
+        self.saved_files.append((field.storage, new_name))
+        self.file_names[(label, field_name, name)] = new_name
+
+    def delete_saved_files(self):
+        for storage, name in self.saved_files:
+            storage.delete(name)
+
+    def import_records(self, model, member_file):
+        self.current_label = get_root_label(model)
+        lines = (json.loads(line) for line in member_file if line.strip())
+        for chunk in iter_chunks(lines, self.chunk_size):
+            if model._meta.label_lower in MATCHED_MODELS:
+                for record in chunk:
+                    self.import_matched(model, record)
+            elif model is get_user_model():
+                for record in chunk:
+                    self.import_user(model, record)
+            else:
+                self.import_chunk(model, chunk)
+        self.pending_labels.remove(self.current_label)
+
+    def build(self, model, record):
+        (deserialized,) = serializers.deserialize("python", [record])
+        return deserialized.object, deserialized.m2m_data
+
+    def import_matched(self, model, record):
+        lookup_fields, create = MATCHED_MODELS[model._meta.label_lower]
+        old_pk = record["pk"]
+        deferred = self.remap_record(model, record, strict=False)
+        lookup = {field: record["fields"][field] for field in lookup_fields}
+        instance = model._base_manager.filter(**lookup).first()
+        if instance is None:
+            if not create:
+                logger.info("No %s matches %s", model._meta.label, lookup)
+                return
+            instance, m2m_data = self.build(model, record)
+            model._base_manager.bulk_create([instance])
+            for field_name, values in m2m_data.items():
+                getattr(instance, field_name).add(*values)
+        # an existing row keeps its own many to many relations
+        self.mapping[get_root_label(model)][old_pk] = instance.pk
+        self.defer(model, [instance], deferred)
+
+    def import_user(self, model, record):
+        old_pk = record["pk"]
+        username = record["fields"][model.USERNAME_FIELD]
+        if username in self.user_mapping:
+            lookup = {model.USERNAME_FIELD: self.user_mapping[username]}
+            instance = model._base_manager.filter(**lookup).first()
+            if instance is None:
+                raise ValueError(
+                    "No user %s to map %s to" % (self.user_mapping[username], username)
+                )
+            # the account is only linked to the tenant, the archive does not
+            # change its groups or permissions
+            self.mapping[get_root_label(model)][old_pk] = instance.pk
+            return
+        if model._base_manager.filter(**{model.USERNAME_FIELD: username}).exists():
+            raise ValueError(
+                "A user named %s exists already, map it to an existing user" % username
+            )
+        record["fields"].update(USER_RESET_FIELDS)
+        deferred = self.remap_record(model, record, strict=False)
+        instance, m2m_data = self.build(model, record)
+        model._base_manager.bulk_create([instance])
+        self.mapping[get_root_label(model)][old_pk] = instance.pk
+        self.defer(model, [instance], deferred)
+        for field_name, values in m2m_data.items():
+            getattr(instance, field_name).add(*values)
+
+    def import_chunk(self, model, records):
+        pk_field = model._meta.pk
+        old_pks = [record["pk"] for record in records]
+        deferred = []
+        objs = []
+        m2m = []
+        for record in records:
+            deferred.append(self.remap_record(model, record))
+            obj, m2m_data = self.build(model, record)
+            objs.append(obj)
+            m2m.append(m2m_data)
+
+        if model is Page:
+            ids = bulk_insert(Page, objs, returning=True)
+            for obj, (new_pk,) in zip(objs, ids):
+                obj.pk = new_pk
+        elif pk_field.remote_field and pk_field.remote_field.parent_link:
+            bulk_insert(model, objs)
+        else:
+            model._base_manager.bulk_create(objs)
+
+        label = get_root_label(model)
+        if not pk_field.is_relation:
+            for old_pk, obj in zip(old_pks, objs):
+                self.mapping[label][old_pk] = obj.pk
+        for obj, fields in zip(objs, deferred):
+            self.defer(model, [obj], fields)
+        for obj, m2m_data in zip(objs, m2m):
+            for field_name, values in m2m_data.items():
+                getattr(obj, field_name).add(*values)
+
+        if hasattr(model, "denormalize_media"):
+            self.denormalized[model] += [obj.pk for obj in objs]
+        if model is Page or (class_is_indexed(model) and not issubclass(model, Page)):
+            enqueue(objs)
+        if model._meta.label_lower == "organization.organization":
+            self.organization = objs[0]
+
+    def defer(self, model, objs, deferred):
+        for obj in objs:
+            for attname, target_label, value in deferred:
+                self.deferred.append((model, obj.pk, attname, target_label, value))
+
+    def resolve_deferred(self):
+        updates = defaultdict(list)
+        for model, pk, attname, target_label, value in self.deferred:
+            new_value = self.mapping[target_label].get(value)
+            if new_value is not None:
+                obj = model(pk=pk)
+                setattr(obj, attname, new_value)
+                updates[(model, attname)].append(obj)
+        for (model, attname), objs in updates.items():
+            model._base_manager.bulk_update(objs, [attname], batch_size=self.chunk_size)
+
+    def denormalize_media(self):
+        # the pages are inserted without save(), their media columns are set
+        # again from the remapped content
+        for model, pks in self.denormalized.items():
+            for chunk in iter_chunks(pks, self.chunk_size):
+                pages = list(model._base_manager.filter(pk__in=chunk))
+                model.denormalize_media(pages)
+                model._base_manager.bulk_update(pages, model.media_fields)
+
+    def map_pk(self, model, value):
+        if value is None:
+            return None
+        return self.mapping[get_root_label(model)].get(value)
+
+    def remap_record(self, model, record, strict=True):
+        """
+        Rewrite the record of an archived row for this database, in place.
+        Return the (attname, target label, archived value) of the foreign
+        keys to rows imported later. With strict, a required foreign key to a
+        row outside of the archive is an error.
+        """
+        deferred = []
+        pk_field = model._meta.pk
+        if pk_field.is_relation:
+            record["pk"] = self.map_pk(pk_field.related_model, record["pk"])
+        else:
+            record["pk"] = None
+
+        fields = record["fields"]
+        for name, value in list(fields.items()):
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                fields[name] = [
+                    pk
+                    for pk in (self.map_pk(field.related_model, v) for v in value)
+                    if pk is not None
+                ]
+            elif field.is_relation:
+                fields[name] = self.map_pk(field.related_model, value)
+                target_label = get_root_label(field.related_model)
+                if fields[name] is None and value is not None:
+                    if target_label in self.pending_labels and field.null:
+                        deferred.append((field.attname, target_label, value))
+                    elif strict and not field.null:
+                        raise ValueError(
+                            "%s.%s points at a row outside of the archive"
+                            % (model._meta.label, name)
+                        )
+            elif isinstance(field, models.FileField) and value:
+                fields[name] = self.file_names.get(
+                    (model._meta.label_lower, name, value), value
+                )
+            elif isinstance(field, StreamField) and value:
+                fields[name] = self.remap_stream(field.stream_block, value)
+            elif isinstance(field, models.TextField) and value:
+                fields[name] = self.remap_rich_text(value)
+            elif name == "translation_key":
+                fields[name] = str(
+                    self.translation_keys.setdefault(value, uuid.uuid4())
+                )
+        if model is Revision:
+            self.remap_revision(fields)
+        if issubclass(model, MP_Node) and "path" in fields:
+            self.remap_tree(model, fields)
+        if getattr(model, "_mptt_meta", None) and "tree_id" in fields:
+            if model not in self.tree_offsets:
+                self.tree_offsets[model] = (
+                    model._base_manager.aggregate(max_tree_id=Max("tree_id"))[
+                        "max_tree_id"
+                    ]
+                    or 0
+                )
+            fields["tree_id"] += self.tree_offsets[model]
+        self.rename(model, fields)
+        return deferred
+
+    def remap_tree(self, model, fields):
+        """
+        Move the archived subtree under the root node of this database, after
+        its last child.
+        """
+        if model not in self.tree_prefixes:
+            root = model.get_first_root_node()
+            last_child = root.get_last_child()
+            step = (
+                model._str2int(last_child.path[-model.steplen :]) + 1
+                if last_child
+                else 1
+            )
+            self.tree_prefixes[model] = (
+                fields["path"],
+                model._get_path(root.path, root.depth + 1, step),
+                root.depth + 1 - fields["depth"],
+            )
+            model.objects.filter(pk=root.pk).update(numchild=models.F("numchild") + 1)
+        old_prefix, new_prefix, depth_delta = self.tree_prefixes[model]
+        fields["path"] = new_prefix + fields["path"][len(old_prefix) :]
+        fields["depth"] += depth_delta
+
+    def remap_revision(self, fields):
+        base_model = ContentType.objects.get_for_id(
+            fields["base_content_type"]
+        ).model_class()
+        object_id = self.map_pk(base_model, int(fields["object_id"]))
+        if object_id is None:
+            raise ValueError(
+                "Revision of %s %s outside of the archive"
+                % (base_model._meta.label, fields["object_id"])
+            )
+        fields["object_id"] = str(object_id)
+        model = ContentType.objects.get_for_id(fields["content_type"]).model_class()
+        content = fields["content"]
+        if not isinstance(content, dict) or model is None:
+            return
+        content["pk"] = object_id
+        for name, value in list(content.items()):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.is_relation and field.concrete and not field.many_to_many:
+                content[name] = self.map_pk(field.related_model, value)
+            elif isinstance(field, StreamField) and value:
+                content[name] = self.remap_stream(field.stream_block, value)
+            elif isinstance(field, models.TextField) and value:
+                content[name] = self.remap_rich_text(value)
+            elif name == "translation_key":
+                content[name] = str(
+                    self.translation_keys.setdefault(value, uuid.uuid4())
+                )
+            elif name == "path":
+                old_prefix, new_prefix, _ = self.tree_prefixes[Page]
+                content[name] = new_prefix + value[len(old_prefix) :]
+        # the children keep the primary keys of their live rows
+        for relation in get_all_child_relations(model):
+            for child in content.get(relation.get_accessor_name()) or []:
+                child["pk"] = self.map_pk(relation.related_model, child.get("pk"))
+                child[relation.field.name] = object_id
+
+    def remap_stream(self, stream_block, value):
+        is_json = isinstance(value, str)
+        data = json.loads(value) if is_json else value
+        data = self.remap_block_value(stream_block, data)
+        return json.dumps(data, cls=DjangoJSONEncoder) if is_json else data
+
+    def remap_block_value(self, block, value):
+        if value is None:
+            return None
+        if isinstance(block, blocks.StreamBlock):
+            for child in value:
+                child_block = block.child_blocks.get(child.get("type"))
+                if child_block is not None:
+                    child["value"] = self.remap_block_value(child_block, child["value"])
+        elif isinstance(block, blocks.ListBlock):
+            for position, item in enumerate(value):
+                if isinstance(item, dict) and item.get("type") == "item":
+                    item["value"] = self.remap_block_value(
+                        block.child_block, item["value"]
+                    )
+                else:
+                    value[position] = self.remap_block_value(block.child_block, item)
+        elif isinstance(block, blocks.StructBlock):
+            for name, child_block in block.child_blocks.items():
+                if name in value:
+                    value[name] = self.remap_block_value(child_block, value[name])
+        elif isinstance(block, blocks.ChooserBlock):
+            return self.map_pk(block.model_class, value)
+        elif isinstance(block, blocks.RichTextBlock):
+            return self.remap_rich_text(value)
+        return value
+
+    def remap_rich_text(self, value):
+        references_models = get_references_models()
+
+        def replace_id(match):
+            model = references_models[match.group(1)]
+            return RICH_TEXT_ID_RE.sub(
+                lambda id_match: 'id="{}"'.format(
+                    self.map_pk(model, int(id_match.group(1))) or id_match.group(1)
+                ),
+                match.group(0),
+            )
+
+        return RICH_TEXT_REFERENCE_RE.sub(replace_id, value)
+
+    def rename(self, model, fields):
+        label = model._meta.label_lower
+        if label == "organization.organization":
+            fields["name"] = self.name
+            fields["domain"] = self.domain
+            # the domain is checked again and the certificate of the source
+            # is not on this server, see import_organization
+            fields["domain_status"] = model.DOMAIN_PENDING
+            fields["domain_checked_at"] = None
+            fields["certificate_status"] = model.CERTIFICATE_NONE
+            fields["certificate_expires_at"] = None
+            fields["certificate_requested_at"] = None
+            fields["certificate_error"] = ""
+        elif label == "wagtailcore.site":
+            fields["hostname"] = self.domain
+            if self.name != self.original_name:
+                fields["site_name"] = "{} Site".format(self.name)
+        elif label == "auth.group":
+            if fields["name"] == self.original_name.lower() + " admins":
+                fields["name"] = self.name.lower() + " admins"
+        elif label == "wagtailcore.collection":
+            if fields["name"] == self.original_name:
+                fields["name"] = self.name
+
+
+def export_organization(organization, fileobj, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Write organization to fileobj, return the number of rows per model."""
+    return OrganizationExporter(organization, chunk_size).write(fileobj)
+
+
+def import_organization(
+    fileobj, name=None, domain=None, chunk_size=TRANSFER_CHUNK_SIZE, user_mapping=None
+):
+    """
+    Create the organization of an archive, renamed to name and domain when
+    they are given. user_mapping maps archived usernames to the existing
+    accounts taking their place. The rows are written in one transaction,
+    the media files saved before a failure are deleted. As save() is not
+    called, the vhosts and the domain check are requested here.
+    """
+    importer = OrganizationImporter(name, domain, chunk_size, user_mapping)
+    try:
+        with transaction.atomic():
+            organization = importer.read(fileobj)
+            request_nginx_reconcile()
+            transaction.on_commit(
+                lambda: verify_organization_domain.delay(organization.pk)
+            )
+            return organization
+    except Exception:
+        importer.delete_saved_files()
+        raise
@@ -35,6 +35,7 @@ from wagtail.log_actions import log
 from wagtail.models import Site
 
 from .models import ExtendedSite, SiteSettings
+from .tenant import get_tenant
 
 
 @login_required
@@ -263,8 +264,7 @@ class SiteSettingsIndexView(WMABaseView):
 
 @require_GET
 def robotstxt(request):
-    site = Site.find_for_request(request)
-    site_settings = SiteSettings.for_site(site)
+    site_settings = get_tenant(request).site_settings
     # get site setting robots.txt
     robots_txt = site_settings.robots_txt
     return HttpResponse(robots_txt, content_type="text/plain")
@@ -14,6 +14,7 @@ from wagtail.models import Site
 from organization.models import OrganizationRootPage
 
 from .models import ExtendedSite, Organization, SiteSettings
+from .page_cache import mark_served_page
 from .utils import CommonPermissionHelper, ExtendedSitePermissionHelper
 from .views import SiteSettingsIndexView
 
@@ -76,7 +77,15 @@ class OrganizationAdmin(ModelAdmin):
     menu_order = 298
     add_to_settings_menu = False
     exclude_from_explorer = False
-    list_display = ("name",)
+    list_display = (
+        "name",
+        "domain",
+        "provisioning_status",
+        "domain_status",
+        "certificate_status",
+        "certificate_expires_at",
+    )
+    list_filter = ("provisioning_status", "domain_status", "certificate_status")
 
 
 modeladmin_register(OrganizationAdmin)
@@ -125,3 +134,10 @@ class ThemeChooser(Chooser):
         if request.user.is_superuser:
             return qs
         return qs.filter(Q(user=request.user) | Q(is_common=True))
+
+
+# ahead of the view restriction check of wagtail, which returns the password
+# or login response and stops the hooks
+@hooks.register("before_serve_page", order=-1)
+def mark_page_cache_restriction(page, request, serve_args, serve_kwargs):
+    mark_served_page(page, request)
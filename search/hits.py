@@ -0,0 +1,89 @@
+# search/hits.py
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from wagtail.search.models import Query, QueryDailyHits
+from wagtail.search.utils import normalise_query_string
+
+logger = logging.getLogger("tentron")
+
+# pending hits are written once there are this many, or after this many seconds
+SEARCH_HITS_FLUSH_SIZE = getattr(settings, "SEARCH_HITS_FLUSH_SIZE", 100)
+SEARCH_HITS_FLUSH_INTERVAL = getattr(settings, "SEARCH_HITS_FLUSH_INTERVAL", 60)
+
+_pending_hits = Counter()
+_last_flush = time.monotonic()
+_lock = threading.Lock()
+
+
+def record_hit(query_string):
+    """
+    Count a search for query_string in this process, the counts are written
+    to the search Query tables in batches by flush_hits.
+    """
+    query_string = normalise_query_string(query_string)
+    if not query_string:
+        return
+    with _lock:
+        _pending_hits[query_string] += 1
+        flush_due = (
+            sum(_pending_hits.values()) >= SEARCH_HITS_FLUSH_SIZE
+            or time.monotonic() - _last_flush >= SEARCH_HITS_FLUSH_INTERVAL
+        )
+    if flush_due:
+        flush_hits()
+
+
+def flush_hits():
+    """
+    Write the pending hits: the missing query and daily rows are inserted
+    in bulk, then one update adds the counts of the day.
+    """
+    global _last_flush
+    with _lock:
+        hits = dict(_pending_hits)
+        _pending_hits.clear()
+        _last_flush = time.monotonic()
+    if not hits:
+        return
+
+    today = timezone.now().date()
+    try:
+        # the query strings are normalised by record_hit already
+        Query.objects.bulk_create(
+            [Query(query_string=query_string) for query_string in hits],
+            ignore_conflicts=True,
+        )
+        query_ids = dict(
+            Query.objects.filter(query_string__in=hits).values_list(
+                "query_string", "pk"
+            )
+        )
+        QueryDailyHits.objects.bulk_create(
+            [QueryDailyHits(query_id=pk, date=today) for pk in query_ids.values()],
+            ignore_conflicts=True,
+        )
+        QueryDailyHits.objects.filter(
+            date=today, query_id__in=query_ids.values()
+        ).update(
+            hits=F("hits")
+            + Case(
+                *[
+                    When(query_id=pk, then=Value(hits[query_string]))
+                    for query_string, pk in query_ids.items()
+                ],
+                output_field=IntegerField(),
+            )
+        )
+    except Exception as e:
+        logger.error("Failed to flush {} search hits: {}".format(len(hits), e))
+
+
+# do not lose the last batch when a worker shuts down
+atexit.register(flush_hits)
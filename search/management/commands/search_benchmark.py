@@ -0,0 +1,152 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from wagtail.models import Page, Site
+from wagtail.search.backends import get_search_backend
+
+from core.models import FaqItem
+
+# compared with the configured backend when no --backend is given, the
+# icontains fallback shows what the full text index gains
+PROPOSED_BACKENDS = ["wagtail.search.backends.database.fallback"]
+VOCABULARY_SIZE = 5000
+QUESTION_WORDS = 8
+ANSWER_WORDS = 40
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark tenant scoped search latency of the configured search "
+        "backend against proposed ones on synthetic FAQ items. Everything is "
+        "rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[10000, 100000, 1000000],
+            help="Number of indexed rows to measure at, in increasing order",
+        )
+        parser.add_argument("--tenants", type=int, default=10)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--backend",
+            action="append",
+            dest="backends",
+            help="Dotted path of a backend to compare with the configured one, "
+            "can be repeated",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def make_text(self, rng, vocabulary, length):
+        return " ".join(rng.choice(vocabulary) for _ in range(length))
+
+    def add_rows(self, sites, count, start, index_backend, rng, vocabulary, options):
+        for offset in range(0, count, options["batch_size"]):
+            batch = [
+                FaqItem(
+                    site=sites[(start + offset + number) % len(sites)],
+                    question=self.make_text(rng, vocabulary, QUESTION_WORDS),
+                    answer="<p>{}</p>".format(
+                        self.make_text(rng, vocabulary, ANSWER_WORDS)
+                    ),
+                )
+                for number in range(min(options["batch_size"], count - offset))
+            ]
+            FaqItem.objects.bulk_create(batch)
+            index_backend.add_bulk(FaqItem, batch)
+
+    def time_queries(self, backend, site, queries):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            list(
+                backend.search(
+                    query, FaqItem.objects.filter(site=site, published=True)
+                )[:10]
+            )
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        if rows != sorted(rows) or rows[0] < 1:
+            raise CommandError("--rows must be positive and in increasing order")
+        if options["tenants"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--tenants and --batch-size must be positive")
+
+        # the proposed backends get the options of the configured one
+        params = dict(settings.WAGTAILSEARCH_BACKENDS["default"])
+        params.pop("BACKEND")
+        configured = get_search_backend("default")
+        backends = [("configured", configured)] + [
+            (path.rsplit(".", 1)[-1], get_search_backend(path, **params))
+            for path in options["backends"] or PROPOSED_BACKENDS
+        ]
+        self.stdout.write(
+            "configured: {}.{}".format(
+                type(configured).__module__, type(configured).__name__
+            )
+        )
+        # rows are indexed with the configured backend, the fallback backend
+        # does not use the index and queries the model tables directly
+        index_backend = configured
+        rng = random.Random(options["seed"])
+        vocabulary = [
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(7))
+            for _ in range(VOCABULARY_SIZE)
+        ]
+        queries = [
+            self.make_text(rng, vocabulary, rng.randint(1, 2))
+            for _ in range(options["queries"])
+        ]
+
+        self.stdout.write(
+            "{:>9} {:<12} {:>10} {:>10}".format("rows", "backend", "p50", "p95")
+        )
+        with transaction.atomic():
+            root_page = Page.objects.get(depth=1)
+            sites = [
+                Site.objects.create(
+                    hostname="tenant-{}.search-benchmark.invalid".format(number),
+                    root_page=root_page,
+                )
+                for number in range(options["tenants"])
+            ]
+            indexed = 0
+            for target in rows:
+                self.add_rows(
+                    sites,
+                    target - indexed,
+                    indexed,
+                    index_backend,
+                    rng,
+                    vocabulary,
+                    options,
+                )
+                indexed = target
+                for name, backend in backends:
+                    timings = self.time_queries(backend, sites[0], queries)
+                    self.stdout.write(
+                        "{:>9} {:<12} {:>8.2f}ms {:>8.2f}ms".format(
+                            target,
+                            name,
+                            percentile(timings, 50) * 1000,
+                            percentile(timings, 95) * 1000,
+                        )
+                    )
+            transaction.set_rollback(True)
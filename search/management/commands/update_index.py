@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from wagtail.search.backends import get_search_backend
+from wagtail.search.management.commands import update_index
+
+from search.models import IndexCheckpoint, IndexQueueEntry
+from search.queue import index_pending, index_queue_entries
+
+LAST_CHECKPOINT = "checkpoint"
+
+
+class Command(update_index.Command):
+    help = (
+        "Rebuild the search index, or with --since only reindex the objects "
+        "queued after a checkpoint"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--since",
+            nargs="?",
+            const=LAST_CHECKPOINT,
+            default=None,
+            help=(
+                "Only reindex objects changed after this ISO datetime, or after "
+                "the last run when no value is given"
+            ),
+        )
+
+    def get_since(self, value, backend_name):
+        if value == LAST_CHECKPOINT:
+            checkpoint = IndexCheckpoint.objects.filter(
+                backend_name=backend_name
+            ).first()
+            return checkpoint.indexed_until if checkpoint else None
+        since = parse_datetime(value)
+        if since is None:
+            raise CommandError("--since expects an ISO datetime, got %r" % value)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def update_backend_since(self, backend_name, since, chunk_size):
+        backend = get_search_backend(backend_name)
+        self.write(
+            "{}: reindexing objects changed since {}".format(
+                backend_name, since.isoformat()
+            )
+        )
+        entries = IndexQueueEntry.objects.filter(
+            queued_at__gte=since, indexed_at__isnull=False
+        ).order_by("pk")
+        count = 0
+        for chunk in self.queryset_chunks(entries, chunk_size):
+            count += index_queue_entries(chunk, [backend])
+        # entries the worker has not seen yet are processed for every backend
+        count += index_pending(chunk_size)
+        self.write("{}: indexed {} objects".format(backend_name, count))
+
+    def handle(self, **options):
+        self.verbosity = options["verbosity"]
+        if options["backend_name"]:
+            backend_names = [options["backend_name"]]
+        else:
+            backend_names = list(
+                getattr(settings, "WAGTAILSEARCH_BACKENDS", {"default": {}})
+            )
+
+        for backend_name in backend_names:
+            started_at = timezone.now()
+            since = None
+            if options["since"] is not None:
+                since = self.get_since(options["since"], backend_name)
+                if since is None:
+                    self.write(
+                        "{}: no checkpoint yet, rebuilding the whole index".format(
+                            backend_name
+                        )
+                    )
+
+            if since is None:
+                self.update_backend(
+                    backend_name,
+                    schema_only=options["schema_only"],
+                    chunk_size=options["chunk_size"],
+                )
+            else:
+                self.update_backend_since(backend_name, since, options["chunk_size"])
+
+            if not options["schema_only"]:
+                IndexCheckpoint.objects.update_or_create(
+                    backend_name=backend_name,
+                    defaults={"indexed_until": started_at},
+                )
@@ -0,0 +1,38 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.utils import timezone
+
+
+class IndexQueueEntry(models.Model):
+    """
+    An object whose search index entry has to be refreshed. There is one row
+    per object, saving it again before the worker runs only moves queued_at.
+    """
+
+    content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, related_name="+"
+    )
+    object_id = models.CharField(max_length=255)
+    queued_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # null while the object waits for the worker
+    indexed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        unique_together = ("content_type", "object_id")
+        verbose_name_plural = "index queue entries"
+
+    def __str__(self):
+        return "{}:{}".format(self.content_type_id, self.object_id)
+
+
+class IndexCheckpoint(models.Model):
+    """
+    Time up to which a search backend is known to be up to date, used by
+    update_index --since.
+    """
+
+    backend_name = models.CharField(max_length=255, unique=True)
+    indexed_until = models.DateTimeField()
+
+    def __str__(self):
+        return "{} @ {}".format(self.backend_name, self.indexed_until)
@@ -0,0 +1,118 @@
+# search/queue.py
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from wagtail.models import Page
+from wagtail.search.backends import get_search_backends
+from wagtail.search.index import class_is_indexed
+
+from .models import IndexQueueEntry
+
+logger = logging.getLogger("tentron")
+
+# seconds the worker waits before draining the queue, saves made meanwhile
+# are indexed by the same run
+SEARCH_INDEX_QUEUE_DELAY = getattr(settings, "SEARCH_INDEX_QUEUE_DELAY", 10)
+SEARCH_INDEX_BATCH_SIZE = getattr(settings, "SEARCH_INDEX_BATCH_SIZE", 500)
+SEARCH_INDEX_SCHEDULED_KEY = "searchindex:scheduled"
+
+
+def get_content_type_id(instance):
+    # pages are indexed as their specific class, whichever class was saved
+    if isinstance(instance, Page):
+        return instance.content_type_id
+    return ContentType.objects.get_for_model(instance).id
+
+
+def enqueue(instances):
+    """
+    Queue objects for indexing once the current transaction commits.
+    """
+    now = timezone.now()
+    entries = [
+        IndexQueueEntry(
+            content_type_id=get_content_type_id(instance),
+            object_id=str(instance.pk),
+            queued_at=now,
+        )
+        for instance in instances
+    ]
+    if not entries:
+        return
+    # resetting indexed_at also catches saves racing with a running worker
+    IndexQueueEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=["content_type", "object_id"],
+        update_fields=["queued_at", "indexed_at"],
+    )
+    transaction.on_commit(schedule_index_queue)
+
+
+def schedule_index_queue():
+    from .tasks import process_index_queue
+
+    # a single delayed task drains everything queued until it runs
+    if not cache.add(SEARCH_INDEX_SCHEDULED_KEY, 1, SEARCH_INDEX_QUEUE_DELAY):
+        return
+    try:
+        process_index_queue.apply_async(countdown=SEARCH_INDEX_QUEUE_DELAY)
+    except Exception:
+        cache.delete(SEARCH_INDEX_SCHEDULED_KEY)
+        # the entries stay queued, the next run or update_index --since picks them up
+        logger.exception("Could not schedule the search index queue")
+
+
+def index_queue_entries(entries, backends=None):
+    """
+    Refresh the index for a batch of queue entries, objects that still exist
+    are upserted in bulk per model and the others are removed.
+    Return the number of objects indexed.
+    """
+    if backends is None:
+        backends = list(get_search_backends())
+
+    ids_by_model = defaultdict(set)
+    for entry in entries:
+        model = ContentType.objects.get_for_id(entry.content_type_id).model_class()
+        if model is not None and class_is_indexed(model):
+            ids_by_model[model].add(entry.object_id)
+
+    count = 0
+    for model, ids in ids_by_model.items():
+        objects = list(model.get_indexed_objects().filter(pk__in=ids))
+        removed_ids = ids - {str(obj.pk) for obj in objects}
+        for backend in backends:
+            if objects:
+                backend.add_bulk(model, objects)
+            for pk in removed_ids:
+                backend.delete(model(pk=pk))
+        count += len(objects)
+    return count
+
+
+def index_pending(batch_size=SEARCH_INDEX_BATCH_SIZE, backends=None):
+    """
+    Drain the queue, return the number of objects indexed.
+    Entries are locked while they are processed, so concurrent workers skip
+    them, and a save during the run queues its object again.
+    """
+    count = 0
+    while True:
+        with transaction.atomic():
+            entries = list(
+                IndexQueueEntry.objects.filter(indexed_at__isnull=True)
+                .select_for_update(skip_locked=True)
+                .order_by("queued_at")[:batch_size]
+            )
+            if not entries:
+                return count
+            count += index_queue_entries(entries, backends)
+            IndexQueueEntry.objects.filter(
+                pk__in=[entry.pk for entry in entries]
+            ).update(indexed_at=timezone.now())
@@ -0,0 +1,16 @@
+# search/signals.py
+from django.db.models.signals import post_delete, post_save
+from wagtail.search.index import get_indexed_models
+
+from .queue import enqueue
+
+
+def queue_for_indexing(sender, instance, **kwargs):
+    # the backends have AUTO_UPDATE disabled, the admin request only queues
+    # the object id and the celery worker updates the index
+    enqueue([instance])
+
+
+for model in get_indexed_models():
+    post_save.connect(queue_for_indexing, sender=model)
+    post_delete.connect(queue_for_indexing, sender=model)
@@ -0,0 +1,122 @@
+# search/suggestions.py
+import logging
+from bisect import bisect_left
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import translation
+from taggit.models import Tag
+from wagtail.models import Page
+
+from organization.page_cache import get_page_cache_version
+
+logger = logging.getLogger("tentron")
+
+SEARCH_SUGGESTIONS_LIMIT = getattr(settings, "SEARCH_SUGGESTIONS_LIMIT", 8)
+SEARCH_SUGGESTIONS_MAX_SITES = getattr(settings, "SEARCH_SUGGESTIONS_MAX_SITES", 64)
+
+_local_indexes = {}
+
+
+def normalise_prefix(text):
+    return " ".join(text.casefold().split())
+
+
+class PrefixIndex:
+    """
+    Sorted (key, value) pairs, the values whose key starts with a prefix are
+    found with a binary search. Every word of a text is a key, so "rocket"
+    completes "Red rocket chair" too.
+    """
+
+    __slots__ = ("keys", "values")
+
+    def __init__(self, items):
+        pairs = sorted(
+            (key, value)
+            for text, value in items
+            for key in self.get_keys(normalise_prefix(text))
+        )
+        self.keys = [key for key, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    @staticmethod
+    def get_keys(text):
+        words = text.split(" ")
+        return {" ".join(words[start:]) for start in range(len(words)) if words[start]}
+
+    def search(self, prefix, limit):
+        results = []
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and len(results) < limit:
+            if not self.keys[position].startswith(prefix):
+                break
+            value = self.values[position]
+            if value not in results:
+                results.append(value)
+            position += 1
+        return results
+
+
+def get_page_url(url_path, root_url_path):
+    return reverse("wagtail_serve", args=(url_path[len(root_url_path) :],))
+
+
+def build_suggestion_indexes(site):
+    from core.models import BlogTag
+
+    root_url_path = site.root_page.url_path
+    pages = (
+        Page.objects.live()
+        .descendant_of(site.root_page, inclusive=True)
+        .values_list("title", "url_path")
+    )
+    page_index = PrefixIndex(
+        (title, (title, get_page_url(url_path, root_url_path)))
+        for title, url_path in pages
+    )
+
+    tag_names = set(BlogTag.objects.filter(site=site).values_list("name", flat=True))
+    tag_names.update(
+        Tag.objects.filter(core_producttag_items__content_object__site=site)
+        .values_list("name", flat=True)
+        .distinct()
+    )
+    tag_index = PrefixIndex((name, name) for name in tag_names)
+    return page_index, tag_index
+
+
+def get_suggestion_indexes(site):
+    """
+    Return the (page, tag) prefix indexes of a site. They are built once per
+    process and rebuilt after the site publishes, which bumps its page cache
+    version.
+    """
+    key = (site.id, get_page_cache_version(site.id), translation.get_language())
+    indexes = _local_indexes.get(key)
+    if indexes is None:
+        logger.debug("Building search suggestions for site %s", site.id)
+        indexes = build_suggestion_indexes(site)
+        # drop the outdated versions of this site, and everything when full
+        for stale_key in [
+            k for k in _local_indexes if k[0] == site.id and k[1] != key[1]
+        ]:
+            del _local_indexes[stale_key]
+        if len(_local_indexes) >= SEARCH_SUGGESTIONS_MAX_SITES:
+            _local_indexes.clear()
+        _local_indexes[key] = indexes
+    return indexes
+
+
+def get_suggestions(site, query_string, limit=SEARCH_SUGGESTIONS_LIMIT):
+    prefix = normalise_prefix(query_string)
+    if not prefix:
+        return {"pages": [], "tags": []}
+    page_index, tag_index = get_suggestion_indexes(site)
+    return {
+        "pages": [
+            {"title": title, "url": url}
+            for title, url in page_index.search(prefix, limit)
+        ],
+        "tags": tag_index.search(prefix, limit),
+    }
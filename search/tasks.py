@@ -0,0 +1,14 @@
+import logging
+
+from celery import shared_task
+
+from .queue import index_pending
+
+logger = logging.getLogger("celery")
+
+
+@shared_task
+def process_index_queue():
+    count = index_pending()
+    logger.info("Indexed %d queued objects", count)
+    return count
@@ -0,0 +1,203 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from wagtail.models import Page, Site
+from wagtail.rich_text import RichText
+from wagtail.search.backends import get_search_backend
+from wagtail.search.models import Query, QueryDailyHits
+
+from core.models import AboutPage, BlogTag, FaqItem
+
+from . import hits, suggestions, tasks
+from .models import IndexCheckpoint, IndexQueueEntry
+from .queue import index_pending
+from .views import search_site, suggest
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+        root = Page.objects.get(depth=1)
+        self.acme_root = root.add_child(instance=Page(title="Acme", slug="acme"))
+        self.other_root = root.add_child(instance=Page(title="Other", slug="other"))
+        self.site = Site.objects.create(
+            hostname="acme.localhost", port=80, root_page=self.acme_root
+        )
+        other_site = Site.objects.create(
+            hostname="other.localhost", port=80, root_page=self.other_root
+        )
+        self.acme_root.add_child(
+            instance=AboutPage(
+                title="About",
+                slug="about",
+                site=self.site,
+                content=[("rich_text", RichText("<p>We build rockets</p>"))],
+            )
+        )
+        self.other_root.add_child(
+            instance=AboutPage(title="Other rockets", slug="about", site=other_site)
+        )
+        index_pending()
+
+    def test_search_is_scoped_to_the_site(self):
+        results = search_site(self.site, "rockets", 1)
+        self.assertEqual([page.title for page in results], ["About"])
+        self.assertEqual(results.paginator.count, 1)
+        self.assertFalse(results.has_next())
+
+    def test_results_are_cached(self):
+        search_site(self.site, "rockets", 1)
+        with self.assertNumQueries(0):
+            results = search_site(self.site, "rockets", 1)
+        self.assertEqual(len(results), 1)
+
+    def test_hits_are_flushed_in_batches(self):
+        with mock.patch.object(hits, "SEARCH_HITS_FLUSH_SIZE", 3):
+            hits.record_hit("Rockets")
+            hits.record_hit("rockets ")
+            self.assertFalse(Query.objects.filter(query_string="rockets").exists())
+
+            hits.record_hit("rockets")
+        self.assertEqual(Query.get("rockets").hits, 3)
+
+    def test_flush_writes_in_a_few_queries(self):
+        hits._pending_hits.clear()
+        QueryDailyHits.objects.create(
+            query=Query.get("rockets"), date=timezone.now().date(), hits=1
+        )
+        for query_string in ("rockets", "rockets", "anvils", "traps"):
+            hits._pending_hits[query_string] += 1
+        # the rows are inserted in bulk and counted by one update
+        with self.assertNumQueries(4):
+            hits.flush_hits()
+        self.assertEqual(
+            [
+                Query.get(query_string).hits
+                for query_string in ("rockets", "anvils", "traps")
+            ],
+            [3, 1, 1],
+        )
+
+    def test_faq_items_are_filtered_by_site(self):
+        FaqItem.objects.create(
+            question="Do you ship rockets?", answer="Yes", site=self.site
+        )
+        FaqItem.objects.create(question="Rockets?", answer="No")
+        index_pending()
+
+        results = get_search_backend().search(
+            "rockets", FaqItem.objects.filter(site=self.site, published=True)
+        )
+        self.assertEqual([item.question for item in results], ["Do you ship rockets?"])
+
+    def test_benchmark_command(self):
+        stdout = StringIO()
+        call_command(
+            "search_benchmark", rows=[20, 40], tenants=2, queries=3, stdout=stdout
+        )
+        # the configured database backend is the PostgreSQL one
+        self.assertIn("PostgresSearchBackend", stdout.getvalue())
+        self.assertIn("configured", stdout.getvalue())
+        self.assertIn("fallback", stdout.getvalue())
+        self.assertFalse(
+            Site.objects.filter(hostname__endswith="search-benchmark.invalid").exists()
+        )
+
+
+class IndexQueueTestCase(TestCase):
+    def setUp(self):
+        for alias_cache in caches.all():
+            alias_cache.clear()
+
+    def search(self, query):
+        return [
+            item.question
+            for item in get_search_backend().search(query, FaqItem.objects.all())
+        ]
+
+    def test_saves_are_queued_and_coalesced(self):
+        with mock.patch.object(tasks.process_index_queue, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                faq_item = FaqItem.objects.create(question="Rockets?", answer="Yes")
+                faq_item.question = "Do you sell rockets?"
+                faq_item.save()
+        apply_async.assert_called_once()
+
+        self.assertEqual(IndexQueueEntry.objects.count(), 1)
+        self.assertEqual(self.search("rockets"), [])
+
+        self.assertEqual(index_pending(), 1)
+        self.assertEqual(self.search("rockets"), ["Do you sell rockets?"])
+        self.assertEqual(index_pending(), 0)
+
+    def test_deleted_objects_are_removed(self):
+        faq_item = FaqItem.objects.create(question="Rockets?", answer="Yes")
+        index_pending()
+
+        entries = faq_item.index_entries.all()
+        self.assertTrue(entries.exists())
+
+        faq_item.hard_delete()
+        index_pending()
+        self.assertFalse(entries.exists())
+
+    def test_update_index_since_checkpoint(self):
+        IndexCheckpoint.objects.create(
+            backend_name="default",
+            indexed_until=timezone.now() - timezone.timedelta(hours=1),
+        )
+        FaqItem.objects.create(question="Rockets?", answer="Yes")
+
+        call_command("update_index", "--since", stdout=StringIO())
+
+        self.assertEqual(self.search("rockets"), ["Rockets?"])
+        self.assertGreater(
+            IndexCheckpoint.objects.get(backend_name="default").indexed_until,
+            timezone.now() - timezone.timedelta(minutes=1),
+        )
+
+
+class SuggestionsTestCase(SearchTestCase):
+    def setUp(self):
+        super().setUp()
+        suggestions._local_indexes.clear()
+        BlogTag.objects.create(name="Rocketry", slug="rocketry", site=self.site)
+
+    def test_suggestions_are_scoped_to_the_site(self):
+        self.assertEqual(
+            suggestions.get_suggestions(self.site, " AB"),
+            {"pages": [{"title": "About", "url": "/about/"}], "tags": []},
+        )
+        self.assertEqual(
+            suggestions.get_suggestions(self.site, "rock"),
+            {"pages": [], "tags": ["Rocketry"]},
+        )
+
+    def test_index_is_built_once_per_publish(self):
+        suggestions.get_suggestions(self.site, "ab")
+        with self.assertNumQueries(0):
+            suggestions.get_suggestions(self.site, "ab")
+
+        self.acme_root.add_child(
+            instance=Page(title="Red rockets", slug="red-rockets")
+        ).save_revision().publish()
+        self.assertEqual(
+            suggestions.get_suggestions(self.site, "rock")["pages"],
+            [{"title": "Red rockets", "url": "/red-rockets/"}],
+        )
+
+    def test_suggest_view(self):
+        request = RequestFactory().get(
+            "/search/suggest/", {"query": "ab"}, HTTP_HOST="acme.localhost"
+        )
+        response = suggest(request)
+        self.assertEqual(
+            json.loads(response.content)["pages"],
+            [{"title": "About", "url": "/about/"}],
+        )
@@ -1,40 +1,85 @@
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+import hashlib
+
+from django.conf import settings
+from django.core.paginator import EmptyPage
+from django.core.paginator import Page as PaginatorPage
+from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.template.response import TemplateResponse
-from wagtail.models import Page, Site
-from wagtail.search.models import Query
+from wagtail.models import Page
+from wagtail.search.utils import normalise_query_string
 
-from organization.models import ExtendedSite, SiteSettings
+from organization.page_cache import get_page_cache_version
+from organization.tenant import get_tenant
+from tentron.caches import fragment_cache
 
+from .hits import record_hit
+from .suggestions import get_suggestions
 
-def search(request):
-    current_site = Site.find_for_request(request)
+SEARCH_RESULTS_PER_PAGE = 10
+SEARCH_CACHE_TIMEOUT = getattr(settings, "SEARCH_CACHE_TIMEOUT", 60 * 10)
+
+
+def get_search_cache_key(site, query_string, page_number):
+    # the page cache version changes whenever the site publishes, so results
+    # go stale at the same time as the cached pages
+    return "search:{}:{}:{}:{}".format(
+        site.id,
+        get_page_cache_version(site.id),
+        hashlib.md5(query_string.encode()).hexdigest(),
+        page_number,
+    )
+
+
+def search_site(site, query_string, page_number):
+    """
+    Search the live pages under the site root, return a paginator page.
+    Only the pages of the requested result page and the total count are
+    cached, per (site, normalized query, page number).
+    """
+    cache_key = get_search_cache_key(site, query_string, page_number)
+    cached = fragment_cache.get(cache_key)
+    if cached is None:
+        search_results = (
+            Page.objects.live()
+            .descendant_of(site.root_page, inclusive=True)
+            .search(query_string)
+        )
+        paginator = Paginator(search_results, SEARCH_RESULTS_PER_PAGE)
+        try:
+            results_page = paginator.page(page_number)
+        except EmptyPage:
+            results_page = paginator.page(paginator.num_pages)
+        cached = (paginator.count, results_page.number, list(results_page))
+        fragment_cache.set(cache_key, cached, SEARCH_CACHE_TIMEOUT)
+
+    count, number, results = cached
+    # only the count is needed to paginate, the results of the page are cached
+    paginator = Paginator(range(count), SEARCH_RESULTS_PER_PAGE)
+    return PaginatorPage(results, number, paginator)
 
-    site_settings = SiteSettings.for_site(current_site)
-    template_folder = site_settings.site_settings_theme.first().template_folder
+
+def search(request):
+    tenant = get_tenant(request)
+    template_folder = tenant.template_folder
 
     template_name = f"{template_folder}/search.html"
 
     search_query = request.GET.get("query", None)
-    page = request.GET.get("page", 1)
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
 
     # Search
-    if search_query:
-        search_results = Page.objects.live().search(search_query)
-        query = Query.get(search_query)
+    query_string = normalise_query_string(search_query or "")
+    if query_string and tenant.site is not None:
+        search_results = search_site(tenant.site, query_string, page)
 
-        # Record hit
-        query.add_hit()
+        # Record hit, written in batches
+        record_hit(query_string)
     else:
-        search_results = Page.objects.none()
-
-    # Pagination
-    paginator = Paginator(search_results, 10)
-    try:
-        search_results = paginator.page(page)
-    except PageNotAnInteger:
-        search_results = paginator.page(1)
-    except EmptyPage:
-        search_results = paginator.page(paginator.num_pages)
+        search_results = Paginator(Page.objects.none(), SEARCH_RESULTS_PER_PAGE).page(1)
 
     return TemplateResponse(
         request,
@@ -44,3 +89,17 @@ def search(request):
             "search_results": search_results,
         },
     )
+
+
+def suggest(request):
+    """
+    Return title and tag completions of the current site for a prefix, as
+    {"pages": [{"title", "url"}], "tags": [name]}.
+    """
+    tenant = get_tenant(request)
+    query_string = request.GET.get("query", "")
+    if tenant.site is None:
+        suggestions = {"pages": [], "tags": []}
+    else:
+        suggestions = get_suggestions(tenant.site, query_string)
+    return JsonResponse(suggestions)
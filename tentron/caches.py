@@ -0,0 +1,8 @@
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+# Named cache aliases, see CACHES in tentron/settings/base.py
+tenant_cache = ConnectionProxy(caches, "tenant")
+settings_cache = ConnectionProxy(caches, "settings")
+fragment_cache = ConnectionProxy(caches, "fragments")
+rendition_cache = ConnectionProxy(caches, "renditions")
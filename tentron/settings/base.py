@@ -47,6 +47,8 @@ INSTALLED_APPS = [
     "wagtail.documents",
     "tentron.apps.CustomImagesAppConfig",
     # "wagtail.images",
+    # before wagtail.search, it overrides the update_index command
+    "search",
     "wagtail.search",
     "dashboard",
     "wagtail.admin",
@@ -61,7 +63,6 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "wagtail.contrib.modeladmin",
     "home",
-    "search",
     "core",
     "organization",
     "organization_menu",
@@ -93,6 +94,7 @@ MIDDLEWARE = [
     "django.middleware.locale.LocaleMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
     "organization.middleware.ExtendedSiteMiddleware",
+    "organization.middleware.PageCacheMiddleware",
 ]
 
 ROOT_URLCONF = "tentron.urls"
@@ -136,6 +138,43 @@ DATABASES = {
         "PORT": env["PG_PORT"],
     }
 }
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# CACHE_BACKEND is one of locmem, file, redis or fakeredis (tests without a redis server)
+CACHE_BACKEND = env.get("CACHE_BACKEND", "locmem")
+REDIS_URL = env.get("REDIS_URL", "redis://redis:6379/0")
+CACHE_FILE_ROOT = env.get("CACHE_FILE_ROOT", os.path.join(BASE_DIR, "cache"))
+
+# default, tenant resolution, site settings and themes, rendered pages, image renditions
+CACHE_ALIASES = ["default", "tenant", "settings", "fragments", "renditions"]
+
+
+def get_cache_config(alias):
+    if CACHE_BACKEND in ("redis", "fakeredis"):
+        config = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "tentron:" + alias,
+        }
+        if CACHE_BACKEND == "fakeredis":
+            import fakeredis
+
+            config["OPTIONS"] = {"connection_class": fakeredis.FakeConnection}
+        return config
+    if CACHE_BACKEND == "file":
+        return {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(CACHE_FILE_ROOT, alias),
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": alias,
+    }
+
+
+CACHES = {alias: get_cache_config(alias) for alias in CACHE_ALIASES}
+CACHES["renditions"]["TIMEOUT"] = 60 * 60 * 24 * 7
+
 DBBACKUP_STORAGE = "django.core.files.storage.FileSystemStorage"
 DBBACKUP_STORAGE_OPTIONS = {"location": "/home/tentron/DBbackup/"}
 
@@ -194,7 +233,8 @@ STATICFILES_DIRS = [
 # ManifestStaticFilesStorage is recommended in production, to prevent outdated
 # JavaScript / CSS assets being served from cache (e.g. after a Wagtail upgrade).
 # See https://docs.djangoproject.com/en/4.1/ref/contrib/staticfiles/#manifeststaticfilesstorage
-STATICFILES_STORAGE = "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+# tentron.storage adds a gzip copy of the text assets for the gzip_static of nginx
+STATICFILES_STORAGE = "tentron.storage.CompressedManifestStaticFilesStorage"
 
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
 STATIC_URL = "/static/"
@@ -208,12 +248,29 @@ WAGTAIL_SITE_NAME = "Tentron"
 
 # Search
 # https://docs.wagtail.org/en/stable/topics/search/backends.html
+# The database backend resolves to its PostgreSQL implementation on a
+# PostgreSQL database, which it always did here: it keeps a tsvector per
+# indexed object in wagtailsearch_indexentry, with GIN indexes on the body,
+# title and autocomplete columns. Run ./manage.py update_index after changing
+# the config.
 WAGTAILSEARCH_BACKENDS = {
     "default": {
         "BACKEND": "wagtail.search.backends.database",
+        # text search configuration, e.g. "english", defaults to the database's
+        "SEARCH_CONFIG": env.get("SEARCH_CONFIG"),
+        # saves are queued and indexed by celery, see search/queue.py
+        "AUTO_UPDATE": False,
     }
 }
 
+# Full page cache for anonymous visitors, see organization/page_cache.py
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# nginx keeps the anonymous responses this many seconds in front of the page
+# cache, purged on publish, see organization/nginx.py. 0 turns it off.
+NGINX_MICROCACHE_TTL = 5
+
 # Base URL to use when referring to full URLs within the Wagtail admin backend -
 # e.g. in notification emails. Don't include '/admin' or a trailing slash
 WAGTAILADMIN_BASE_URL = "http://example.com"
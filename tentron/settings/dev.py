@@ -15,6 +15,8 @@ ALLOWED_HOSTS = ["*"]
 
 MIDDLEWARE = MIDDLEWARE + ["debug_toolbar.middleware.DebugToolbarMiddleware"]
 
+PAGE_CACHE_ENABLED = False
+
 INSTALLED_APPS = INSTALLED_APPS + [
     "debug_toolbar",
     "django_extensions",
@@ -0,0 +1,50 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that writes a gzip copy next to the text
+    assets, nginx sends it with gzip_static instead of compressing the file
+    on every request.
+    """
+
+    compressed_extensions = (
+        ".css",
+        ".js",
+        ".mjs",
+        ".map",
+        ".json",
+        ".svg",
+        ".txt",
+        ".xml",
+        ".html",
+        ".eot",
+        ".otf",
+        ".ttf",
+    )
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run, **options
+        ):
+            if not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names - {None}):
+            if name.endswith(self.compressed_extensions):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, "rb") as f:
+            content = f.read()
+        # mtime=0, the same file gives the same .gz on every collectstatic
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) < len(content):
+            with open(path + ".gz", "wb") as f:
+                f.write(compressed)
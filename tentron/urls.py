@@ -108,6 +108,7 @@ urlpatterns = [
 urlpatterns += i18n_patterns(
     path("tadmin/", include(wagtailadmin_urls)),
     path("search/", search_views.search, name="search"),
+    path("search/suggest/", search_views.suggest, name="search_suggest"),
     path("sitemap.xml", sitemap),
     path("", include(wagtail_urls)),
     prefix_default_language=False,